@@ -0,0 +1,20 @@
+-- Tabela de chamadas à IA (tokens, latência e custo estimado por prova e etapa)
+CREATE TABLE IF NOT EXISTS llm_chamadas (
+    id BIGSERIAL PRIMARY KEY,
+    prova_id BIGINT REFERENCES provas(id) ON DELETE CASCADE,
+    etapa VARCHAR(50),
+    provedor VARCHAR(20),
+    modelo VARCHAR(100),
+    tokens_prompt INTEGER,
+    tokens_resposta INTEGER,
+    tokens_cache INTEGER,
+    latencia_ms INTEGER NOT NULL DEFAULT 0,
+    tentativas INTEGER NOT NULL DEFAULT 1,
+    failover BOOLEAN NOT NULL DEFAULT FALSE,
+    sucesso BOOLEAN NOT NULL DEFAULT TRUE,
+    erro TEXT,
+    custo_usd DOUBLE PRECISION,
+    criado_em TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_llm_chamadas_prova_id ON llm_chamadas(prova_id);
@@ -0,0 +1,3 @@
+-- Memória por etapa do último processamento de cada prova (RSS, pico e modo de pouca memória)
+ALTER TABLE provas
+ADD COLUMN IF NOT EXISTS memoria JSONB;
@@ -0,0 +1,34 @@
+-- Índice persistente de perceptual hash (pHash) para deduplicação entre provas
+-- Requer PostgreSQL 14+ (função bit_count)
+
+-- pHash como BIGINT e bandas de 16 bits (multi-index hashing)
+ALTER TABLE imagens
+ADD COLUMN IF NOT EXISTS perceptual_hash_bits BIGINT,
+ADD COLUMN IF NOT EXISTS phash_banda_0 INTEGER,
+ADD COLUMN IF NOT EXISTS phash_banda_1 INTEGER,
+ADD COLUMN IF NOT EXISTS phash_banda_2 INTEGER,
+ADD COLUMN IF NOT EXISTS phash_banda_3 INTEGER;
+
+-- Preencher a partir do hash hexadecimal já existente (16 caracteres = 64 bits)
+UPDATE imagens
+SET perceptual_hash_bits = ('x' || perceptual_hash)::bit(64)::bigint
+WHERE perceptual_hash ~ '^[0-9a-f]{16}$'
+AND perceptual_hash_bits IS NULL;
+
+UPDATE imagens
+SET phash_banda_0 = ((perceptual_hash_bits >> 48) & 65535)::integer,
+    phash_banda_1 = ((perceptual_hash_bits >> 32) & 65535)::integer,
+    phash_banda_2 = ((perceptual_hash_bits >> 16) & 65535)::integer,
+    phash_banda_3 = (perceptual_hash_bits & 65535)::integer
+WHERE perceptual_hash_bits IS NOT NULL
+AND phash_banda_0 IS NULL;
+
+-- Índices das bandas (candidatos para a busca por distância de Hamming)
+CREATE INDEX IF NOT EXISTS ix_imagens_phash_banda_0 ON imagens(phash_banda_0);
+CREATE INDEX IF NOT EXISTS ix_imagens_phash_banda_1 ON imagens(phash_banda_1);
+CREATE INDEX IF NOT EXISTS ix_imagens_phash_banda_2 ON imagens(phash_banda_2);
+CREATE INDEX IF NOT EXISTS ix_imagens_phash_banda_3 ON imagens(phash_banda_3);
+
+-- Verificar
+SELECT COUNT(*) AS total, COUNT(perceptual_hash_bits) AS com_phash_bits
+FROM imagens;
@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Optional, List
 
 
 class Settings(BaseSettings):
@@ -25,6 +25,62 @@ class Settings(BaseSettings):
     images_dir: str = "images"
     max_file_size: int = 10485760  # 10MB
     base_url: str = "http://localhost:8000"  # URL base para servir imagens
+    cross_prova_dedup: bool = True  # Reutilizar imagens já salvas em provas anteriores
+    dedup_cache_size: int = 2048  # Máximo de imagens recentes mantidas em memória por worker (LRU)
+    thumbnail_widths: List[int] = [240, 480]  # Larguras (px) das miniaturas geradas na etapa 8
+    image_cache_max_age: int = 31536000  # Cache-Control max-age (s) para imagens com hash no nome
+    
+    # Divisão do texto para a IA
+    llm_chunk_max_tokens: int = 3000  # Orçamento de tokens do texto enviado em cada chamada
+    llm_chunk_overlap_tokens: int = 200  # Sobreposição quando o corte divide uma questão
+    llm_chars_per_token: float = 4.0  # Estimativa de caracteres por token
+    llm_max_reasks: int = 1  # Novos pedidos apenas para itens inválidos/cortados da resposta da IA
+    llm_validation_max_tokens: int = 6000  # Orçamento por chamada de validação (questões + páginas de origem)
+    
+    # Chamadas à IA (OpenAI/Gemini)
+    llm_timeout: float = 60.0  # Prazo (s) de cada tentativa
+    llm_connect_timeout: float = 10.0  # Prazo (s) para abrir a conexão
+    llm_call_deadline: float = 180.0  # Prazo total (s) de uma chamada, incluindo novas tentativas e failover
+    llm_max_retries: int = 3  # Novas tentativas em erros transitórios (429, 5xx, timeout)
+    llm_backoff_base: float = 1.0  # Espera base (s) do backoff exponencial
+    llm_backoff_max: float = 20.0  # Espera máxima (s) entre tentativas
+    llm_breaker_failures: int = 5  # Falhas seguidas que abrem o circuito do provedor
+    llm_breaker_reset: float = 60.0  # Tempo (s) com o circuito aberto antes de testar de novo
+    llm_max_connections: int = 10  # Conexões HTTP mantidas no pool por processo
+    openai_base_url: Optional[str] = None  # Endpoint alternativo da OpenAI (ex.: benchmarks/fake_llm_server.py)
+    gemini_api_endpoint: Optional[str] = None  # Endpoint alternativo do Gemini (usa transporte REST)
+    
+    # Métricas (Prometheus)
+    metrics_worker_port: int = 9100  # Porta do exportador de métricas do worker Celery (0 desativa)
+    
+    # Memória das tarefas e reciclagem dos workers
+    task_memory_budget_mb: int = 1024  # RSS acima disso ativa o modo de pouca memória (0 desativa)
+    low_memory_mode: bool = False  # Sempre usar o modo de pouca memória (imagens em disco)
+    memory_tracemalloc: bool = False  # Pico de alocações Python por etapa (deixa a tarefa mais lenta)
+    worker_max_tasks_per_child: int = 20  # Tarefas por processo filho do Celery antes de reciclá-lo
+    worker_max_memory_per_child_mb: int = 1536  # RSS (MB) do filho que provoca reciclagem após a tarefa
+    
+    # Perfil de CPU das tarefas
+    profile_tasks: bool = False  # Perfilar todas as tarefas (também pode ser pedido por upload)
+    profiles_dir: str = "profiles"  # Artefatos por prova e tarefa (.prof e resumo .json)
+    profile_top_functions: int = 40  # Funções listadas no resumo, por tempo acumulado
+    admin_token: Optional[str] = None  # Exigido no cabeçalho X-Admin-Token; sem ele as rotas /admin ficam desativadas (404)
+    
+    # Exportações (PDF/Word): cache e pool de processos
+    export_cache_enabled: bool = True
+    export_cache_dir: str = "exports"  # Um diretório por prova; versões antigas são removidas ao gravar
+    export_workers: int = 2  # Processos que geram as exportações fora do event loop (0 = threadpool)
+    export_max_pending: int = 8  # Exportações simultâneas (em execução ou aguardando o pool)
+    export_queue_timeout: float = 30.0  # Espera máxima (s) por uma vaga antes de responder 503
+    export_lote_max_provas: int = 500  # Provas por exportação em lote (ZIP)
+    export_questoes_max: int = 500  # Questões por exportação de questões selecionadas
+    export_zip_compresslevel: int = 6  # Nível do DEFLATE nas entradas do ZIP (1 = mais rápido)
+    export_images_dir: str = "exports/imagens"  # Derivadas das imagens para impressão (por hash e largura)
+    export_image_dpi: int = 150  # Resolução das imagens nas exportações (define a largura das derivadas)
+    
+    # Planejamento das estratégias de extração
+    adaptive_strategies: bool = True  # Chamar a IA apenas para páginas/questões com problemas no regex
+    planner_min_confidence: float = 0.9  # Abaixo disso, também roda a IA no texto completo
     
     class Config:
         env_file = ".env"
@@ -1,8 +1,10 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 from app.routes import router
 from app.services.database import init_db
+from app.static_files import CachedStaticFiles
+from app.services.metrics import render_metrics
+from app.services.export_pool import export_pool
 import os
 
 app = FastAPI(title="Sistema de Análise de PDFs", version="1.0.0")
@@ -22,13 +24,18 @@ app.include_router(router)
 os.makedirs("uploads", exist_ok=True)
 os.makedirs("images", exist_ok=True)
 
-# Servir imagens estaticamente
-app.mount("/images", StaticFiles(directory="images"), name="images")
+# Servir imagens estaticamente (com Cache-Control, ETag e GET condicional)
+app.mount("/images", CachedStaticFiles(directory="images"), name="images")
 
 # Inicializar banco de dados (cria tabelas se não existirem)
 init_db()
 
 
+@app.on_event("shutdown")
+def shutdown_export_pool():
+    export_pool.shutdown()
+
+
 @app.get("/")
 async def root():
     return {"message": "Sistema de Análise de PDFs API"}
@@ -38,3 +45,10 @@ async def root():
 async def health():
     return {"status": "ok"}
 
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Métricas no formato Prometheus"""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
@@ -0,0 +1,39 @@
+from pydantic import BaseModel, Field
+from typing import Optional
+
+
+class QuestaoLLM(BaseModel):
+    """Questão como retornada pela IA (extração ou validação)"""
+    numero: int = Field(ge=1)
+    texto: str = Field(min_length=1)
+    posicao_inicio: Optional[int] = None
+    posicao_fim: Optional[int] = None
+
+
+# Schema para saída estruturada (response_format json_schema, modo strict):
+# todos os campos obrigatórios e sem campos extras; posições podem ser null
+QUESTOES_JSON_SCHEMA = {
+    "name": "questoes",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "questoes": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "numero": {"type": "integer"},
+                        "texto": {"type": "string"},
+                        "posicao_inicio": {"type": ["integer", "null"]},
+                        "posicao_fim": {"type": ["integer", "null"]}
+                    },
+                    "required": ["numero", "texto", "posicao_inicio", "posicao_fim"],
+                    "additionalProperties": False
+                }
+            }
+        },
+        "required": ["questoes"],
+        "additionalProperties": False
+    }
+}
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Optional, List, Dict
 from datetime import datetime
 
 
@@ -15,6 +15,7 @@ class ProvaResponse(BaseModel):
     status: str
     etapa: Optional[str] = None
     progresso: Optional[int] = None
+    memoria: Optional[Dict] = None
     criado_em: datetime
 
     class Config:
@@ -55,6 +56,7 @@ class ImagemResponse(BaseModel):
     questao_id: Optional[int]
     caminho_arquivo: str
     posicao_pagina: int
+    miniaturas: Dict[str, str] = {}  # largura (px) -> URL da miniatura
 
     class Config:
         from_attributes = True
@@ -65,3 +67,39 @@ class ProvaCompletaResponse(BaseModel):
     questoes: List[QuestaoResponse]
     imagens: List[ImagemResponse]
 
+
+class ExportacaoLoteRequest(BaseModel):
+    prova_ids: Optional[List[int]] = None  # Sem IDs, exporta todas as provas que passam nos filtros
+    status: Optional[str] = "concluido"
+    nome_contem: Optional[str] = None  # Ex.: banca ou órgão no nome da prova
+    formato: str = "pdf"  # pdf, word ou ambos
+    apenas_formatadas: bool = False  # Só questões formatadas, com o texto formatado
+
+
+class ExportacaoQuestoesRequest(BaseModel):
+    questao_ids: List[int]  # Ordem das questões no documento
+    formato: str = "pdf"  # pdf ou word
+    titulo: str = "Questões selecionadas"
+
+
+class LLMUsoTotal(BaseModel):
+    chamadas: int
+    falhas: int
+    failovers: int
+    tokens_prompt: int
+    tokens_resposta: int
+    tokens_cache: int
+    latencia_ms: int
+    custo_usd: float  # Estimativa pela tabela de preços dos modelos
+
+
+class LLMUsoEtapa(LLMUsoTotal):
+    etapa: Optional[str] = None
+    provedor: Optional[str] = None
+    modelo: Optional[str] = None
+
+
+class LLMUsoResponse(BaseModel):
+    prova_id: int
+    total: LLMUsoTotal
+    por_etapa: List[LLMUsoEtapa]
@@ -1,6 +1,6 @@
 from fastapi import APIRouter
-from . import provas
+from . import provas, admin
 
 router = APIRouter()
 router.include_router(provas.router, prefix="/provas", tags=["provas"])
-
+router.include_router(admin.router, prefix="/admin", tags=["admin"])
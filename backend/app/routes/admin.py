@@ -0,0 +1,45 @@
+from fastapi import APIRouter, HTTPException, Depends, Header
+from fastapi.responses import FileResponse
+from typing import List, Dict, Optional
+import secrets
+from app.services.task_profiler import task_profiler
+from app.config import settings
+
+
+def verificar_admin(x_admin_token: Optional[str] = Header(None)):
+    """Exige o cabeçalho X-Admin-Token; sem ADMIN_TOKEN configurado as rotas ficam desativadas"""
+    if not settings.admin_token:
+        raise HTTPException(status_code=404, detail="Rotas de administração desativadas (defina ADMIN_TOKEN)")
+    if not (x_admin_token and secrets.compare_digest(x_admin_token, settings.admin_token)):
+        raise HTTPException(status_code=401, detail="Token de administrador inválido")
+
+
+router = APIRouter(dependencies=[Depends(verificar_admin)])
+
+
+@router.get("/perfis", response_model=List[Dict])
+async def listar_perfis(prova_id: Optional[int] = None):
+    """Lista os perfis de CPU gravados (opcionalmente de uma prova)"""
+    return task_profiler.list_profiles(prova_id)
+
+
+@router.get("/perfis/{prova_id}/{task_id}", response_model=Dict)
+async def get_perfil(prova_id: int, task_id: str):
+    """Resumo do perfil: tempo de parede e de CPU por etapa e funções mais custosas"""
+    resumo = task_profiler.get_summary(prova_id, task_id)
+    if not resumo:
+        raise HTTPException(status_code=404, detail="Perfil não encontrado")
+    return resumo
+
+
+@router.get("/perfis/{prova_id}/{task_id}/download")
+async def download_perfil(prova_id: int, task_id: str):
+    """Arquivo .prof (pstats) para análise com snakeviz ou pstats"""
+    path = task_profiler.get_profile_path(prova_id, task_id)
+    if not path:
+        raise HTTPException(status_code=404, detail="Perfil não encontrado")
+    return FileResponse(
+        path,
+        media_type="application/octet-stream",
+        filename=f"prova_{prova_id}_{task_id}.prof"
+    )
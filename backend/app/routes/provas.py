@@ -1,23 +1,29 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Header, Response
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import StreamingResponse
-from typing import List, Dict
+from fastapi.responses import StreamingResponse, FileResponse
+from starlette.concurrency import run_in_threadpool
+from typing import List, Dict, Optional
+from io import BytesIO
+from datetime import datetime
 import os
 import uuid
 import httpx
 from app.services.db_service import db_service
-from app.services.export_service import export_service
+from app.services.export_pool import export_pool, ExportPoolBusy
+from app.services.export_cache import export_cache
+from app.services.zip_stream import ZipStream
+from app.services.metrics import export_cache_total
 from app.tasks.process_pdf import process_pdf_task
 from app.tasks import celery_app
-from app.models.schemas import ProvaResponse, QuestaoResponse, ImagemResponse, ProvaCompletaResponse, QuestaoFormatadaResponse
+from app.models.schemas import ProvaResponse, QuestaoResponse, ImagemResponse, ProvaCompletaResponse, QuestaoFormatadaResponse, LLMUsoResponse, ExportacaoLoteRequest, ExportacaoQuestoesRequest
 from app.config import settings
 
 router = APIRouter()
 
 
 @router.post("/upload", response_model=Dict)
-async def upload_pdf(file: UploadFile = File(...)):
-    """Endpoint para upload de PDF"""
+async def upload_pdf(file: UploadFile = File(...), perfilar: bool = False):
+    """Endpoint para upload de PDF (perfilar=true grava o perfil de CPU do processamento)"""
     # Validar tipo de arquivo
     if not file.filename.endswith('.pdf'):
         raise HTTPException(status_code=400, detail="Apenas arquivos PDF são permitidos")
@@ -46,7 +52,7 @@ async def upload_pdf(file: UploadFile = File(...)):
         raise HTTPException(status_code=500, detail="Erro ao criar prova no banco")
     
     # Enfileirar tarefa de processamento
-    process_pdf_task.delay(prova["id"], file_path)
+    process_pdf_task.delay(prova["id"], file_path, perfilar)
     
     return {
         "message": "PDF enviado com sucesso",
@@ -93,6 +99,15 @@ async def get_imagens(prova_id: int):
     return imagens
 
 
+@router.get("/{prova_id}/uso-ia", response_model=LLMUsoResponse)
+async def get_uso_ia(prova_id: int):
+    """Tokens, latência e custo estimado das chamadas à IA de uma prova, por etapa e modelo"""
+    prova = db_service.get_prova(prova_id)
+    if not prova:
+        raise HTTPException(status_code=404, detail="Prova não encontrada")
+    return db_service.get_llm_resumo(prova_id)
+
+
 @router.get("/questoes/{questao_id}", response_model=QuestaoResponse)
 async def get_questao_individual(questao_id: int):
     """Busca uma questão individual por ID"""
@@ -143,109 +158,255 @@ async def formatar_questoes():
         )
 
 
-@router.get("/{prova_id}/exportar/pdf")
-async def exportar_prova_pdf(prova_id: int):
-    """Exporta todas as questões de uma prova em PDF"""
-    prova = db_service.get_prova(prova_id)
+MEDIA_TYPES = {
+    "pdf": "application/pdf",
+    "word": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+}
+
+
+async def _render(metodo: str, **kwargs) -> BytesIO:
+    """Gera a exportação no pool de processos (503 se a fila de exportações estiver cheia)"""
+    try:
+        return BytesIO(await export_pool.render(metodo, **kwargs))
+    except ExportPoolBusy:
+        raise HTTPException(
+            status_code=503,
+            detail="Muitas exportações em andamento, tente novamente",
+            headers={"Retry-After": "5"}
+        )
+
+
+async def _gerar_documento(prova: Dict, questoes: List[Dict], imagens: List[Dict], formato: str) -> BytesIO:
+    """Gera o PDF ou DOCX de uma prova com as questões e imagens dadas"""
+    return await _render(
+        "export_to_pdf" if formato == "pdf" else "export_to_word",
+        questoes=questoes,
+        imagens=imagens,
+        prova_nome=prova.get("nome", "Prova")
+    )
+
+
+async def _exportar_prova(prova_id: int, formato: str, if_none_match: Optional[str]) -> Response:
+    """
+    Exportação da prova com cache em disco e ETag
+    
+    O ETag é a impressão digital das questões: GET condicional com o mesmo
+    ETag recebe 304 sem gerar o documento, e exportações já geradas são
+    servidas do cache. Consultas ao banco rodam no threadpool e a geração no
+    pool de processos, sem travar o event loop.
+    """
+    prova = await run_in_threadpool(db_service.get_prova, prova_id)
     if not prova:
         raise HTTPException(status_code=404, detail="Prova não encontrada")
     
-    questoes = db_service.get_questoes_by_prova(prova_id)
-    imagens = db_service.get_imagens_by_prova(prova_id)
+    questoes = await run_in_threadpool(db_service.get_questoes_by_prova, prova_id)
     
     if not questoes:
         raise HTTPException(status_code=404, detail="Nenhuma questão encontrada para esta prova")
     
-    pdf_buffer = export_service.export_to_pdf(
-        questoes=questoes,
-        imagens=imagens,
-        prova_nome=prova.get("nome", "Prova")
-    )
+    imagens = await run_in_threadpool(db_service.get_imagens_by_prova, prova_id)
+    fingerprint = export_cache.fingerprint(prova, questoes, imagens)
+    headers = {"ETag": export_cache.etag(fingerprint), "Cache-Control": "private, no-cache"}
+    if export_cache.matches(if_none_match, fingerprint):
+        export_cache_total.labels(resultado="nao_modificado").inc()
+        return Response(status_code=304, headers=headers)
+    
+    extensao = "pdf" if formato == "pdf" else "docx"
+    filename = f"{prova.get('nome', 'prova').replace('.pdf', '')}_questoes.{extensao}"
+    
+    path = await run_in_threadpool(export_cache.get, prova_id, formato, fingerprint)
+    if path:
+        export_cache_total.labels(resultado="hit").inc()
+        return FileResponse(path, media_type=MEDIA_TYPES[formato], filename=filename, headers=headers)
+    
+    export_cache_total.labels(resultado="miss").inc()
+    buffer = await _gerar_documento(prova, questoes, imagens, formato)
+    
+    # Gravação em disco (escrita + limpeza das versões antigas) fora do event loop
+    path = await run_in_threadpool(export_cache.store, prova_id, formato, fingerprint, buffer)
+    if path:
+        return FileResponse(path, media_type=MEDIA_TYPES[formato], filename=filename, headers=headers)
+    
+    headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return StreamingResponse(buffer, media_type=MEDIA_TYPES[formato], headers=headers)
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+async def _documento_lote(prova: Dict, questoes: List[Dict], imagens: List[Dict], formato: str,
+                          usar_cache: bool) -> bytes:
+    """Documento de uma prova para o ZIP, do cache de exportações quando possível"""
+    if not usar_cache:
+        return (await _gerar_documento(prova, questoes, imagens, formato)).getvalue()
+    
+    fingerprint = export_cache.fingerprint(prova, questoes, imagens)
+    path = await run_in_threadpool(export_cache.get, prova["id"], formato, fingerprint)
+    if path:
+        export_cache_total.labels(resultado="hit").inc()
+        return await run_in_threadpool(_read_file, path)
+    
+    export_cache_total.labels(resultado="miss").inc()
+    buffer = await _gerar_documento(prova, questoes, imagens, formato)
+    await run_in_threadpool(export_cache.store, prova["id"], formato, fingerprint, buffer)
+    return buffer.getvalue()
+
+
+async def _zip_lote(provas: List[Dict], formatos: List[str], apenas_formatadas: bool):
+    """
+    Gera o ZIP prova a prova: cada documento é gerado (no pool de processos),
+    comprimido e enviado antes do próximo, então a memória não cresce com o
+    número de provas. Falhas em uma prova não interrompem o lote e são listadas
+    em ERROS.txt no fim do ZIP.
+    """
+    zip_stream = ZipStream()
+    erros = []
+    
+    for prova in provas:
+        try:
+            questoes = await run_in_threadpool(db_service.get_questoes_by_prova, prova["id"])
+            if apenas_formatadas:
+                questoes = [
+                    dict(q, texto=q["texto_formatado"])
+                    for q in questoes if q.get("formatado") and q.get("texto_formatado")
+                ]
+            if not questoes:
+                continue
+            imagens = await run_in_threadpool(db_service.get_imagens_by_prova, prova["id"])
+            
+            nome_base = f"{prova.get('nome', 'prova').replace('.pdf', '')}_{prova['id']}"
+            for formato in formatos:
+                # O cache guarda só a exportação completa (com o texto original das questões)
+                data = await _documento_lote(prova, questoes, imagens, formato, usar_cache=not apenas_formatadas)
+                extensao = "pdf" if formato == "pdf" else "docx"
+                yield await run_in_threadpool(zip_stream.add, f"{nome_base}.{extensao}", data)
+        except Exception as e:
+            print(f"⚠️ Erro ao exportar prova {prova['id']} no lote: {e}")
+            erros.append(f"Prova {prova['id']} ({prova.get('nome')}): {e}")
+    
+    if erros:
+        yield zip_stream.add("ERROS.txt", "\n".join(erros).encode("utf-8"))
+    yield zip_stream.close()
+
+
+@router.post("/exportar/lote")
+async def exportar_lote(request: ExportacaoLoteRequest):
+    """
+    Exporta várias provas em um único ZIP (transmitido enquanto é gerado)
     
-    filename = f"{prova.get('nome', 'prova').replace('.pdf', '')}_questoes.pdf"
+    Seleciona por lista de IDs e/ou filtros (status, trecho do nome); com
+    apenas_formatadas, inclui só as questões formatadas, com o texto formatado.
+    """
+    formatos = {"pdf": ["pdf"], "word": ["word"], "ambos": ["pdf", "word"]}.get(request.formato)
+    if not formatos:
+        raise HTTPException(status_code=400, detail="Formato inválido (use pdf, word ou ambos)")
     
+    provas = await run_in_threadpool(
+        db_service.get_provas_filtradas, request.prova_ids, request.status, request.nome_contem
+    )
+    if not provas:
+        raise HTTPException(status_code=404, detail="Nenhuma prova encontrada com esses filtros")
+    if len(provas) > settings.export_lote_max_provas:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Lote com {len(provas)} provas excede o limite de {settings.export_lote_max_provas}"
+        )
+    
+    filename = f"provas_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
     return StreamingResponse(
-        pdf_buffer,
-        media_type="application/pdf",
+        _zip_lote(provas, formatos, request.apenas_formatadas),
+        media_type="application/zip",
         headers={"Content-Disposition": f'attachment; filename="{filename}"'}
     )
 
 
+@router.get("/{prova_id}/exportar/pdf")
+async def exportar_prova_pdf(prova_id: int, if_none_match: Optional[str] = Header(None)):
+    """Exporta todas as questões de uma prova em PDF"""
+    return await _exportar_prova(prova_id, "pdf", if_none_match)
+
+
 @router.get("/{prova_id}/exportar/word")
-async def exportar_prova_word(prova_id: int):
+async def exportar_prova_word(prova_id: int, if_none_match: Optional[str] = Header(None)):
     """Exporta todas as questões de uma prova em Word (DOCX)"""
-    prova = db_service.get_prova(prova_id)
-    if not prova:
-        raise HTTPException(status_code=404, detail="Prova não encontrada")
+    return await _exportar_prova(prova_id, "word", if_none_match)
+
+
+@router.post("/questoes/exportar")
+async def exportar_questoes(request: ExportacaoQuestoesRequest):
+    """
+    Exporta um conjunto de questões (de uma ou mais provas) em um único documento
     
-    questoes = db_service.get_questoes_by_prova(prova_id)
-    imagens = db_service.get_imagens_by_prova(prova_id)
+    Questões e imagens vêm de uma única consulta; a ordem do documento é a
+    ordem de questao_ids.
+    """
+    if request.formato not in MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="Formato inválido (use pdf ou word)")
+    questao_ids = list(dict.fromkeys(request.questao_ids))
+    if not questao_ids:
+        raise HTTPException(status_code=400, detail="Informe ao menos uma questão")
+    if len(questao_ids) > settings.export_questoes_max:
+        raise HTTPException(
+            status_code=400,
+            detail=f"{len(questao_ids)} questões excedem o limite de {settings.export_questoes_max}"
+        )
     
-    if not questoes:
-        raise HTTPException(status_code=404, detail="Nenhuma questão encontrada para esta prova")
+    dados = await run_in_threadpool(db_service.get_questoes_com_imagens, questao_ids)
+    encontradas = {questao["id"] for questao in dados["questoes"]}
+    ausentes = [questao_id for questao_id in questao_ids if questao_id not in encontradas]
+    if ausentes:
+        raise HTTPException(status_code=404, detail=f"Questões não encontradas: {ausentes}")
     
-    word_buffer = export_service.export_to_word(
-        questoes=questoes,
-        imagens=imagens,
-        prova_nome=prova.get("nome", "Prova")
+    buffer = await _render(
+        "export_to_pdf" if request.formato == "pdf" else "export_to_word",
+        questoes=dados["questoes"],
+        imagens=dados["imagens"],
+        prova_nome=request.titulo
     )
     
-    filename = f"{prova.get('nome', 'prova').replace('.pdf', '')}_questoes.docx"
-    
+    extensao = "pdf" if request.formato == "pdf" else "docx"
     return StreamingResponse(
-        word_buffer,
-        media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+        buffer,
+        media_type=MEDIA_TYPES[request.formato],
+        headers={"Content-Disposition": f'attachment; filename="questoes_selecionadas.{extensao}"'}
     )
 
 
-@router.get("/questoes/{questao_id}/exportar/pdf")
-async def exportar_questao_pdf(questao_id: int):
-    """Exporta uma questão individual em PDF"""
-    questao = db_service.get_questao(questao_id)
-    if not questao:
+async def _exportar_questao(questao_id: int, formato: str) -> StreamingResponse:
+    """Exportação de uma questão; questão e imagens vêm de uma única consulta"""
+    dados = await run_in_threadpool(db_service.get_questoes_com_imagens, [questao_id])
+    if not dados["questoes"]:
         raise HTTPException(status_code=404, detail="Questão não encontrada")
+    questao = dados["questoes"][0]
     
-    # Buscar imagens relacionadas
-    imagens = db_service.get_imagens_by_prova(questao.get("prova_id"))
-    imagens_questao = [img for img in imagens if img.get("questao_id") == questao_id]
-    
-    pdf_buffer = export_service.export_questao_individual_pdf(
+    buffer = await _render(
+        "export_questao_individual_pdf" if formato == "pdf" else "export_questao_individual_word",
         questao=questao,
-        imagens=imagens_questao
+        imagens=dados["imagens"]
     )
     
-    filename = f"questao_{questao.get('numero', questao_id)}.pdf"
+    extensao = "pdf" if formato == "pdf" else "docx"
+    filename = f"questao_{questao.get('numero', questao_id)}.{extensao}"
     
     return StreamingResponse(
-        pdf_buffer,
-        media_type="application/pdf",
+        buffer,
+        media_type=MEDIA_TYPES[formato],
         headers={"Content-Disposition": f'attachment; filename="{filename}"'}
     )
 
 
+@router.get("/questoes/{questao_id}/exportar/pdf")
+async def exportar_questao_pdf(questao_id: int):
+    """Exporta uma questão individual em PDF"""
+    return await _exportar_questao(questao_id, "pdf")
+
+
 @router.get("/questoes/{questao_id}/exportar/word")
 async def exportar_questao_word(questao_id: int):
     """Exporta uma questão individual em Word (DOCX)"""
-    questao = db_service.get_questao(questao_id)
-    if not questao:
-        raise HTTPException(status_code=404, detail="Questão não encontrada")
-    
-    # Buscar imagens relacionadas
-    imagens_questao = db_service.get_imagens_by_questao(questao_id)
-    
-    word_buffer = export_service.export_questao_individual_word(
-        questao=questao,
-        imagens=imagens_questao
-    )
-    
-    filename = f"questao_{questao.get('numero', questao_id)}.docx"
-    
-    return StreamingResponse(
-        word_buffer,
-        media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
-    )
+    return await _exportar_questao(questao_id, "word")
 
 
 @router.post("/cancelar-pendentes", response_model=Dict)
@@ -1,49 +1,46 @@
-import google.generativeai as genai
-from openai import OpenAI
 from app.config import settings
-from typing import List, Dict, Optional
+from app.services.llm_client import llm_client
+from app.services.llm_accounting import llm_context
+from app.services.page_index import PageIndex
+from app.services.text_chunker import text_chunker
+from app.services.text_anchor import TextAnchorIndex
+from app.services.llm_response import questoes_response_format, parse_questoes_response
+from typing import List, Dict, Optional, Tuple
 import json
-import re
+import math
+import threading
+
+
+# Instruções fixas da validação, iguais em todos os lotes; apenas o texto de
+# origem e as questões variam no prompt do usuário
+VALIDATION_SYSTEM_PROMPT = """Você é um especialista em validação de extração de questões de provas.
+
+Você receberá o TEXTO DE ORIGEM (páginas da prova) e as QUESTÕES EXTRAÍDAS desse texto.
+Valide e refine cada questão usando o texto de origem.
+
+INSTRUÇÕES:
+1. Retorne TODAS as questões recebidas, sem omitir nenhuma
+2. Certifique-se que o texto de cada questão está COMPLETO (enunciado e alternativas), conforme o texto de origem
+3. Mantenha o número de cada questão e a ordem numérica EXATA
+4. Use posicao_inicio e posicao_fim null
+
+FORMATO DE RESPOSTA (JSON VÁLIDO):
+{
+  "questoes": [
+    {
+      "numero": 1,
+      "texto": "Texto validado e completo da questão",
+      "posicao_inicio": null,
+      "posicao_fim": null
+    }
+  ]
+}
+
+CRÍTICO: Retorne APENAS JSON válido, sem markdown, sem texto adicional. O JSON deve começar com { e terminar com }."""
 
 
 class AIAnalyzer:
     def __init__(self):
-        # Configurar Gemini (tentar modelos mais recentes primeiro)
-        self.gemini_model = None
-        self.gemini_model_name = None
-        try:
-            genai.configure(api_key=settings.gemini_api_key)
-            # Tentar modelos mais recentes primeiro (ordem de preferência)
-            # Gemini 2.0 é experimental, Gemini 1.5 Pro é mais estável e poderoso
-            model_names = [
-                'gemini-3.0-pro',        # Mais recente (se disponível)
-                'gemini-2.5-pro',        # Versão 2.5 Pro (se disponível)
-                'gemini-2.0-flash-exp',  # Mais recente experimental
-                'gemini-1.5-pro',        # Mais poderoso e estável
-                'gemini-1.5-flash',      # Mais rápido
-                'gemini-1.0-pro',        # Fallback
-                'gemini-pro'              # Último fallback
-            ]
-            for model_name in model_names:
-                try:
-                    # Testar se o modelo funciona criando o objeto
-                    test_model = genai.GenerativeModel(model_name)
-                    self.gemini_model = test_model
-                    self.gemini_model_name = model_name
-                    print(f"✅ Modelo Gemini configurado: {model_name}")
-                    break
-                except Exception as e:
-                    print(f"⚠️ Modelo {model_name} não disponível: {e}")
-                    continue
-            
-            if self.gemini_model is None:
-                print("⚠️ Nenhum modelo Gemini disponível. Usando apenas ChatGPT.")
-        except Exception as e:
-            print(f"⚠️ Gemini não configurado: {e}. Usando apenas ChatGPT.")
-        
-        # Configurar OpenAI (sempre necessário)
-        self.openai_client = OpenAI(api_key=settings.openai_api_key)
-        
         # Modelos OpenAI disponíveis (ordem de preferência)
         # gpt-4o é o mais recente e melhor, gpt-4-turbo suporta response_format
         self.openai_models = [
@@ -54,24 +51,46 @@ class AIAnalyzer:
         ]
         self.current_openai_model = None
         self.supports_json_mode = False
-        self._detect_best_openai_model()
+        self.supports_structured_output = False
+        # A detecção do modelo faz chamadas de rede: adiada para o primeiro uso,
+        # para não travar a importação (API e workers) se a OpenAI estiver lenta
+        self._openai_model_detected = False
+        self.detection_timeout = 20.0  # Prazo (s) de cada chamada de teste dos modelos
+        self._detection_lock = threading.Lock()
+    
+    @property
+    def gemini_model(self):
+        return llm_client.gemini_model
+    
+    @property
+    def gemini_model_name(self) -> Optional[str]:
+        return llm_client.gemini_model_name
+    
+    def _ensure_openai_model(self):
+        """Detecta o modelo OpenAI uma única vez por processo, no primeiro uso"""
+        if self._openai_model_detected:
+            return
+        with self._detection_lock:
+            if not self._openai_model_detected:
+                self._detect_best_openai_model()
+                self._openai_model_detected = True
     
     def _detect_best_openai_model(self):
         """Detecta o melhor modelo OpenAI disponível que suporta JSON mode"""
         # Modelos que suportam response_format (JSON mode)
         json_mode_models = ['gpt-4o', 'gpt-4-turbo', 'gpt-3.5-turbo']
+        # Modelos que suportam saída estruturada (response_format json_schema)
+        structured_output_models = ['gpt-4o']
         
         for model_name in self.openai_models:
             try:
-                # Testar se o modelo está disponível fazendo uma chamada simples
-                test_response = self.openai_client.chat.completions.create(
-                    model=model_name,
-                    messages=[{"role": "user", "content": "test"}],
-                    max_tokens=5
-                )
+                # Testar se o modelo está disponível fazendo uma chamada simples (registrada)
+                with llm_context(etapa="deteccao_modelo"):
+                    llm_client.probe_openai(model_name, self.detection_timeout)
                 self.current_openai_model = model_name
                 self.supports_json_mode = model_name in json_mode_models
-                print(f"✅ Modelo OpenAI configurado: {model_name} (JSON mode: {'✅' if self.supports_json_mode else '❌'})")
+                self.supports_structured_output = model_name in structured_output_models
+                print(f"✅ Modelo OpenAI configurado: {model_name} (JSON mode: {'✅' if self.supports_json_mode else '❌'}, schema: {'✅' if self.supports_structured_output else '❌'})")
                 return
             except Exception as e:
                 print(f"⚠️ Modelo {model_name} não disponível: {e}")
@@ -80,6 +99,7 @@ class AIAnalyzer:
         # Fallback para gpt-4 se nenhum funcionar
         self.current_openai_model = 'gpt-4'
         self.supports_json_mode = False
+        self.supports_structured_output = False
         print(f"⚠️ Usando fallback: {self.current_openai_model}")
     
     def analyze_structure_with_gemini(self, text: str, images_info: List[Dict]) -> Dict:
@@ -129,8 +149,8 @@ FORMATO DE RESPOSTA (JSON VÁLIDO):
 CRÍTICO: Retorne APENAS JSON válido, sem markdown, sem texto adicional, sem explicações."""
         
         try:
-            response = self.gemini_model.generate_content(prompt)
-            response_text = response.text.strip()
+            response = llm_client.generate(prompt, prefer=llm_client.GEMINI, openai_model=self.current_openai_model)
+            response_text = response["content"].strip()
             
             # Limpar resposta (remover markdown code blocks se houver)
             if "```json" in response_text:
@@ -144,189 +164,63 @@ CRÍTICO: Retorne APENAS JSON válido, sem markdown, sem texto adicional, sem ex
             print(f"Erro ao analisar com Gemini: {e}")
             return {"questoes": []}
     
-    def extract_questoes_with_chatgpt(self, full_text: str) -> List[Dict]:
-        """Usa ChatGPT para extrair questões diretamente (quando Gemini falha)"""
-        # Processar em chunks se o texto for muito grande
-        max_chunk_size = 12000
-        chunks = []
+    def extract_questoes_with_chatgpt(self, full_text: str, chunks: Optional[List[Dict]] = None,
+                                      anchor_index: Optional[TextAnchorIndex] = None,
+                                      page_index: Optional[PageIndex] = None) -> List[Dict]:
+        """
+        Usa ChatGPT para extrair questões diretamente (quando Gemini falha)
         
-        if len(full_text) > max_chunk_size:
-            # Dividir em chunks mantendo contexto
-            words = full_text.split()
-            current_chunk = []
-            current_size = 0
-            
-            for word in words:
-                word_size = len(word) + 1  # +1 para espaço
-                if current_size + word_size > max_chunk_size and current_chunk:
-                    chunks.append(" ".join(current_chunk))
-                    current_chunk = [word]
-                    current_size = word_size
-                else:
-                    current_chunk.append(word)
-                    current_size += word_size
-            
-            if current_chunk:
-                chunks.append(" ".join(current_chunk))
-        else:
-            chunks = [full_text]
+        O texto é enviado em partes dentro do orçamento de tokens (text_chunker).
+        Cada questão retornada é localizada em full_text pelo seu próprio texto
+        (anchor_index), o que define posicao_inicio/posicao_fim e a página; as
+        posições informadas pela IA só são usadas se o texto não for encontrado.
+        Itens inválidos ou perdidos por corte da resposta são pedidos de novo
+        individualmente, sem reenviar a parte inteira.
+        """
+        if chunks is None:
+            chunks = text_chunker.chunk_by_questoes(full_text)
+        if anchor_index is None:
+            anchor_index = TextAnchorIndex(full_text)
         
+        system_prompt = "Você é um especialista em análise de provas de concursos públicos. Retorne APENAS JSON válido, sem markdown, sem texto adicional. O JSON deve começar com { e terminar com }."
         all_questoes = []
         
-        for chunk_idx, chunk_text in enumerate(chunks):
-            # Limitar tamanho do chunk para evitar truncamento
-            chunk_max_size = 8000  # Reduzir para garantir que não exceda limites
-            chunk_text_limited = chunk_text[:chunk_max_size] if len(chunk_text) > chunk_max_size else chunk_text
-            
-            prompt = f"""Você é um especialista em análise de provas de concursos públicos e exames.
-
-Analise o texto abaixo e identifique TODAS as questões numeradas.
-
-TEXTO DA PROVA (parte {chunk_idx + 1} de {len(chunks)}):
-{chunk_text_limited}
-
-INSTRUÇÕES CRÍTICAS:
-1. Identifique questões que começam com números (1, 2, 3, etc.)
-2. Para cada questão, extraia:
-   - numero: número da questão (obrigatório)
-   - texto: texto COMPLETO mas LIMITADO a 2000 caracteres por questão
-   - posicao_inicio: posição aproximada no texto
-   - posicao_fim: posição final aproximada
-
-REGRAS IMPORTANTES:
-- Se o texto de uma questão for muito longo, trunque em 2000 caracteres
-- ESCAPE todas as aspas duplas no texto usando \\"
-- ESCAPE quebras de linha usando \\n
-- NÃO inclua quebras de linha literais no JSON
-- Garanta que todas as strings estejam entre aspas duplas
-- NÃO corte strings no meio - se uma questão for muito longa, trunque ANTES de incluir no JSON
-
-FORMATO DE RESPOSTA (JSON VÁLIDO):
-{{
-  "questoes": [
-    {{
-      "numero": 1,
-      "texto": "Texto da questão 1 com alternativas A) B) C) D) E)",
-      "posicao_inicio": 0,
-      "posicao_fim": 500
-    }}
-  ]
-}}
-
-CRÍTICO: Retorne APENAS JSON válido. Todas as strings devem estar corretamente escapadas e fechadas."""
+        for chunk_idx, chunk in enumerate(chunks):
+            chunk_text = chunk["texto"]
+            parte = f"parte {chunk_idx + 1} de {len(chunks)}"
             
             try:
-                # Preparar parâmetros da requisição
-                request_params = {
-                    "model": self.current_openai_model or "gpt-4o",
-                    "messages": [
-                        {"role": "system", "content": "Você é um especialista em análise de provas de concursos públicos. Retorne APENAS JSON válido, sem markdown, sem texto adicional. O JSON deve começar com { e terminar com }."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    "temperature": 0.3
-                }
+                resposta = self._request_questoes(system_prompt, self._extraction_prompt(chunk_text, parte))
+                questoes_chunk = resposta["questoes"]
                 
-                # Adicionar response_format se o modelo suportar (garante JSON válido)
-                if self.supports_json_mode:
-                    request_params["response_format"] = {"type": "json_object"}
-                
-                response = self.openai_client.chat.completions.create(**request_params)
-                
-                response_text = response.choices[0].message.content.strip()
-                
-                # Limpar resposta de markdown se houver
-                if "```json" in response_text:
-                    response_text = response_text.split("```json")[1].split("```")[0].strip()
-                elif "```" in response_text:
-                    # Pode ser ```json ou apenas ```
-                    parts = response_text.split("```")
-                    if len(parts) >= 3:
-                        response_text = parts[1].strip()
-                        if response_text.startswith("json"):
-                            response_text = response_text[4:].strip()
-                
-                # Limpar e corrigir JSON antes de parsear
-                response_text_clean = response_text.strip()
-                
-                # Remover markdown se houver
-                if "```json" in response_text_clean:
-                    response_text_clean = response_text_clean.split("```json")[1].split("```")[0].strip()
-                elif "```" in response_text_clean:
-                    parts = response_text_clean.split("```")
-                    if len(parts) >= 3:
-                        response_text_clean = parts[1].strip()
-                        if response_text_clean.startswith("json"):
-                            response_text_clean = response_text_clean[4:].strip()
-                
-                # Tentar corrigir JSON malformado
-                try:
-                    result = json.loads(response_text_clean)
-                except json.JSONDecodeError as e:
-                    print(f"⚠️ Erro ao parsear JSON do chunk {chunk_idx + 1}: {e}")
-                    print(f"   Primeiros 500 caracteres: {response_text_clean[:500]}")
+                # Pedir de novo apenas o que falhou (itens inválidos ou após o corte da resposta)
+                for _ in range(settings.llm_max_reasks):
+                    numeros_falhos = sorted({f["numero"] for f in resposta["falhas"] if f["numero"] is not None})
+                    if resposta["completo"] and not numeros_falhos:
+                        break
                     
-                    # Tentar corrigir strings não terminadas
-                    try:
-                        # Encontrar todas as strings não terminadas e fechá-las
-                        fixed_json = response_text_clean
-                        
-                        # Padrão: encontrar strings que começam com " mas não terminam antes de {
-                        # Fechar strings não terminadas antes de fechar objetos
-                        import re as regex_module
-                        
-                        # Tentar encontrar o JSON válido mais interno
-                        json_match = regex_module.search(r'\{[^{}]*"questoes"[^{}]*\[.*?\].*?\}', fixed_json, regex_module.DOTALL)
-                        if json_match:
-                            try:
-                                result = json.loads(json_match.group(0))
-                            except:
-                                pass
-                        
-                        # Se ainda não funcionou, tentar extrair questões manualmente
-                        if 'result' not in locals():
-                            # Extrair questões usando regex mais permissivo
-                            questoes_matches = regex_module.findall(r'"numero"\s*:\s*(\d+).*?"texto"\s*:\s*"([^"]*(?:\\.[^"]*)*)"', fixed_json, regex_module.DOTALL)
-                            if questoes_matches:
-                                questoes_fixed = []
-                                for num, texto in questoes_matches:
-                                    # Limpar texto e limitar tamanho
-                                    texto_clean = texto.replace('\\"', '"').replace('\\n', '\n')[:2000]
-                                    # Remover caracteres NUL e outros problemáticos
-                                    texto_clean = texto_clean.replace('\x00', '').replace('\r', ' ')
-                                    texto_clean = ''.join(char for char in texto_clean if ord(char) >= 32 or char in '\n\t')
-                                    questoes_fixed.append({
-                                        "numero": int(num),
-                                        "texto": texto_clean,
-                                        "posicao_inicio": 0,
-                                        "posicao_fim": len(texto_clean)
-                                    })
-                                if questoes_fixed:
-                                    result = {"questoes": questoes_fixed}
-                                    print(f"   ✅ Extraídas {len(questoes_fixed)} questões usando regex")
-                                else:
-                                    print(f"   ⚠️ Não foi possível extrair questões válidas, pulando chunk")
-                                    continue
-                            else:
-                                print(f"   ⚠️ Não foi possível extrair JSON válido, pulando chunk")
-                                continue
-                    except Exception as fix_error:
-                        print(f"   ⚠️ Erro ao tentar corrigir JSON: {fix_error}, pulando chunk")
-                        continue
-                
-                # Verificar se result foi definido
-                if 'result' not in locals():
-                    print(f"   ⚠️ Não foi possível processar chunk {chunk_idx + 1}, pulando")
-                    continue
+                    # Uma única instrução com tudo o que falta (falhas e/ou o que veio após o corte)
+                    pedidos = []
+                    if numeros_falhos:
+                        pedidos.append(f"as questões de número {', '.join(map(str, numeros_falhos))}")
+                    if not resposta["completo"] and questoes_chunk:
+                        ultimo = max(q["numero"] for q in questoes_chunk)
+                        pedidos.append(f"todas as questões de número maior que {ultimo}")
+                    instrucao = f"Retorne APENAS {' e '.join(pedidos)}." if pedidos else ""
+                    
+                    print(f"   🔁 Parte {chunk_idx + 1}: pedindo novamente ({instrucao or 'resposta inválida'})")
+                    resposta = self._request_questoes(
+                        system_prompt,
+                        self._extraction_prompt(chunk_text, parte, instrucao)
+                    )
+                    questoes_chunk.extend(resposta["questoes"])
                 
-                questoes_chunk = result.get("questoes", [])
+                if resposta["falhas"]:
+                    print(f"   ⚠️ Parte {chunk_idx + 1}: {len(resposta['falhas'])} itens inválidos descartados ({resposta['falhas'][0]['erro']})")
                 
-                # Ajustar posições relativas ao texto completo
-                chunk_start_pos = full_text.find(chunk_text[:100]) if chunk_text else 0
+                # Localizar cada questão no texto completo
                 for questao in questoes_chunk:
-                    if "posicao_inicio" in questao:
-                        questao["posicao_inicio"] += chunk_start_pos
-                    if "posicao_fim" in questao:
-                        questao["posicao_fim"] += chunk_start_pos
+                    self._anchor_questao(questao, chunk, anchor_index, page_index)
                 
                 all_questoes.extend(questoes_chunk)
             except Exception as e:
@@ -347,167 +241,239 @@ CRÍTICO: Retorne APENAS JSON válido. Todas as strings devem estar corretamente
         
         return list(unique_questoes.values())
     
-    def validate_with_chatgpt(self, questoes: List[Dict], full_text: str) -> List[Dict]:
-        """Usa ChatGPT para validar e refinar a extração"""
-        if not questoes:
-            return []
-        
-        # Processar TODAS as questões em lotes se necessário
-        # Processar em lotes de 30 questões por vez para não exceder limites de token
-        batch_size = 30
-        all_validated = []
-        
-        for batch_start in range(0, len(questoes), batch_size):
-            batch_end = min(batch_start + batch_size, len(questoes))
-            questoes_batch = questoes[batch_start:batch_end]
-            
-            # Processar este lote
-            text_sample = full_text[:10000] if len(full_text) > 10000 else full_text
-            
-            # Preparar questões do lote
-            questoes_prepared = []
-            for q in questoes_batch:
-                q_copy = q.copy()
-                # Truncar texto se muito longo (mas manter mais texto)
-                if len(q_copy.get("texto", "")) > 2000:
-                    q_copy["texto"] = q_copy["texto"][:1997] + "..."
-                questoes_prepared.append(q_copy)
-            
-            # Preparar JSON das questões de forma segura
-            questoes_json = json.dumps(questoes_prepared, ensure_ascii=False, indent=2)
-            # Limitar tamanho do JSON se necessário (mas permitir mais)
-            if len(questoes_json) > 8000:
-                # Se ainda muito grande, reduzir número de questões no lote
-                questoes_json = json.dumps(questoes_prepared[:20], ensure_ascii=False, indent=2)
-        
-            prompt = f"""Você é um especialista em validação de extração de questões de provas.
-
-Valide e refine as questões extraídas abaixo. IMPORTANTE: Retorne TODAS as questões do lote, sem omitir nenhuma.
-
-TEXTO DA PROVA (amostra):
-{text_sample}
+    def _anchor_questao(self, questao: Dict, chunk: Dict, anchor_index: TextAnchorIndex,
+                        page_index: Optional[PageIndex]):
+        """Define a posição da questão no texto completo (e a página, se houver índice)"""
+        span = anchor_index.locate(questao["texto"], chunk["inicio"], chunk["fim"])
+        if span:
+            questao["posicao_inicio"], questao["posicao_fim"] = span
+            questao["ancorada"] = True
+        else:
+            # Texto não encontrado: posição aproximada da IA, relativa à parte enviada
+            inicio = min(max(questao.get("posicao_inicio", 0), 0), len(chunk["texto"]))
+            questao["posicao_inicio"] = chunk["inicio"] + inicio
+            questao["posicao_fim"] = min(questao["posicao_inicio"] + len(questao["texto"]), chunk["fim"])
+            questao["ancorada"] = False
+        if page_index is not None and len(page_index):
+            questao["pagina"] = page_index.page_for_position(questao["posicao_inicio"])
+    
+    def _extraction_prompt(self, chunk_text: str, parte: str, instrucao: str = "") -> str:
+        """Prompt de extração de uma parte do texto (instrucao restringe as questões pedidas)"""
+        restricao = f"\nRESTRIÇÃO: {instrucao}\n" if instrucao else ""
+        return f"""Você é um especialista em análise de provas de concursos públicos e exames.
 
-QUESTÕES EXTRAÍDAS (Lote {batch_start//batch_size + 1}):
-{questoes_json}
+Analise o texto abaixo e identifique TODAS as questões numeradas.
 
-INSTRUÇÕES:
-1. Valide se TODAS as questões do lote foram identificadas e retornadas
-2. Certifique-se que o texto está COMPLETO mas LIMITADO a 2000 caracteres por questão
-3. ESCAPE todas as aspas duplas no texto usando \\"
-4. ESCAPE quebras de linha usando \\n
-5. Mantenha a ordem numérica EXATA das questões
-6. Se uma questão tiver texto muito longo, trunque em 2000 caracteres ANTES de incluir no JSON
-7. CRÍTICO: Retorne TODAS as questões do lote, não omita nenhuma
+TEXTO DA PROVA ({parte}):
+{chunk_text}
 
+INSTRUÇÕES CRÍTICAS:
+1. Identifique questões que começam com números (1, 2, 3, etc.)
+2. Para cada questão, extraia:
+   - numero: número da questão (obrigatório)
+   - texto: texto COMPLETO da questão, com enunciado e todas as alternativas
+   - posicao_inicio: posição aproximada no texto acima
+   - posicao_fim: posição final aproximada
+{restricao}
 FORMATO DE RESPOSTA (JSON VÁLIDO):
 {{
   "questoes": [
     {{
       "numero": 1,
-      "texto": "Texto validado e completo da questão",
+      "texto": "Texto da questão 1 com alternativas A) B) C) D) E)",
       "posicao_inicio": 0,
       "posicao_fim": 500
     }}
   ]
 }}
 
-CRÍTICO: Retorne APENAS JSON válido. Todas as strings devem estar corretamente escapadas. Retorne TODAS as questões do lote."""
+CRÍTICO: Retorne APENAS JSON válido."""
+    
+    def _request_questoes(self, system_prompt: str, prompt: str) -> Dict:
+        """
+        Chama o ChatGPT pedindo {"questoes": [...]} e valida a resposta item a item
+        
+        Usa saída estruturada (json_schema) nos modelos que suportam, senão JSON mode.
+        Prazos, novas tentativas e failover para o Gemini ficam no llm_client.
+        """
+        self._ensure_openai_model()
+        response = llm_client.generate(
+            prompt,
+            system_prompt=system_prompt,
+            prefer=llm_client.OPENAI,
+            openai_model=self.current_openai_model,
+            response_format=questoes_response_format(self.supports_structured_output, self.supports_json_mode)
+        )
+        
+        if response["refusal"]:
+            print(f"   ⚠️ Modelo recusou a requisição: {response['refusal']}")
+            return {"questoes": [], "falhas": [], "completo": True}
+        
+        resposta = parse_questoes_response(response["content"])
+        if response["finish_reason"] == "length":
+            # Resposta cortada pelo limite de tokens: itens completos são mantidos
+            resposta["completo"] = False
+        return resposta
+    
+    def validate_with_chatgpt(self, questoes: List[Dict], full_text: str,
+                              page_index: Optional[PageIndex] = None) -> List[Dict]:
+        """
+        Usa ChatGPT para validar e refinar a extração
+        
+        Cada lote leva apenas o texto das páginas de onde suas questões vieram, dentro
+        do orçamento de tokens (llm_validation_max_tokens). As instruções ficam fixas
+        na mensagem de sistema, idênticas em todas as chamadas, para que todos os
+        lotes sejam validados com as mesmas regras.
+        
+        Questões que voltam inválidas ou ausentes são pedidas de novo apenas elas;
+        se ainda assim falharem, a versão original é mantida.
+        """
+        if not questoes:
+            return []
+        
+        if page_index is None:
+            page_index = PageIndex([1], [len(full_text)])
+        
+        all_validated = []
+        batches = self._validation_batches(questoes, full_text, page_index)
+        
+        for lote, (questoes_batch, contexto) in enumerate(batches, start=1):
+            originais = {q.get("numero"): q for q in questoes_batch}
+            pendentes = list(questoes_batch)
+            validadas = {}
             
             try:
-                # Preparar parâmetros da requisição
-                request_params = {
-                    "model": self.current_openai_model or "gpt-4o",
-                    "messages": [
-                        {"role": "system", "content": "Você é um especialista em validação de extração de questões de provas. Retorne APENAS JSON válido, sem markdown, sem texto adicional. O JSON deve começar com { e terminar com }."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    "temperature": 0.3
-                }
-                
-                # Adicionar response_format se o modelo suportar (garante JSON válido)
-                if self.supports_json_mode:
-                    request_params["response_format"] = {"type": "json_object"}
-                
-                response = self.openai_client.chat.completions.create(**request_params)
-                
-                response_text = response.choices[0].message.content.strip()
-                
-                # Limpar resposta de markdown se houver
-                if "```json" in response_text:
-                    response_text = response_text.split("```json")[1].split("```")[0].strip()
-                elif "```" in response_text:
-                    parts = response_text.split("```")
-                    if len(parts) >= 3:
-                        response_text = parts[1].strip()
-                        if response_text.startswith("json"):
-                            response_text = response_text[4:].strip()
-                
-                # Limpar e preparar JSON
-                response_text_clean = response_text.strip()
-                
-                # Remover markdown
-                if "```json" in response_text_clean:
-                    response_text_clean = response_text_clean.split("```json")[1].split("```")[0].strip()
-                elif "```" in response_text_clean:
-                    parts = response_text_clean.split("```")
-                    if len(parts) >= 3:
-                        response_text_clean = parts[1].strip()
-                        if response_text_clean.startswith("json"):
-                            response_text_clean = response_text_clean[4:].strip()
-                
-                # Tentar parsear JSON
-                try:
-                    result = json.loads(response_text_clean)
-                except json.JSONDecodeError as e:
-                    print(f"⚠️ Erro ao parsear JSON na validação (lote {batch_start//batch_size + 1}): {e}")
-                    print(f"   Primeiros 500 caracteres: {response_text_clean[:500]}")
-                    
-                    # Tentar extrair questões manualmente
-                    questoes_matches = re.findall(r'"numero"\s*:\s*(\d+).*?"texto"\s*:\s*"([^"]*(?:\\.[^"]*)*)"', response_text_clean, re.DOTALL)
-                    if questoes_matches:
-                        questoes_fixed = []
-                        for num, texto in questoes_matches:
-                            texto_clean = texto.replace('\\"', '"').replace('\\n', '\n')[:2000]
-                            # Limpar caracteres NUL e outros problemáticos
-                            texto_clean = texto_clean.replace('\x00', '').replace('\r', ' ')
-                            texto_clean = ''.join(char for char in texto_clean if ord(char) >= 32 or char in '\n\t')
-                            questoes_fixed.append({
-                                "numero": int(num),
-                                "texto": texto_clean,
-                                "posicao_inicio": 0,
-                                "posicao_fim": len(texto_clean)
-                            })
-                        if questoes_fixed:
-                            print(f"   ✅ Extraídas {len(questoes_fixed)} questões usando regex (lote {batch_start//batch_size + 1})")
-                            all_validated.extend(questoes_fixed)
-                            continue
+                for tentativa in range(settings.llm_max_reasks + 1):
+                    resposta = self._request_questoes(
+                        VALIDATION_SYSTEM_PROMPT,
+                        self._validation_prompt(contexto, pendentes)
+                    )
+                    for questao in resposta["questoes"]:
+                        if questao["numero"] in originais:
+                            validadas[questao["numero"]] = questao
                     
-                    print(f"   ⚠️ Não foi possível extrair JSON válido para lote {batch_start//batch_size + 1}, usando questões originais")
-                    all_validated.extend(questoes_prepared)
-                    continue
-                
-                # Adicionar questões validadas do lote
-                validated_batch = result.get("questoes", questoes_prepared)
-                all_validated.extend(validated_batch)
-                print(f"   ✅ Lote {batch_start//batch_size + 1}: {len(validated_batch)} questões validadas")
-            
+                    # Re-pedir apenas as questões do lote que não voltaram válidas
+                    pendentes = [q for q in pendentes if q.get("numero") not in validadas]
+                    if not pendentes:
+                        break
+                    if tentativa < settings.llm_max_reasks:
+                        print(f"   🔁 Lote {lote}: pedindo novamente {len(pendentes)} questões")
             except Exception as e:
-                print(f"   ⚠️ Erro ao validar lote {batch_start//batch_size + 1} com ChatGPT: {e}")
-                # Em caso de erro, usar questões originais do lote
-                all_validated.extend(questoes_prepared)
-                continue
+                print(f"   ⚠️ Erro ao validar lote {lote} com ChatGPT: {e}")
+            
+            # Questões não validadas mantêm a versão original; as validadas mantêm a
+            # posição de origem (a IA não conhece os offsets reais do documento)
+            validated_batch = []
+            for q in questoes_batch:
+                validada = validadas.get(q.get("numero"))
+                if validada is None:
+                    validated_batch.append(q)
+                    continue
+                for campo in ("posicao_inicio", "posicao_fim", "pagina", "ancorada"):
+                    if campo in q:
+                        validada[campo] = q[campo]
+                    else:
+                        validada.pop(campo, None)
+                validated_batch.append(validada)
+            all_validated.extend(validated_batch)
+            if pendentes:
+                print(f"   ⚠️ Lote {lote}: {len(pendentes)} questões mantidas sem validação")
+            print(f"   ✅ Lote {lote}: {len(validated_batch) - len(pendentes)} questões validadas")
         
         # Ordenar por número e retornar todas
         all_validated_sorted = sorted(all_validated, key=lambda x: x.get("numero", 0))
-        print(f"✅ Validação completa: {len(all_validated_sorted)} questões validadas de {len(questoes)} originais")
+        print(f"✅ Validação completa: {len(all_validated_sorted)} questões validadas de {len(questoes)} originais ({len(batches)} lotes)")
         return all_validated_sorted
     
+    def _validation_batches(self, questoes: List[Dict], full_text: str,
+                            page_index: PageIndex) -> List[Tuple[List[Dict], str]]:
+        """
+        Agrupa as questões (em ordem) em lotes de até 30 que caibam no orçamento de
+        tokens junto com o texto das suas páginas
+        
+        Se as páginas de uma questão sozinha não couberem, o contexto passa a ser
+        apenas o trecho da própria questão no documento.
+        """
+        batch_size = 30
+        budget = settings.llm_validation_max_tokens
+        ordered = sorted(questoes, key=lambda q: (q.get("numero") or 0))
+        
+        batches = []
+        batch, pages, tokens_questoes = [], set(), 0
+        for questao in ordered:
+            questao_pages = self._questao_pages(questao, page_index)
+            questao_tokens = text_chunker.estimate_tokens(self._questao_payload(questao))
+            candidate_pages = pages | questao_pages
+            total = tokens_questoes + questao_tokens + self._pages_tokens(candidate_pages, page_index)
+            
+            if batch and (len(batch) >= batch_size or total > budget):
+                batches.append((batch, self._pages_context(pages, full_text, page_index)))
+                batch, pages, tokens_questoes = [], set(), 0
+                candidate_pages = questao_pages
+                total = questao_tokens + self._pages_tokens(candidate_pages, page_index)
+            
+            if not batch and total > budget:
+                # Páginas grandes demais: apenas o trecho da questão como contexto
+                batches.append(([questao], self._span_context(questao, full_text, budget - questao_tokens)))
+                continue
+            
+            batch.append(questao)
+            pages = candidate_pages
+            tokens_questoes += questao_tokens
+        
+        if batch:
+            batches.append((batch, self._pages_context(pages, full_text, page_index)))
+        return batches
+    
+    def _questao_pages(self, questao: Dict, page_index: PageIndex) -> set:
+        """Páginas cobertas pelo trecho de origem da questão"""
+        if "posicao_inicio" not in questao:
+            return {questao["pagina"]} if questao.get("pagina") in page_index.page_numbers else set()
+        return set(page_index.pages_for_span(questao["posicao_inicio"], questao.get("posicao_fim", 0)))
+    
+    def _pages_tokens(self, pages: set, page_index: PageIndex) -> int:
+        chars = 0
+        for page in pages:
+            start, end = page_index.page_span(page)
+            chars += end - start
+        return math.ceil(chars / text_chunker.chars_per_token)
+    
+    def _pages_context(self, pages: set, full_text: str, page_index: PageIndex) -> str:
+        parts = []
+        for page in sorted(pages):
+            start, end = page_index.page_span(page)
+            parts.append(f"[Página {page}]\n{full_text[start:end]}")
+        return "\n\n".join(parts)
+    
+    def _span_context(self, questao: Dict, full_text: str, max_tokens: int) -> str:
+        if "posicao_inicio" not in questao:
+            return ""
+        max_chars = max(0, int(max_tokens * text_chunker.chars_per_token))
+        start = max(0, questao["posicao_inicio"])
+        end = min(questao.get("posicao_fim", start), start + max_chars)
+        return full_text[start:end]
+    
+    def _questao_payload(self, questao: Dict) -> str:
+        return json.dumps({"numero": questao.get("numero"), "texto": questao.get("texto", "")}, ensure_ascii=False)
+    
+    def _validation_prompt(self, contexto: str, questoes_batch: List[Dict]) -> str:
+        """Parte variável da validação: texto de origem e questões do lote"""
+        questoes_json = "\n".join(self._questao_payload(q) for q in questoes_batch)
+        return f"""TEXTO DE ORIGEM (páginas das questões do lote):
+{contexto}
+
+QUESTÕES EXTRAÍDAS ({len(questoes_batch)}, uma por linha):
+{questoes_json}"""
+    
     def map_images_to_questoes(self, questoes: List[Dict], images: List[Dict], 
-                                     pages_text: List[Dict]) -> List[Dict]:
+                                     pages_text: List[Dict], page_index: Optional[PageIndex] = None) -> List[Dict]:
         """Mapeia imagens às questões usando IA"""
+        if page_index is None:
+            page_index = PageIndex.from_pages(pages_text)
+        
         # Criar contexto para análise
         questoes_info = "\n".join([
-            f"Questão {q['numero']}: página {self._get_page_for_position(q.get('posicao_inicio', 0), pages_text)}"
+            f"Questão {q['numero']}: página {self._questao_page_label(q, pages_text, page_index)}"
             for q in questoes
         ])
         
@@ -543,8 +509,8 @@ FORMATO DE RESPOSTA (JSON VÁLIDO):
 CRÍTICO: Retorne APENAS JSON válido, sem markdown, sem texto adicional."""
         
         try:
-            response = self.gemini_model.generate_content(prompt)
-            response_text = response.text.strip()
+            response = llm_client.generate(prompt, prefer=llm_client.GEMINI, openai_model=self.current_openai_model)
+            response_text = response["content"].strip()
             
             if "```json" in response_text:
                 response_text = response_text.split("```json")[1].split("```")[0].strip()
@@ -576,15 +542,20 @@ CRÍTICO: Retorne APENAS JSON válido, sem markdown, sem texto adicional."""
             print(f"Erro ao mapear imagens: {e}")
             return images
     
-    def _get_page_for_position(self, position: int, pages_text: List[Dict]) -> int:
+    def _questao_page_label(self, questao: Dict, pages_text: List[Dict], page_index: PageIndex) -> str:
+        """Página da questão para o prompt de mapeamento ("desconhecida" sem página nem posição)"""
+        if questao.get("pagina"):
+            return str(questao["pagina"])
+        if questao.get("posicao_inicio") is not None:
+            return str(self._get_page_for_position(questao["posicao_inicio"], pages_text, page_index))
+        return "desconhecida"
+    
+    def _get_page_for_position(self, position: int, pages_text: List[Dict],
+                               page_index: Optional[PageIndex] = None) -> int:
         """Determina em qual página está uma posição de texto"""
-        current_pos = 0
-        for page in pages_text:
-            page_length = len(page["text"])
-            if position < current_pos + page_length:
-                return page["page"]
-            current_pos += page_length + 2  # +2 para quebras de linha
-        return len(pages_text)
+        if page_index is None:
+            page_index = PageIndex.from_pages(pages_text)
+        return page_index.page_for_position(position)
 
 
 ai_analyzer = AIAnalyzer()
@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, ForeignKey, BigInteger, Boolean
+from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, ForeignKey, BigInteger, Boolean, Float, JSON
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session, relationship
 from sqlalchemy.sql import func
@@ -17,6 +17,7 @@ class Prova(Base):
     status = Column(String(50), nullable=False, default="processando")
     etapa = Column(Text, nullable=True)  # Etapa atual do processamento (logs detalhados)
     progresso = Column(Integer, nullable=True, default=0)  # Progresso de 0 a 100
+    memoria = Column(JSON, nullable=True)  # Memória por etapa do último processamento (RSS, pico, modo de pouca memória)
     criado_em = Column(DateTime(timezone=True), server_default=func.now())
     atualizado_em = Column(DateTime(timezone=True), onupdate=func.now())
     
@@ -50,12 +51,38 @@ class Imagem(Base):
     posicao_pagina = Column(Integer, nullable=False)
     hash_imagem = Column(String(64), nullable=True)  # MD5 hash
     perceptual_hash = Column(String(64), nullable=True)  # Perceptual hash (pode ter até 64 caracteres)
+    perceptual_hash_bits = Column(BigInteger, nullable=True)  # pHash como inteiro de 64 bits (busca por Hamming)
+    # Bandas de 16 bits do pHash (multi-index hashing): distância <= 3 garante ao menos uma banda igual
+    phash_banda_0 = Column(Integer, nullable=True, index=True)
+    phash_banda_1 = Column(Integer, nullable=True, index=True)
+    phash_banda_2 = Column(Integer, nullable=True, index=True)
+    phash_banda_3 = Column(Integer, nullable=True, index=True)
     criado_em = Column(DateTime(timezone=True), server_default=func.now())
     
     prova = relationship("Prova", back_populates="imagens")
     questao = relationship("Questao", back_populates="imagens")
 
 
+class LLMChamada(Base):
+    __tablename__ = "llm_chamadas"
+    
+    id = Column(BigInteger, primary_key=True, index=True)
+    prova_id = Column(BigInteger, ForeignKey("provas.id", ondelete="CASCADE"), nullable=True, index=True)
+    etapa = Column(String(50), nullable=True)  # Etapa do pipeline (extracao_paginas, validacao, ...)
+    provedor = Column(String(20), nullable=True)  # openai / gemini
+    modelo = Column(String(100), nullable=True)
+    tokens_prompt = Column(Integer, nullable=True)
+    tokens_resposta = Column(Integer, nullable=True)
+    tokens_cache = Column(Integer, nullable=True)  # Tokens de entrada servidos pelo cache de prompt
+    latencia_ms = Column(Integer, nullable=False, default=0)
+    tentativas = Column(Integer, nullable=False, default=1)
+    failover = Column(Boolean, nullable=False, default=False)
+    sucesso = Column(Boolean, nullable=False, default=True)
+    erro = Column(Text, nullable=True)
+    custo_usd = Column(Float, nullable=True)  # Estimativa pela tabela de preços
+    criado_em = Column(DateTime(timezone=True), server_default=func.now())
+
+
 # Criar engine e session
 engine = create_engine(settings.get_postgres_url(), pool_pre_ping=True)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
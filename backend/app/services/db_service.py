@@ -1,11 +1,19 @@
 from sqlalchemy.orm import Session
-from app.services.database import SessionLocal, Prova, Questao, Imagem
+from sqlalchemy import text, func
+from app.services.database import SessionLocal, Prova, Questao, Imagem, LLMChamada
+from app.services.image_processor import image_processor
+from app.services.metrics import db_writes_total
 from typing import Dict, Any, List, Optional
 from datetime import datetime
 import os
+import re
 from app.config import settings
 
 
+# Arquivos com hash do conteúdo no nome (imutáveis) e suas miniaturas
+CONTENT_HASHED_IMAGE = re.compile(r'_[0-9a-f]{12}(?:_w\d+)?\.(?:png|jpe?g)$')
+
+
 class DatabaseService:
     def __init__(self):
         pass
@@ -25,6 +33,7 @@ class DatabaseService:
             )
             db.add(prova)
             db.commit()
+            db_writes_total.labels(tabela="provas").inc()
             db.refresh(prova)
             return self._prova_to_dict(prova)
         finally:
@@ -42,6 +51,19 @@ class DatabaseService:
                 if progresso is not None:
                     prova.progresso = progresso
                 db.commit()
+                db_writes_total.labels(tabela="provas").inc()
+        finally:
+            db.close()
+    
+    def update_prova_memoria(self, prova_id: int, memoria: Dict[str, Any]):
+        """Registra a memória por etapa do processamento da prova"""
+        db = self._get_db()
+        try:
+            prova = db.query(Prova).filter(Prova.id == prova_id).first()
+            if prova:
+                prova.memoria = memoria
+                db.commit()
+                db_writes_total.labels(tabela="provas").inc()
         finally:
             db.close()
     
@@ -57,6 +79,7 @@ class DatabaseService:
             )
             db.add(questao)
             db.commit()
+            db_writes_total.labels(tabela="questoes").inc()
             db.refresh(questao)
             return self._questao_to_dict(questao)
         finally:
@@ -69,21 +92,89 @@ class DatabaseService:
         """Cria registro de imagem"""
         db = self._get_db()
         try:
+            # pHash também é gravado como BIGINT + bandas para a busca entre provas
+            perceptual_hash_bits = image_processor.perceptual_hash_to_int(perceptual_hash)
+            bandas = image_processor.split_hash_bands(perceptual_hash_bits) if perceptual_hash_bits is not None else [None] * 4
             imagem = Imagem(
                 prova_id=prova_id,
                 questao_id=questao_id,
                 caminho_arquivo=caminho_arquivo,
                 posicao_pagina=posicao_pagina,
                 hash_imagem=hash_imagem,
-                perceptual_hash=perceptual_hash
+                perceptual_hash=perceptual_hash,
+                perceptual_hash_bits=perceptual_hash_bits,
+                phash_banda_0=bandas[0],
+                phash_banda_1=bandas[1],
+                phash_banda_2=bandas[2],
+                phash_banda_3=bandas[3]
             )
             db.add(imagem)
             db.commit()
+            db_writes_total.labels(tabela="imagens").inc()
             db.refresh(imagem)
             return self._imagem_to_dict(imagem)
         finally:
             db.close()
     
+    def find_imagem_equivalente(self, prova_id: int, hash_imagem: Optional[str],
+                                perceptual_hash: Optional[str]) -> Optional[Dict[str, Any]]:
+        """
+        Busca em provas anteriores uma imagem idêntica (MD5) ou quase idêntica (pHash)
+        
+        A busca por pHash usa as bandas indexadas para selecionar candidatos e
+        confirma a distância de Hamming no banco com bit_count (PostgreSQL 14+).
+        
+        Returns:
+            Dict com caminho_arquivo e distancia, ou None
+        """
+        db = self._get_db()
+        try:
+            if hash_imagem:
+                row = db.execute(text("""
+                    SELECT i.id, i.prova_id, i.caminho_arquivo, 0 AS distancia
+                    FROM imagens i
+                    WHERE i.hash_imagem = :hash_imagem AND i.prova_id <> :prova_id
+                    ORDER BY i.id
+                    LIMIT 1
+                """), {"hash_imagem": hash_imagem, "prova_id": prova_id}).mappings().first()
+                if row:
+                    return dict(row)
+            
+            perceptual_hash_bits = image_processor.perceptual_hash_to_int(perceptual_hash)
+            if perceptual_hash_bits is None:
+                return None
+            
+            max_distancia = image_processor.max_hamming_distance()
+            params = {
+                "phash": perceptual_hash_bits,
+                "prova_id": prova_id,
+                "max_distancia": max_distancia
+            }
+            filtro_bandas = ""
+            # Pelo princípio da casa dos pombos, distância < número de bandas
+            # garante que ao menos uma banda é idêntica
+            if max_distancia < image_processor.phash_bands:
+                for i, banda in enumerate(image_processor.split_hash_bands(perceptual_hash_bits)):
+                    params[f"b{i}"] = banda
+                filtro_bandas = "AND (" + " OR ".join(
+                    f"i.phash_banda_{i} = :b{i}" for i in range(image_processor.phash_bands)
+                ) + ")"
+            
+            row = db.execute(text(f"""
+                SELECT i.id, i.prova_id, i.caminho_arquivo,
+                       bit_count((i.perceptual_hash_bits # :phash)::bit(64)) AS distancia
+                FROM imagens i
+                WHERE i.prova_id <> :prova_id
+                  AND i.perceptual_hash_bits IS NOT NULL
+                  {filtro_bandas}
+                  AND bit_count((i.perceptual_hash_bits # :phash)::bit(64)) <= :max_distancia
+                ORDER BY distancia, i.id
+                LIMIT 1
+            """), params).mappings().first()
+            return dict(row) if row else None
+        finally:
+            db.close()
+    
     def save_image_file(self, image_bytes: bytes, filename: str) -> str:
         """Salva imagem localmente e retorna URL"""
         # Criar diretório se não existir
@@ -98,6 +189,35 @@ class DatabaseService:
         # Retornar URL relativa (será servida pelo FastAPI)
         return f"{settings.base_url}/images/{filename}"
     
+    def save_image_thumbnails(self, image_bytes: bytes, filename: str) -> Dict[int, str]:
+        """Gera e salva as miniaturas configuradas ao lado da imagem original"""
+        thumbnails = {}
+        base, _ = os.path.splitext(filename)
+        for width in settings.thumbnail_widths:
+            thumbnail = image_processor.create_thumbnail(image_bytes, width)
+            if thumbnail:
+                thumbnails[width] = self.save_image_file(thumbnail, f"{base}_w{width}.jpg")
+        return thumbnails
+    
+    def get_thumbnail_urls(self, caminho_arquivo: str) -> Dict[str, str]:
+        """
+        Retorna as URLs das miniaturas de uma imagem (apenas arquivos com hash no nome)
+        
+        Só entram as larguras cujo arquivo existe: a miniatura pode ter falhado na
+        etapa 8 ou THUMBNAIL_WIDTHS pode ter mudado depois do upload.
+        """
+        if not caminho_arquivo or not CONTENT_HASHED_IMAGE.search(caminho_arquivo):
+            return {}
+        _, separator, relative = caminho_arquivo.partition("/images/")
+        if not separator:
+            return {}
+        base, _ = os.path.splitext(caminho_arquivo)
+        base_path, _ = os.path.splitext(os.path.join(settings.images_dir, relative))
+        return {
+            str(width): f"{base}_w{width}.jpg" for width in settings.thumbnail_widths
+            if os.path.exists(f"{base_path}_w{width}.jpg")
+        }
+    
     def get_prova(self, prova_id: int) -> Optional[Dict[str, Any]]:
         """Busca uma prova por ID"""
         db = self._get_db()
@@ -147,6 +267,23 @@ class DatabaseService:
         finally:
             db.close()
     
+    def get_provas_filtradas(self, prova_ids: Optional[List[int]] = None, status: Optional[str] = None,
+                             nome_contem: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Provas por lista de IDs, status e/ou trecho do nome (sem distinção de maiúsculas)"""
+        db = self._get_db()
+        try:
+            query = db.query(Prova)
+            if prova_ids:
+                query = query.filter(Prova.id.in_(prova_ids))
+            if status:
+                query = query.filter(Prova.status == status)
+            if nome_contem:
+                query = query.filter(Prova.nome.ilike(f"%{nome_contem}%"))
+            provas = query.order_by(Prova.criado_em.desc()).all()
+            return [self._prova_to_dict(p) for p in provas]
+        finally:
+            db.close()
+    
     def _prova_to_dict(self, prova: Prova) -> Dict[str, Any]:
         """Converte modelo Prova para dict"""
         # Usar getattr com None como padrão para evitar erros se as colunas não existirem
@@ -157,6 +294,7 @@ class DatabaseService:
             "status": prova.status,
             "etapa": getattr(prova, 'etapa', None),
             "progresso": getattr(prova, 'progresso', None),
+            "memoria": getattr(prova, 'memoria', None),
             "criado_em": prova.criado_em.isoformat() if prova.criado_em else None,
             "atualizado_em": prova.atualizado_em.isoformat() if prova.atualizado_em else None
         }
@@ -184,6 +322,7 @@ class DatabaseService:
             "posicao_pagina": imagem.posicao_pagina,
             "hash_imagem": imagem.hash_imagem,
             "perceptual_hash": imagem.perceptual_hash,
+            "miniaturas": self.get_thumbnail_urls(imagem.caminho_arquivo),
             "criado_em": imagem.criado_em.isoformat() if imagem.criado_em else None
         }
     
@@ -198,6 +337,36 @@ class DatabaseService:
         finally:
             db.close()
     
+    def get_questoes_com_imagens(self, questao_ids: List[int]) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Questões por ID e suas imagens em uma única consulta (LEFT JOIN)
+        
+        Returns:
+            {"questoes": [...] na ordem dos IDs pedidos, "imagens": [...] por posição na página}
+        """
+        db = self._get_db()
+        try:
+            rows = db.query(Questao, Imagem).outerjoin(
+                Imagem, Imagem.questao_id == Questao.id
+            ).filter(
+                Questao.id.in_(questao_ids)
+            ).order_by(Questao.id, Imagem.posicao_pagina).all()
+            
+            questoes = {}
+            imagens = []
+            for questao, imagem in rows:
+                if questao.id not in questoes:
+                    questoes[questao.id] = self._questao_to_dict(questao)
+                if imagem is not None:
+                    imagens.append(self._imagem_to_dict(imagem))
+            
+            return {
+                "questoes": [questoes[questao_id] for questao_id in questao_ids if questao_id in questoes],
+                "imagens": imagens
+            }
+        finally:
+            db.close()
+    
     def get_questoes_formatadas(self) -> List[Dict[str, Any]]:
         """Busca todas as questões formatadas (formatado = True) com informações da prova"""
         db = self._get_db()
@@ -219,6 +388,71 @@ class DatabaseService:
         finally:
             db.close()
     
+    def create_llm_chamada(self, prova_id: Optional[int], etapa: Optional[str], provedor: Optional[str],
+                           modelo: Optional[str], tokens_prompt: Optional[int], tokens_resposta: Optional[int],
+                           tokens_cache: Optional[int], latencia_ms: int, tentativas: int, failover: bool,
+                           sucesso: bool, erro: Optional[str], custo_usd: Optional[float]):
+        """Registra uma chamada à IA (tokens, latência e custo estimado)"""
+        db = self._get_db()
+        try:
+            db.add(LLMChamada(
+                prova_id=prova_id,
+                etapa=etapa,
+                provedor=provedor,
+                modelo=modelo,
+                tokens_prompt=tokens_prompt,
+                tokens_resposta=tokens_resposta,
+                tokens_cache=tokens_cache,
+                latencia_ms=latencia_ms,
+                tentativas=tentativas,
+                failover=failover,
+                sucesso=sucesso,
+                erro=erro,
+                custo_usd=custo_usd
+            ))
+            db.commit()
+            db_writes_total.labels(tabela="llm_chamadas").inc()
+        finally:
+            db.close()
+    
+    def get_llm_resumo(self, prova_id: int) -> Dict[str, Any]:
+        """Resumo do uso de IA de uma prova: totais e quebra por etapa e modelo"""
+        db = self._get_db()
+        try:
+            rows = db.query(
+                LLMChamada.etapa,
+                LLMChamada.provedor,
+                LLMChamada.modelo,
+                func.count(LLMChamada.id),
+                func.count(LLMChamada.id).filter(LLMChamada.sucesso == False),
+                func.count(LLMChamada.id).filter(LLMChamada.failover == True),
+                func.coalesce(func.sum(LLMChamada.tokens_prompt), 0),
+                func.coalesce(func.sum(LLMChamada.tokens_resposta), 0),
+                func.coalesce(func.sum(LLMChamada.tokens_cache), 0),
+                func.coalesce(func.sum(LLMChamada.latencia_ms), 0),
+                func.coalesce(func.sum(LLMChamada.custo_usd), 0.0)
+            ).filter(
+                LLMChamada.prova_id == prova_id
+            ).group_by(
+                LLMChamada.etapa, LLMChamada.provedor, LLMChamada.modelo
+            ).order_by(LLMChamada.etapa, LLMChamada.modelo).all()
+            
+            keys = ["chamadas", "falhas", "failovers", "tokens_prompt", "tokens_resposta",
+                    "tokens_cache", "latencia_ms", "custo_usd"]
+            total = {key: 0 for key in keys}
+            por_etapa = []
+            for etapa, provedor, modelo, *values in rows:
+                item = dict(zip(keys, values))
+                item["custo_usd"] = round(float(item["custo_usd"]), 6)
+                for key in keys:
+                    total[key] += item[key]
+                por_etapa.append({"etapa": etapa, "provedor": provedor, "modelo": modelo, **item})
+            total["custo_usd"] = round(total["custo_usd"], 6)
+            
+            return {"prova_id": prova_id, "total": total, "por_etapa": por_etapa}
+        finally:
+            db.close()
+    
     def get_questoes_nao_formatadas_count(self) -> int:
         """Retorna a quantidade de questões não formatadas"""
         db = self._get_db()
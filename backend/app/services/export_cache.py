@@ -0,0 +1,103 @@
+from app.config import settings
+from typing import List, Dict, Optional
+from io import BytesIO
+import glob
+import hashlib
+import json
+import os
+import tempfile
+
+# Mudanças no layout das exportações devem incrementar a versão (invalida todo o cache)
+EXPORT_VERSION = 2
+
+EXTENSOES = {"pdf": "pdf", "word": "docx"}
+
+
+class ExportCache:
+    """
+    Cache em disco das exportações de provas (PDF e Word)
+    
+    A chave é prova_id + formato + impressão digital do conteúdo exportado
+    (nome da prova; id, número, ordem, texto e texto formatado das questões;
+    id, questão, hash e caminho das imagens associadas a questões). Questões
+    editadas ou reformatadas e imagens remapeadas mudam a impressão digital,
+    então o arquivo antigo deixa de ser usado sem invalidação explícita. A
+    impressão digital também é o ETag das respostas.
+    """
+    
+    def __init__(self):
+        self.enabled = settings.export_cache_enabled
+        self.cache_dir = settings.export_cache_dir
+    
+    def fingerprint(self, prova: Dict, questoes: List[Dict], imagens: Optional[List[Dict]] = None) -> str:
+        conteudo = {
+            "versao": EXPORT_VERSION,
+            "nome": prova.get("nome"),
+            "questoes": [
+                [q.get("id"), q.get("numero"), q.get("ordem"), q.get("texto"), q.get("texto_formatado"), q.get("formatado")]
+                for q in questoes
+            ],
+            "imagens": [
+                [img.get("id"), img.get("questao_id"), img.get("hash_imagem"), img.get("caminho_arquivo")]
+                for img in imagens or [] if img.get("questao_id") is not None
+            ]
+        }
+        serializado = json.dumps(conteudo, ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(serializado.encode("utf-8")).hexdigest()[:32]
+    
+    def _path(self, prova_id: int, formato: str, fingerprint: str) -> str:
+        return os.path.join(self.cache_dir, f"prova_{prova_id}", f"{formato}_{fingerprint}.{EXTENSOES[formato]}")
+    
+    def get(self, prova_id: int, formato: str, fingerprint: str) -> Optional[str]:
+        """Caminho da exportação em cache (None se ausente ou cache desativado)"""
+        if not self.enabled:
+            return None
+        path = self._path(prova_id, formato, fingerprint)
+        return path if os.path.exists(path) else None
+    
+    def store(self, prova_id: int, formato: str, fingerprint: str, buffer: BytesIO) -> Optional[str]:
+        """
+        Grava a exportação (escrita atômica) e remove versões antigas do mesmo formato
+        
+        Returns:
+            Caminho do arquivo em cache, ou None se o cache está desativado ou a gravação falhou
+        """
+        if not self.enabled:
+            return None
+        path = self._path(prova_id, formato, fingerprint)
+        directory = os.path.dirname(path)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(buffer.getbuffer())
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"⚠️ Erro ao gravar exportação em cache: {e}")
+            return None
+        
+        for antigo in glob.glob(os.path.join(directory, f"{formato}_*.{EXTENSOES[formato]}")):
+            if antigo != path:
+                try:
+                    os.remove(antigo)
+                except OSError:
+                    pass
+        return path
+    
+    @staticmethod
+    def etag(fingerprint: str) -> str:
+        return f'"{fingerprint}"'
+    
+    @staticmethod
+    def matches(if_none_match: Optional[str], fingerprint: str) -> bool:
+        """If-None-Match contém o ETag (aceita lista, W/ e *)"""
+        if not if_none_match:
+            return False
+        for tag in if_none_match.split(","):
+            tag = tag.strip()
+            if tag == "*" or tag.removeprefix("W/") == f'"{fingerprint}"':
+                return True
+        return False
+
+
+export_cache = ExportCache()
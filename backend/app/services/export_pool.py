@@ -0,0 +1,82 @@
+from app.config import settings
+from app.services.export_service import render_export
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+import asyncio
+import functools
+import multiprocessing
+
+
+class ExportPoolBusy(Exception):
+    """Fila de exportações cheia (a rota responde 503)"""
+    pass
+
+
+class ExportPool:
+    """
+    Geração das exportações (reportlab / python-docx) fora do event loop
+    
+    As exportações são CPU-bound: executadas direto na rota, travam todas as
+    outras requisições do worker do uvicorn. Aqui elas rodam em um pool de
+    processos limitado (EXPORT_WORKERS), criado na primeira exportação com
+    "spawn" (seguro com as threads do servidor). Com EXPORT_WORKERS=0 a
+    exportação roda no threadpool do servidor, que libera o event loop mas
+    disputa o GIL com as demais requisições.
+    
+    No máximo EXPORT_MAX_PENDING exportações aguardam ou executam ao mesmo
+    tempo; quem espera mais que EXPORT_QUEUE_TIMEOUT recebe ExportPoolBusy.
+    """
+    
+    def __init__(self):
+        self.max_workers = settings.export_workers
+        self.max_pending = settings.export_max_pending
+        self.queue_timeout = settings.export_queue_timeout
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+    
+    def _get_executor(self) -> Optional[ProcessPoolExecutor]:
+        if self.max_workers <= 0:
+            return None
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+            print(f"✅ Pool de exportação iniciado ({self.max_workers} processos)")
+        return self._executor
+    
+    async def render(self, metodo: str, **kwargs) -> bytes:
+        """
+        Executa export_service.<metodo>(**kwargs) fora do event loop
+        
+        Returns:
+            Bytes do documento gerado
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_pending)
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise ExportPoolBusy(f"{self.max_pending} exportações em andamento")
+        
+        try:
+            loop = asyncio.get_running_loop()
+            call = functools.partial(render_export, metodo, **kwargs)
+            try:
+                return await loop.run_in_executor(self._get_executor(), call)
+            except BrokenProcessPool:
+                # Um processo do pool morreu (ex.: OOM): recria o pool na próxima exportação
+                print("⚠️ Pool de exportação quebrado, será recriado")
+                self._executor = None
+                raise
+        finally:
+            self._semaphore.release()
+    
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+export_pool = ExportPool()
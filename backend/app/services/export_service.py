@@ -2,25 +2,119 @@
 Serviço para exportar questões em PDF e Word
 """
 import os
-from typing import List, Dict, Optional
+import hashlib
+import tempfile
+from typing import List, Dict, Optional, Tuple
 from io import BytesIO
+from PIL import Image
 from reportlab.lib.pagesizes import letter, A4
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak, Image as PDFImage
 from reportlab.lib.enums import TA_LEFT, TA_JUSTIFY
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from docx import Document
 from docx.shared import Pt, Inches
 from docx.enum.text import WD_ALIGN_PARAGRAPH
+from app.config import settings
+from app.services.image_processor import image_processor
+
+# Altura máxima de uma imagem em relação à área útil da página
+MAX_IMAGE_HEIGHT_RATIO = 0.6
+# Largura útil (polegadas) coberta pelas derivadas: a maior entre o PDF (A4) e o Word
+PRINT_WIDTH_INCHES = 6.5
 
 
 class ExportService:
     """Serviço para exportar questões em diferentes formatos"""
     
     def __init__(self):
-        pass
+        self.images_dir = settings.export_images_dir
+        self.image_dpi = settings.export_image_dpi
+    
+    def _images_by_questao(self, imagens: Optional[List[Dict]]) -> Dict[int, List[Dict]]:
+        """Imagens agrupadas por questao_id (imagens sem questão não entram nas exportações)"""
+        por_questao = {}
+        for imagem in imagens or []:
+            if imagem.get("questao_id") is not None:
+                por_questao.setdefault(imagem["questao_id"], []).append(imagem)
+        return por_questao
+    
+    def _local_image_path(self, caminho_arquivo: Optional[str]) -> Optional[str]:
+        """Arquivo local de uma imagem salva por save_image_file (URL .../images/<arquivo>)"""
+        if not caminho_arquivo:
+            return None
+        _, separator, relative = caminho_arquivo.partition("/images/")
+        path = os.path.join(settings.images_dir, relative) if separator else caminho_arquivo
+        return path if os.path.exists(path) else None
+    
+    def get_print_image(self, imagem: Dict) -> Optional[Tuple[str, int, int]]:
+        """
+        Derivada da imagem para impressão, em cache por hash da imagem
+        
+        A mesma derivada (largura útil da página na resolução configurada)
+        serve ao PDF e ao Word. Só a primeira exportação decodifica e
+        redimensiona o original; as seguintes leem apenas o cabeçalho da derivada.
+        
+        Returns:
+            (caminho, largura_px, altura_px) ou None se a imagem não está disponível
+        """
+        caminho_arquivo = imagem.get("caminho_arquivo") or ""
+        chave = imagem.get("hash_imagem") or hashlib.md5(caminho_arquivo.encode("utf-8")).hexdigest()
+        path = os.path.join(self.images_dir, f"{chave}_{self.image_dpi}dpi.jpg")
+        
+        if not os.path.exists(path):
+            original = self._local_image_path(caminho_arquivo)
+            if not original:
+                print(f"⚠️ Imagem {imagem.get('id')} não encontrada para exportação: {caminho_arquivo}")
+                return None
+            with open(original, "rb") as f:
+                derivada = image_processor.create_print_image(f.read(), round(PRINT_WIDTH_INCHES * self.image_dpi))
+            if not derivada:
+                return None
+            # Escrita atômica: outros processos do pool podem gerar a mesma derivada
+            os.makedirs(self.images_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.images_dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(derivada)
+            os.replace(tmp_path, path)
+        
+        with Image.open(path) as img:
+            width, height = img.size
+        return path, width, height
+    
+    def _fit(self, width_px: int, height_px: int, max_width: float, max_height: float) -> Tuple[float, float]:
+        """Tamanho de impressão (polegadas) na resolução configurada, limitado à área disponível"""
+        width, height = width_px / self.image_dpi, height_px / self.image_dpi
+        scale = min(1.0, max_width / width, max_height / height)
+        return width * scale, height * scale
+    
+    def _pdf_images(self, imagens: List[Dict], frame_width: float, frame_height: float) -> List:
+        """Flowables das imagens de uma questão (dimensões do frame em pontos)"""
+        flowables = []
+        for imagem in imagens:
+            derivada = self.get_print_image(imagem)
+            if not derivada:
+                continue
+            path, width_px, height_px = derivada
+            width, height = self._fit(width_px, height_px, frame_width / 72, frame_height / 72 * MAX_IMAGE_HEIGHT_RATIO)
+            flowables.append(PDFImage(path, width=width * inch, height=height * inch))
+            flowables.append(Spacer(1, 0.15*inch))
+        return flowables
+    
+    def _word_images(self, doc: Document, imagens: List[Dict]):
+        """Adiciona as imagens de uma questão ao documento Word"""
+        section = doc.sections[-1]
+        usable_width = (section.page_width - section.left_margin - section.right_margin) / 914400
+        usable_height = (section.page_height - section.top_margin - section.bottom_margin) / 914400
+        for imagem in imagens:
+            derivada = self.get_print_image(imagem)
+            if not derivada:
+                continue
+            path, width_px, height_px = derivada
+            width, _ = self._fit(width_px, height_px, usable_width, usable_height * MAX_IMAGE_HEIGHT_RATIO)
+            doc.add_picture(path, width=Inches(width))
     
     def export_to_pdf(self, questoes: List[Dict], imagens: List[Dict] = None, 
                      prova_nome: str = "Prova") -> BytesIO:
@@ -89,7 +183,8 @@ class ExportService:
         story.append(Paragraph(f"<b>{prova_nome}</b>", title_style))
         story.append(Spacer(1, 0.2*inch))
         
-        # Adicionar questões
+        # Adicionar questões (com as imagens associadas a cada uma)
+        imagens_por_questao = self._images_by_questao(imagens)
         for questao in questoes:
             numero = questao.get("numero", questao.get("ordem", 0))
             texto = questao.get("texto", "")
@@ -108,6 +203,7 @@ class ExportService:
             texto_html = texto_html.replace('>', '&gt;')
             
             story.append(Paragraph(texto_html, questao_text_style))
+            story.extend(self._pdf_images(imagens_por_questao.get(questao.get("id"), []), doc.width, doc.height))
             story.append(Spacer(1, 0.3*inch))
         
         # Construir PDF
@@ -142,7 +238,8 @@ class ExportService:
         title = doc.add_heading(prova_nome, 0)
         title.alignment = WD_ALIGN_PARAGRAPH.LEFT
         
-        # Adicionar questões
+        # Adicionar questões (com as imagens associadas a cada uma)
+        imagens_por_questao = self._images_by_questao(imagens)
         for questao in questoes:
             numero = questao.get("numero", questao.get("ordem", 0))
             texto = questao.get("texto", "")
@@ -154,6 +251,7 @@ class ExportService:
             # Texto da questão
             para = doc.add_paragraph(texto)
             para.alignment = WD_ALIGN_PARAGRAPH.JUSTIFY
+            self._word_images(doc, imagens_por_questao.get(questao.get("id"), []))
             
             # Espaço entre questões
             doc.add_paragraph()
@@ -195,4 +293,6 @@ class ExportService:
 export_service = ExportService()
 
 
-
+def render_export(metodo: str, **kwargs) -> bytes:
+    """Executa um método de exportação e devolve os bytes (usado nos processos do export_pool)"""
+    return getattr(export_service, metodo)(**kwargs).getvalue()
@@ -1,20 +1,135 @@
 from app.services.image_processor import image_processor
-from typing import List, Dict, Set
+from app.services.memory_monitor import load_image_bytes
+from app.config import settings
+from collections import OrderedDict
+from typing import List, Dict, Set, Tuple, Optional
 
 
-class ImageDeduplicator:
+class DedupSession:
+    """
+    Estado de deduplicação de uma única tarefa (prova)
+    
+    Criada no início do processamento e descartada ao final, para que hashes de
+    provas anteriores não se acumulem no processo do worker.
+    """
+    
     def __init__(self):
         self.processed_hashes: Set[str] = set()
         self.processed_perceptual_hashes: List[Dict] = []
+        # (índice da banda, valor da banda) -> posições em processed_perceptual_hashes
+        self._band_index: Dict[Tuple[int, int], List[int]] = {}
+    
+    def __enter__(self) -> "DedupSession":
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.clear()
+    
+    def clear(self):
+        """Libera o estado acumulado da sessão"""
+        self.processed_hashes.clear()
+        self.processed_perceptual_hashes.clear()
+        self._band_index.clear()
+    
+    def is_exact_duplicate(self, md5_hash: str) -> bool:
+        return md5_hash in self.processed_hashes
+    
+    def find_similar(self, perceptual_hash: str) -> Optional[Tuple[Dict, float]]:
+        """Retorna (imagem já vista, similaridade) se houver uma visualmente similar"""
+        for existing in self._candidates(perceptual_hash):
+            existing_hash = existing.get("perceptual_hash")
+            if existing_hash:
+                similarity = image_processor.calculate_similarity(perceptual_hash, existing_hash)
+                if similarity >= image_processor.similarity_threshold:
+                    return existing, similarity
+        return None
+    
+    def add(self, md5_hash: str, perceptual_hash: Optional[str], page: int, index: int):
+        """Registra uma imagem aceita na sessão"""
+        if perceptual_hash:
+            position = len(self.processed_perceptual_hashes)
+            self.processed_perceptual_hashes.append({
+                "perceptual_hash": perceptual_hash,
+                "page": page,
+                "index": index
+            })
+            for band in self._bands(perceptual_hash) or []:
+                self._band_index.setdefault(band, []).append(position)
+        self.processed_hashes.add(md5_hash)
+    
+    def _bands(self, perceptual_hash: str) -> Optional[List[Tuple[int, int]]]:
+        """Bandas do pHash, ou None se a busca por bandas não garantir todos os similares"""
+        if len(perceptual_hash) * 4 != image_processor.phash_bits:
+            return None
+        if image_processor.max_hamming_distance() >= image_processor.phash_bands:
+            return None
+        hash_int = image_processor.perceptual_hash_to_int(perceptual_hash)
+        if hash_int is None:
+            return None
+        return list(enumerate(image_processor.split_hash_bands(hash_int)))
+    
+    def _candidates(self, perceptual_hash: str) -> List[Dict]:
+        """Imagens que compartilham ao menos uma banda (ou todas, se não for possível usar bandas)"""
+        bands = self._bands(perceptual_hash)
+        if bands is None:
+            return self.processed_perceptual_hashes
+        positions = set()
+        for band in bands:
+            positions.update(self._band_index.get(band, ()))
+        return [self.processed_perceptual_hashes[p] for p in sorted(positions)]
+
+
+class RecentImageCache:
+    """
+    Cache LRU limitado de imagens já salvas (MD5 -> registro), para reutilização
+    entre provas sem consultar o banco a cada imagem
+    """
+    
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
     
-    def filter_duplicate_images(self, images: List[Dict], pages_info: List[Dict] = None) -> List[Dict]:
+    def get(self, md5_hash: Optional[str], prova_id: int) -> Optional[Dict]:
+        """Busca imagem salva por outra prova (None se ausente ou da própria prova)"""
+        if not md5_hash or self.max_size <= 0:
+            return None
+        entry = self._entries.get(md5_hash)
+        if entry is None or entry.get("prova_id") == prova_id:
+            return None
+        self._entries.move_to_end(md5_hash)
+        return entry
+    
+    def put(self, md5_hash: Optional[str], entry: Dict):
+        if not md5_hash or self.max_size <= 0:
+            return
+        self._entries[md5_hash] = entry
+        self._entries.move_to_end(md5_hash)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class ImageDeduplicator:
+    def session(self) -> DedupSession:
+        """Cria uma sessão de deduplicação para uma tarefa (use com 'with')"""
+        return DedupSession()
+    
+    def filter_duplicate_images(self, images: List[Dict], pages_info: List[Dict] = None,
+                                session: Optional[DedupSession] = None) -> List[Dict]:
         """
         Filtra imagens duplicadas usando múltiplas estratégias:
         1. Hash MD5 (duplicatas exatas)
         2. Perceptual hash (similaridade visual)
         3. Tamanho mínimo
         4. Posição (cabeçalho/rodapé)
+        
+        Sem sessão informada, a deduplicação vale apenas para esta chamada.
         """
+        if session is None:
+            session = DedupSession()
+        
         filtered_images = []
         page_heights = {}
         
@@ -31,7 +146,7 @@ class ImageDeduplicator:
                         page_heights[page_num] = bbox["y1"] - bbox["y0"]
         
         for img_data in images:
-            image_bytes = img_data.get("image_bytes")
+            image_bytes = load_image_bytes(img_data)
             if not image_bytes:
                 continue
             
@@ -51,35 +166,21 @@ class ImageDeduplicator:
             
             # 3. Verificar hash MD5 (duplicatas exatas)
             md5_hash = image_processor.calculate_hash_md5(image_bytes)
-            if md5_hash in self.processed_hashes:
+            if session.is_exact_duplicate(md5_hash):
                 print(f"⚠️ Imagem {img_data.get('index', '?')} da página {page_num} é duplicata exata (MD5), ignorando")
                 continue
             
             # 4. Verificar similaridade visual (perceptual hash)
             perceptual_hash = image_processor.calculate_perceptual_hash(image_bytes)
             if perceptual_hash:
-                is_duplicate = False
-                for existing in self.processed_perceptual_hashes:
-                    existing_hash = existing.get("perceptual_hash")
-                    if existing_hash:
-                        similarity = image_processor.calculate_similarity(perceptual_hash, existing_hash)
-                        if similarity >= image_processor.similarity_threshold:
-                            print(f"⚠️ Imagem {img_data.get('index', '?')} da página {page_num} é similar ({similarity:.1f}%) à imagem da página {existing.get('page', '?')}, ignorando")
-                            is_duplicate = True
-                            break
-                
-                if is_duplicate:
+                similar = session.find_similar(perceptual_hash)
+                if similar:
+                    existing, similarity = similar
+                    print(f"⚠️ Imagem {img_data.get('index', '?')} da página {page_num} é similar ({similarity:.1f}%) à imagem da página {existing.get('page', '?')}, ignorando")
                     continue
-                
-                # Adicionar aos processados
-                self.processed_perceptual_hashes.append({
-                    "perceptual_hash": perceptual_hash,
-                    "page": page_num,
-                    "index": img_data.get("index", 0)
-                })
             
-            # 5. Adicionar hash MD5 aos processados
-            self.processed_hashes.add(md5_hash)
+            # 5. Adicionar hashes aos processados
+            session.add(md5_hash, perceptual_hash, page_num, img_data.get("index", 0))
             
             # 6. Adicionar metadados de hash à imagem
             img_data["md5_hash"] = md5_hash
@@ -93,3 +194,5 @@ class ImageDeduplicator:
 
 image_deduplicator = ImageDeduplicator()
 
+# Imagens salvas recentemente neste worker (reutilização entre provas, tamanho limitado)
+recent_images = RecentImageCache(settings.dedup_cache_size)
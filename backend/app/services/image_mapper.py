@@ -0,0 +1,124 @@
+from typing import List, Dict, Tuple, Optional
+import bisect
+
+
+class ImageMapper:
+    """
+    Mapeia imagens às questões pela geometria da página
+    
+    Cada questão ocupa a região que vai do seu marcador inicial ("1.", "Questão 2:")
+    até o marcador da próxima questão, em ordem de leitura (página, coluna, topo).
+    Uma imagem pertence à região que contém o seu topo. Apenas imagens sem
+    região definida são consideradas ambíguas.
+    """
+    
+    def __init__(self):
+        self.max_page_gap = 1  # Questão pode continuar no máximo até a página seguinte
+        self.top_tolerance = 2.0  # Tolerância (pt) entre o topo da imagem e o marcador
+    
+    def map_images_to_questoes(self, questoes: List[Dict], images: List[Dict],
+                               pages_text: List[Dict]) -> Tuple[List[Dict], List[int]]:
+        """
+        Associa imagens às questões sem chamada à IA
+        
+        Returns:
+            (imagens com questao_id/questao_numero preenchidos, índices das imagens ambíguas)
+        """
+        questao_ids = {q.get("numero"): q.get("id") for q in questoes if q.get("numero") is not None}
+        pages = {page.get("page"): page for page in pages_text}
+        two_column_pages = {
+            page_num for page_num, page in pages.items()
+            if self._is_two_column(page)
+        }
+        
+        anchors = self._ordered_anchors(pages_text, questao_ids, two_column_pages)
+        anchor_keys = [key for key, _ in anchors]
+        
+        ambiguous = []
+        for img_index, img in enumerate(images):
+            page_num = img.get("page", 1)
+            bbox = img.get("bbox")
+            
+            if bbox:
+                column = self._column(bbox.get("x0", 0), bbox.get("x1", 0), pages.get(page_num), two_column_pages)
+                key = (page_num, column, bbox.get("y0", 0) + self.top_tolerance)
+            else:
+                # Sem posição: só é possível decidir se a página inteira pertence a uma questão
+                if any(anchor_page == page_num for (anchor_page, _, _), _ in anchors):
+                    ambiguous.append(img_index)
+                    continue
+                key = (page_num, 0, 0.0)
+            
+            position = bisect.bisect_right(anchor_keys, key) - 1
+            if position < 0:
+                ambiguous.append(img_index)
+                continue
+            
+            (anchor_page, _, _), numero = anchors[position]
+            if page_num - anchor_page > self.max_page_gap:
+                ambiguous.append(img_index)
+                continue
+            
+            img["questao_id"] = questao_ids.get(numero)
+            img["questao_numero"] = numero
+        
+        return images, ambiguous
+    
+    def questao_pages(self, questoes: List[Dict], pages_text: List[Dict]) -> Dict[int, int]:
+        """Página em que cada questão começa (número -> página), segundo os marcadores"""
+        questao_ids = {q.get("numero"): q.get("id") for q in questoes if q.get("numero") is not None}
+        two_column_pages = {page.get("page") for page in pages_text if self._is_two_column(page)}
+        return {
+            numero: page_num
+            for (page_num, _, _), numero in self._ordered_anchors(pages_text, questao_ids, two_column_pages)
+        }
+    
+    def _ordered_anchors(self, pages_text: List[Dict], questao_ids: Dict[int, Optional[int]],
+                         two_column_pages: set) -> List[Tuple[Tuple[int, int, float], int]]:
+        """
+        Marcadores de questões em ordem de leitura
+        
+        Mantém apenas números de questões conhecidas e em sequência crescente, o que
+        descarta itens numerados dentro dos enunciados.
+        """
+        anchors = []
+        last_numero = None
+        for page in sorted(pages_text, key=lambda p: p.get("page", 0)):
+            page_num = page.get("page", 1)
+            page_anchors = []
+            for anchor in page.get("anchors") or []:
+                column = self._column(anchor["x0"], anchor["x0"], page, two_column_pages)
+                page_anchors.append(((page_num, column, anchor["top"]), anchor["numero"]))
+            page_anchors.sort(key=lambda item: item[0])
+            
+            for key, numero in page_anchors:
+                if numero not in questao_ids:
+                    continue
+                if last_numero is not None and numero <= last_numero:
+                    continue
+                anchors.append((key, numero))
+                last_numero = numero
+        return anchors
+    
+    def _is_two_column(self, page: Dict) -> bool:
+        """Página em duas colunas: há marcadores de questão nas duas metades"""
+        middle = self._page_middle(page)
+        if middle is None:
+            return False
+        anchors = page.get("anchors") or []
+        return any(a["x0"] < middle for a in anchors) and any(a["x0"] >= middle for a in anchors)
+    
+    def _column(self, x0: float, x1: float, page: Optional[Dict], two_column_pages: set) -> int:
+        if not page or page.get("page") not in two_column_pages:
+            return 0
+        middle = self._page_middle(page)
+        return 1 if (x0 + x1) / 2 >= middle else 0
+    
+    def _page_middle(self, page: Dict) -> Optional[float]:
+        bbox = page.get("bbox")
+        if isinstance(bbox, (list, tuple)) and len(bbox) >= 4:
+            return (bbox[0] + bbox[2]) / 2
+        return None
+
+
+image_mapper = ImageMapper()
@@ -10,6 +10,8 @@ class ImageProcessor:
         self.supported_formats = ['PNG', 'JPEG', 'JPG']
         self.min_image_size = 50  # Tamanho mínimo em pixels
         self.similarity_threshold = 95  # Similaridade mínima para considerar duplicata (%)
+        self.phash_bits = 64  # pHash com hash_size=8
+        self.phash_bands = 4  # Bandas de 16 bits para busca por multi-index hashing
     
     def process_image(self, image_bytes: bytes, format: str = 'PNG') -> bytes:
         """Processa e otimiza imagem"""
@@ -34,6 +36,46 @@ class ImageProcessor:
             print(f"Erro ao processar imagem: {e}")
             return image_bytes
     
+    def create_thumbnail(self, image_bytes: bytes, width: int) -> Optional[bytes]:
+        """Gera miniatura JPEG com a largura informada (nunca amplia a imagem)"""
+        try:
+            img = Image.open(io.BytesIO(image_bytes))
+            if img.mode != 'RGB':
+                img = img.convert('RGB')
+            if img.width > width:
+                height = max(1, round(img.height * width / img.width))
+                img = img.resize((width, height), Image.LANCZOS)
+            output = io.BytesIO()
+            img.save(output, format='JPEG', quality=85, optimize=True)
+            return output.getvalue()
+        except Exception as e:
+            print(f"Erro ao gerar miniatura: {e}")
+            return None
+    
+    def create_print_image(self, image_bytes: bytes, max_width: int) -> Optional[bytes]:
+        """
+        Derivada para impressão (exportações): fundo branco no lugar da
+        transparência, largura limitada a max_width e JPEG de alta qualidade
+        """
+        try:
+            img = Image.open(io.BytesIO(image_bytes))
+            if img.mode in ('RGBA', 'LA', 'P'):
+                img = img.convert('RGBA')
+                background = Image.new('RGB', img.size, (255, 255, 255))
+                background.paste(img, mask=img.split()[-1])
+                img = background
+            elif img.mode != 'RGB':
+                img = img.convert('RGB')
+            if img.width > max_width:
+                height = max(1, round(img.height * max_width / img.width))
+                img = img.resize((max_width, height), Image.LANCZOS)
+            output = io.BytesIO()
+            img.save(output, format='JPEG', quality=90, optimize=True)
+            return output.getvalue()
+        except Exception as e:
+            print(f"Erro ao gerar imagem para impressão: {e}")
+            return None
+    
     def get_image_dimensions(self, image_bytes: bytes) -> Dict[str, int]:
         """Obtém dimensões da imagem"""
         try:
@@ -92,6 +134,32 @@ class ImageProcessor:
             print(f"Erro ao calcular similaridade: {e}")
             return 0.0
     
+    def max_hamming_distance(self) -> int:
+        """Distância de Hamming máxima entre pHashes equivalente ao limiar de similaridade"""
+        return int(self.phash_bits * (100 - self.similarity_threshold) / 100)
+    
+    def perceptual_hash_to_int(self, hash_hex: Optional[str]) -> Optional[int]:
+        """Converte o pHash hexadecimal em inteiro com sinal de 64 bits (compatível com BIGINT)"""
+        if not hash_hex:
+            return None
+        try:
+            value = int(hash_hex, 16)
+        except ValueError:
+            return None
+        if value >= 1 << (self.phash_bits - 1):
+            value -= 1 << self.phash_bits
+        return value
+    
+    def split_hash_bands(self, hash_int: int) -> List[int]:
+        """Divide o pHash (inteiro de 64 bits) em bandas de 16 bits"""
+        unsigned = hash_int & ((1 << self.phash_bits) - 1)
+        band_bits = self.phash_bits // self.phash_bands
+        mask = (1 << band_bits) - 1
+        return [
+            (unsigned >> (band_bits * (self.phash_bands - 1 - i))) & mask
+            for i in range(self.phash_bands)
+        ]
+    
     def is_image_too_small(self, image_bytes: bytes) -> bool:
         """Verifica se a imagem é muito pequena (provavelmente ícone)"""
         try:
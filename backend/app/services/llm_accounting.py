@@ -0,0 +1,106 @@
+from app.services.db_service import db_service
+from app.services.metrics import llm_calls_total, llm_latency, llm_tokens_total
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+# Prova e etapa do pipeline em andamento (marcam cada chamada à IA registrada)
+_prova_id: ContextVar[Optional[int]] = ContextVar("llm_prova_id", default=None)
+_etapa: ContextVar[Optional[str]] = ContextVar("llm_etapa", default=None)
+
+# Preço em USD por 1 milhão de tokens: (entrada, entrada em cache, saída).
+# A busca é por prefixo do nome do modelo, do mais específico para o mais genérico.
+MODEL_PRICES = {
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4-turbo": (10.00, 10.00, 30.00),
+    "gpt-4": (30.00, 30.00, 60.00),
+    "gpt-3.5-turbo": (0.50, 0.50, 1.50),
+    "gemini-1.5-pro": (1.25, 0.3125, 5.00),
+    "gemini-1.5-flash": (0.075, 0.01875, 0.30),
+    "gemini-1.0-pro": (0.50, 0.50, 1.50),
+    "gemini-pro": (0.50, 0.50, 1.50),
+}
+
+
+def set_llm_context(prova_id: Optional[int] = None, etapa: Optional[str] = None):
+    """Define a prova e/ou a etapa atual para as próximas chamadas à IA"""
+    if prova_id is not None:
+        _prova_id.set(prova_id)
+    if etapa is not None:
+        _etapa.set(etapa)
+
+
+def clear_llm_context():
+    """Limpa o contexto ao final da tarefa (o processo do worker é reutilizado)"""
+    _prova_id.set(None)
+    _etapa.set(None)
+
+
+@contextmanager
+def llm_context(prova_id: Optional[int] = None, etapa: Optional[str] = None):
+    """Contexto temporário (restaura os valores anteriores ao sair)"""
+    tokens = []
+    if prova_id is not None:
+        tokens.append((_prova_id, _prova_id.set(prova_id)))
+    if etapa is not None:
+        tokens.append((_etapa, _etapa.set(etapa)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+def current_llm_context() -> Dict[str, Optional[object]]:
+    return {"prova_id": _prova_id.get(), "etapa": _etapa.get()}
+
+
+def estimate_cost(model: Optional[str], prompt_tokens: Optional[int], completion_tokens: Optional[int],
+                  cached_tokens: Optional[int] = None) -> Optional[float]:
+    """Custo estimado em USD (None se o modelo não tiver preço conhecido ou sem uso informado)"""
+    if not model or prompt_tokens is None or completion_tokens is None:
+        return None
+    prices = None
+    for prefix in sorted(MODEL_PRICES, key=len, reverse=True):
+        if model.startswith(prefix):
+            prices = MODEL_PRICES[prefix]
+            break
+    if prices is None:
+        return None
+    input_price, cached_price, output_price = prices
+    cached = min(cached_tokens or 0, prompt_tokens)
+    cost = ((prompt_tokens - cached) * input_price + cached * cached_price + completion_tokens * output_price) / 1_000_000
+    return round(cost, 6)
+
+
+def record_llm_call(provider: Optional[str], model: Optional[str], usage: Optional[Dict],
+                    latency_ms: int, retries: int, success: bool, failover: bool = False,
+                    error: Optional[str] = None):
+    """Registra uma chamada à IA no banco (falhas no registro nunca interrompem o pipeline)"""
+    usage = usage or {}
+    context = current_llm_context()
+    llm_calls_total.labels(provedor=provider, etapa=context["etapa"] or "", sucesso=str(success).lower()).inc()
+    llm_latency.labels(provedor=provider).observe(latency_ms / 1000)
+    for tipo, key in (("prompt", "prompt_tokens"), ("resposta", "completion_tokens"), ("cache", "cached_tokens")):
+        if usage.get(key):
+            llm_tokens_total.labels(provedor=provider, tipo=tipo).inc(usage[key])
+    try:
+        db_service.create_llm_chamada(
+            prova_id=context["prova_id"],
+            etapa=context["etapa"],
+            provedor=provider,
+            modelo=model,
+            tokens_prompt=usage.get("prompt_tokens"),
+            tokens_resposta=usage.get("completion_tokens"),
+            tokens_cache=usage.get("cached_tokens"),
+            latencia_ms=latency_ms,
+            tentativas=retries + 1,
+            failover=failover,
+            sucesso=success,
+            erro=error[:500] if error else None,
+            custo_usd=estimate_cost(model, usage.get("prompt_tokens"), usage.get("completion_tokens"),
+                                    usage.get("cached_tokens"))
+        )
+    except Exception as e:
+        print(f"⚠️ Erro ao registrar chamada à IA: {e}")
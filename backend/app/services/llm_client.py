@@ -0,0 +1,410 @@
+import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+import httpx
+import openai
+from openai import OpenAI
+from app.config import settings
+from app.services.llm_accounting import record_llm_call
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import List, Dict, Optional
+import os
+import random
+import threading
+import time
+
+
+class LLMUnavailableError(Exception):
+    """Nenhum provedor de IA respondeu (falhas, circuito aberto ou prazo esgotado)"""
+
+
+class ProviderSaturatedError(Exception):
+    """Todas as threads do provedor estão presas em chamadas que excederam o prazo"""
+
+
+class CircuitBreaker:
+    """
+    Circuito por provedor: após falhas consecutivas, para de chamar o provedor
+    por um tempo (aberto) e depois libera uma única chamada de teste (meio aberto)
+    """
+    
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_progress = False
+        self._lock = threading.Lock()
+    
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_timeout or self._trial_in_progress:
+                return False
+            self._trial_in_progress = True
+            return True
+    
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_progress = False
+    
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_progress = False
+            if self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    print(f"⚡ Circuito {self.name} aberto após {self.failures} falhas")
+                self.opened_at = time.monotonic()
+    
+    def trip(self):
+        """Abre o circuito imediatamente (provedor sem capacidade para novas chamadas)"""
+        with self._lock:
+            self.failures = max(self.failures, self.failure_threshold)
+            self._trial_in_progress = False
+            if self.opened_at is None:
+                print(f"⚡ Circuito {self.name} aberto (provedor saturado)")
+            self.opened_at = time.monotonic()
+    
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "fechado"
+        return "meio_aberto" if time.monotonic() - self.opened_at >= self.reset_timeout else "aberto"
+
+
+class LLMClient:
+    """
+    Cliente compartilhado para OpenAI e Gemini
+    
+    Cada chamada tem prazo (timeout por tentativa e prazo total, compartilhado
+    entre os provedores), novas tentativas com backoff exponencial e jitter para
+    erros transitórios (429, 5xx, timeout, conexão) e um circuito por provedor;
+    se o provedor preferido falhar ou estiver com o circuito aberto, a chamada
+    passa para o outro enquanto houver prazo para ao menos uma tentativa. Cada
+    tentativa sem resposta conta como falha no circuito, e o circuito do Gemini
+    abre de imediato quando todas as suas threads estão presas em chamadas que
+    estouraram o prazo.
+    
+    O cliente HTTP da OpenAI (pool de conexões httpx) é criado no primeiro uso em
+    cada processo, nunca herdado de um fork do worker.
+    """
+    
+    OPENAI = "openai"
+    GEMINI = "gemini"
+    
+    def __init__(self):
+        self.timeout = settings.llm_timeout
+        self.deadline = settings.llm_call_deadline
+        self.max_retries = settings.llm_max_retries
+        self.backoff_base = settings.llm_backoff_base
+        self.backoff_max = settings.llm_backoff_max
+        self.breakers = {
+            self.OPENAI: CircuitBreaker(self.OPENAI, settings.llm_breaker_failures, settings.llm_breaker_reset),
+            self.GEMINI: CircuitBreaker(self.GEMINI, settings.llm_breaker_failures, settings.llm_breaker_reset)
+        }
+        
+        self._openai_client: Optional[OpenAI] = None
+        self._gemini_executor: Optional[ThreadPoolExecutor] = None
+        self._gemini_stuck = 0  # Chamadas ao Gemini que excederam o prazo e ainda ocupam uma thread
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+        
+        # Configurar Gemini (tentar modelos mais recentes primeiro)
+        self.gemini_model = None
+        self.gemini_model_name = None
+        try:
+            if settings.gemini_api_endpoint:
+                # Endpoint alternativo (ex.: servidor falso de benchmarks) só funciona via REST
+                genai.configure(
+                    api_key=settings.gemini_api_key,
+                    transport="rest",
+                    client_options={"api_endpoint": settings.gemini_api_endpoint}
+                )
+            else:
+                genai.configure(api_key=settings.gemini_api_key)
+            # Tentar modelos mais recentes primeiro (ordem de preferência)
+            # Gemini 2.0 é experimental, Gemini 1.5 Pro é mais estável e poderoso
+            model_names = [
+                'gemini-3.0-pro',        # Mais recente (se disponível)
+                'gemini-2.5-pro',        # Versão 2.5 Pro (se disponível)
+                'gemini-2.0-flash-exp',  # Mais recente experimental
+                'gemini-1.5-pro',        # Mais poderoso e estável
+                'gemini-1.5-flash',      # Mais rápido
+                'gemini-1.0-pro',        # Fallback
+                'gemini-pro'              # Último fallback
+            ]
+            for model_name in model_names:
+                try:
+                    # Testar se o modelo funciona criando o objeto
+                    test_model = genai.GenerativeModel(model_name)
+                    self.gemini_model = test_model
+                    self.gemini_model_name = model_name
+                    print(f"✅ Modelo Gemini configurado: {model_name}")
+                    break
+                except Exception as e:
+                    print(f"⚠️ Modelo {model_name} não disponível: {e}")
+                    continue
+            
+            if self.gemini_model is None:
+                print("⚠️ Nenhum modelo Gemini disponível. Usando apenas ChatGPT.")
+        except Exception as e:
+            print(f"⚠️ Gemini não configurado: {e}. Usando apenas ChatGPT.")
+    
+    @property
+    def openai_client(self) -> OpenAI:
+        """Cliente OpenAI do processo atual (pool httpx, sem retries próprios do SDK)"""
+        self._ensure_process_resources()
+        return self._openai_client
+    
+    def _ensure_process_resources(self):
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            http_client = httpx.Client(
+                timeout=httpx.Timeout(self.timeout, connect=settings.llm_connect_timeout),
+                limits=httpx.Limits(
+                    max_connections=settings.llm_max_connections,
+                    max_keepalive_connections=settings.llm_max_connections
+                )
+            )
+            self._openai_client = OpenAI(
+                api_key=settings.openai_api_key,
+                base_url=settings.openai_base_url,
+                http_client=http_client,
+                max_retries=0,  # Novas tentativas controladas aqui
+                timeout=self.timeout
+            )
+            self._gemini_executor = ThreadPoolExecutor(
+                max_workers=settings.llm_max_connections,
+                thread_name_prefix="gemini"
+            )
+            self._gemini_stuck = 0
+            self._pid = pid
+    
+    def generate(self, prompt: str, system_prompt: Optional[str] = None, prefer: str = OPENAI,
+                 openai_model: Optional[str] = None, response_format: Optional[Dict] = None,
+                 temperature: float = 0.3, max_tokens: Optional[int] = None) -> Dict:
+        """
+        Gera uma resposta com o provedor preferido, passando para o outro em caso de falha
+        
+        Returns:
+            {"content", "finish_reason" ("stop"/"length"/...), "refusal", "provider",
+             "model", "usage", "retries"}
+        
+        Raises:
+            LLMUnavailableError: nenhum provedor respondeu
+        """
+        providers = [prefer] + [p for p in (self.OPENAI, self.GEMINI) if p != prefer]
+        last_error: Optional[Exception] = None
+        # Prazo total da chamada, compartilhado entre os provedores (o failover não o reinicia)
+        deadline = time.monotonic() + self.deadline
+        
+        for provider in providers:
+            if provider == self.GEMINI and self.gemini_model is None:
+                continue
+            if last_error is not None and deadline - time.monotonic() < self.timeout:
+                print(f"   ⏱️ Prazo da chamada esgotado, sem failover para {provider}")
+                break
+            breaker = self.breakers[provider]
+            if not breaker.allow():
+                print(f"   ⚡ Circuito {provider} aberto, pulando provedor")
+                continue
+            
+            if provider == self.OPENAI:
+                call = lambda: self._call_openai(prompt, system_prompt, openai_model or "gpt-4o",
+                                                 response_format, temperature, max_tokens)
+            else:
+                call = lambda: self._call_gemini(prompt, system_prompt, temperature, max_tokens)
+            
+            stats = {"retries": 0}
+            started = time.monotonic()
+            try:
+                result = self._with_retries(provider, call, stats, deadline)
+                breaker.record_success()
+                if provider != prefer:
+                    print(f"   🔀 Resposta obtida via {provider} (failover de {prefer})")
+                record_llm_call(provider, result["model"], result["usage"],
+                                int((time.monotonic() - started) * 1000), stats["retries"],
+                                success=True, failover=provider != prefer)
+                return result
+            except Exception as e:
+                last_error = e
+                if isinstance(e, ProviderSaturatedError):
+                    breaker.trip()
+                elif self._is_retryable(e):
+                    breaker.record_failure()
+                else:
+                    # O provedor respondeu (erro da requisição, não indisponibilidade)
+                    breaker.record_success()
+                print(f"   ⚠️ Falha no provedor {provider}: {type(e).__name__}: {e}")
+                model = (openai_model or "gpt-4o") if provider == self.OPENAI else self.gemini_model_name
+                record_llm_call(provider, model, None, int((time.monotonic() - started) * 1000),
+                                stats["retries"], success=False, failover=provider != prefer,
+                                error=f"{type(e).__name__}: {e}")
+        
+        raise LLMUnavailableError(f"Nenhum provedor de IA disponível (último erro: {last_error})")
+    
+    def _with_retries(self, provider: str, call, stats: Dict, deadline: float) -> Dict:
+        """Executa a chamada com backoff exponencial + jitter, até o prazo (time.monotonic()) informado"""
+        attempt = 0
+        while True:
+            stats["retries"] = attempt
+            try:
+                result = call()
+                result["retries"] = attempt
+                return result
+            except Exception as e:
+                if not self._is_retryable(e) or attempt >= self.max_retries:
+                    raise
+                delay = self._retry_after(e)
+                if delay is None:
+                    # Full jitter: espera aleatória até o teto exponencial
+                    delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+                if time.monotonic() + delay + self.timeout > deadline:
+                    raise
+                if isinstance(e, TimeoutError):
+                    # Cada tentativa sem resposta conta para o circuito (a última é contada em generate)
+                    breaker = self.breakers[provider]
+                    breaker.record_failure()
+                    if breaker.state != "fechado":
+                        raise
+                attempt += 1
+                print(f"   🔁 {provider}: {type(e).__name__}, nova tentativa {attempt}/{self.max_retries} em {delay:.1f}s")
+                time.sleep(delay)
+    
+    def probe_openai(self, model: str, timeout: float) -> Dict:
+        """
+        Chamada mínima a um modelo OpenAI (detecção do modelo disponível)
+        
+        Sem novas tentativas nem failover (o resultado precisa ser deste modelo),
+        mas registrada como as demais chamadas.
+        """
+        started = time.monotonic()
+        try:
+            result = self._call_openai("test", None, model, None, 0.0, 5, timeout=timeout)
+        except Exception as e:
+            record_llm_call(self.OPENAI, model, None, int((time.monotonic() - started) * 1000), 0,
+                            success=False, error=f"{type(e).__name__}: {e}")
+            raise
+        record_llm_call(self.OPENAI, result["model"], result["usage"],
+                        int((time.monotonic() - started) * 1000), 0, success=True)
+        return result
+    
+    def _call_openai(self, prompt: str, system_prompt: Optional[str], model: str,
+                     response_format: Optional[Dict], temperature: float,
+                     max_tokens: Optional[int], timeout: Optional[float] = None) -> Dict:
+        messages: List[Dict] = []
+        if system_prompt:
+            messages.append({"role": "system", "content": system_prompt})
+        messages.append({"role": "user", "content": prompt})
+        
+        request_params = {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature
+        }
+        if response_format:
+            request_params["response_format"] = response_format
+        if max_tokens:
+            request_params["max_tokens"] = max_tokens
+        
+        client = self.openai_client if timeout is None else self.openai_client.with_options(timeout=timeout)
+        response = client.chat.completions.create(**request_params)
+        choice = response.choices[0]
+        usage = getattr(response, "usage", None)
+        details = getattr(usage, "prompt_tokens_details", None) if usage else None
+        return {
+            "content": choice.message.content or "",
+            "finish_reason": choice.finish_reason,
+            "refusal": getattr(choice.message, "refusal", None),
+            "provider": self.OPENAI,
+            "model": getattr(response, "model", None) or model,
+            "usage": {
+                "prompt_tokens": getattr(usage, "prompt_tokens", None),
+                "completion_tokens": getattr(usage, "completion_tokens", None),
+                "cached_tokens": getattr(details, "cached_tokens", None) if details else None
+            }
+        }
+    
+    def _call_gemini(self, prompt: str, system_prompt: Optional[str], temperature: float,
+                     max_tokens: Optional[int]) -> Dict:
+        self._ensure_process_resources()
+        contents = f"{system_prompt}\n\n{prompt}" if system_prompt else prompt
+        generation_config = {"temperature": temperature}
+        if max_tokens:
+            generation_config["max_output_tokens"] = max_tokens
+        
+        # O SDK do Gemini (0.3.1) não aceita timeout: o prazo é aplicado aguardando em
+        # outra thread. Uma chamada que estoura o prazo continua ocupando a thread até o
+        # SDK retornar; com todas as threads presas, novas chamadas só ficariam na fila
+        with self._lock:
+            if self._gemini_stuck >= settings.llm_max_connections:
+                raise ProviderSaturatedError(f"{self._gemini_stuck} chamadas ao Gemini presas após o prazo")
+        future = self._gemini_executor.submit(
+            self.gemini_model.generate_content, contents, generation_config=generation_config
+        )
+        try:
+            response = future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            if not future.cancel():
+                with self._lock:
+                    self._gemini_stuck += 1
+                future.add_done_callback(self._release_gemini_thread)
+            raise TimeoutError(f"Gemini não respondeu em {self.timeout:.0f}s")
+        
+        finish_reason = "stop"
+        candidates = getattr(response, "candidates", None) or []
+        if candidates and getattr(candidates[0].finish_reason, "name", "") == "MAX_TOKENS":
+            finish_reason = "length"
+        usage = getattr(response, "usage_metadata", None)
+        return {
+            "content": response.text,
+            "finish_reason": finish_reason,
+            "refusal": None,
+            "provider": self.GEMINI,
+            "model": self.gemini_model_name,
+            "usage": {
+                "prompt_tokens": getattr(usage, "prompt_token_count", None),
+                "completion_tokens": getattr(usage, "candidates_token_count", None),
+                "cached_tokens": getattr(usage, "cached_content_token_count", None)
+            }
+        }
+    
+    def _release_gemini_thread(self, future):
+        """Chamada presa terminou (com resposta descartada ou erro): a thread volta a ficar livre"""
+        with self._lock:
+            self._gemini_stuck = max(0, self._gemini_stuck - 1)
+    
+    def _is_retryable(self, error: Exception) -> bool:
+        """Erros transitórios: limite de taxa, indisponibilidade, timeout e conexão"""
+        if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError,
+                              openai.RateLimitError, openai.InternalServerError)):
+            return True
+        if isinstance(error, openai.APIStatusError):
+            return error.status_code in (408, 409, 429) or error.status_code >= 500
+        if isinstance(error, (google_exceptions.TooManyRequests, google_exceptions.ResourceExhausted,
+                              google_exceptions.ServiceUnavailable, google_exceptions.InternalServerError,
+                              google_exceptions.DeadlineExceeded)):
+            return True
+        return isinstance(error, (TimeoutError, httpx.TimeoutException, httpx.TransportError))
+    
+    def _retry_after(self, error: Exception) -> Optional[float]:
+        """Espera pedida pelo provedor (cabeçalho Retry-After), limitada ao teto do backoff"""
+        response = getattr(error, "response", None)
+        headers = getattr(response, "headers", None)
+        if not headers:
+            return None
+        try:
+            return min(float(headers.get("retry-after")), self.backoff_max)
+        except (TypeError, ValueError):
+            return None
+
+
+llm_client = LLMClient()
@@ -0,0 +1,103 @@
+from app.models.llm import QuestaoLLM, QUESTOES_JSON_SCHEMA
+from pydantic import ValidationError
+from typing import List, Dict, Optional, Tuple
+import json
+
+
+def questoes_response_format(structured_output: bool, json_mode: bool) -> Optional[Dict]:
+    """response_format da OpenAI: schema estrito quando suportado, senão JSON mode"""
+    if structured_output:
+        return {"type": "json_schema", "json_schema": QUESTOES_JSON_SCHEMA}
+    if json_mode:
+        return {"type": "json_object"}
+    return None
+
+
+def parse_questoes_response(content: str) -> Dict:
+    """
+    Interpreta a resposta {"questoes": [...]} da IA, validando item a item
+    
+    Itens inválidos não descartam os demais: vão para "falhas" (com o número,
+    quando identificável) para serem pedidos de novo. Se o JSON estiver cortado
+    (limite de tokens), os itens completos antes do corte são aproveitados e
+    "completo" fica False.
+    
+    Returns:
+        {"questoes": [dicts válidos], "falhas": [{"numero", "erro"}], "completo": bool}
+    """
+    content = _strip_code_fence(content or "")
+    items, completo = _decode_items(content)
+    
+    questoes = []
+    falhas = []
+    for item in items:
+        try:
+            questoes.append(QuestaoLLM.model_validate(item).model_dump(exclude_none=True))
+        except ValidationError as e:
+            falhas.append({"numero": _numero_from_item(item), "erro": _short_error(e)})
+    
+    return {"questoes": questoes, "falhas": falhas, "completo": completo}
+
+
+def _strip_code_fence(content: str) -> str:
+    """Remove cerca de markdown (```json ... ```) de modelos sem JSON mode"""
+    content = content.strip()
+    if content.startswith("```"):
+        content = content.split("\n", 1)[1] if "\n" in content else ""
+        if content.rstrip().endswith("```"):
+            content = content.rstrip()[:-3]
+    return content.strip()
+
+
+def _decode_items(content: str) -> Tuple[List, bool]:
+    """Itens da lista "questoes" e se a resposta estava completa"""
+    try:
+        result = json.loads(content)
+    except json.JSONDecodeError:
+        return _decode_partial_items(content), False
+    
+    if isinstance(result, dict) and isinstance(result.get("questoes"), list):
+        return result["questoes"], True
+    if isinstance(result, list):
+        return result, True
+    return [], False
+
+
+def _decode_partial_items(content: str) -> List:
+    """Decodifica, um a um, os itens completos de uma lista "questoes" truncada"""
+    decoder = json.JSONDecoder()
+    key = content.find('"questoes"')
+    start = content.find("[", key if key != -1 else 0)
+    if start == -1:
+        return []
+    
+    items = []
+    position = start + 1
+    while position < len(content):
+        while position < len(content) and content[position] in " \t\r\n,":
+            position += 1
+        if position >= len(content) or content[position] == "]":
+            break
+        try:
+            item, position = decoder.raw_decode(content, position)
+        except json.JSONDecodeError:
+            break
+        items.append(item)
+    return items
+
+
+def _numero_from_item(item) -> Optional[int]:
+    if not isinstance(item, dict):
+        return None
+    try:
+        numero = int(item.get("numero"))
+    except (TypeError, ValueError):
+        return None
+    return numero if numero >= 1 else None
+
+
+def _short_error(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in detail['loc'])}: {detail['msg']}"
+        for detail in error.errors()
+    )
@@ -0,0 +1,124 @@
+from typing import List, Dict, Optional
+import os
+import resource
+import sys
+import tracemalloc
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+MB = 1024 * 1024
+
+
+def current_rss_bytes() -> int:
+    """Memória residente atual do processo (Linux: /proc; demais: pico do processo)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return lifetime_peak_rss_bytes()
+
+
+def lifetime_peak_rss_bytes() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss é em bytes no macOS e em KB no Linux
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _reset_peak_rss() -> bool:
+    """Zera o pico de RSS do processo (VmHWM), disponível no Linux"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_bytes() -> int:
+    """Pico de RSS desde o último reset (VmHWM) ou, sem suporte, do processo inteiro"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return lifetime_peak_rss_bytes()
+
+
+class MemoryMonitor:
+    """
+    Memória por etapa de uma tarefa: RSS ao final, pico de RSS e, opcionalmente,
+    pico de alocações Python (tracemalloc, que deixa a tarefa mais lenta)
+    
+    Também verifica o orçamento de memória da tarefa, usado para ativar o modo
+    de pouca memória.
+    """
+    
+    def __init__(self, budget_mb: int = 0, use_tracemalloc: bool = False):
+        self.budget_bytes = budget_mb * MB
+        self.use_tracemalloc = use_tracemalloc
+        self._owns_tracing = False
+        self.stages: Dict[str, Dict[str, Optional[float]]] = {}
+        if use_tracemalloc and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._owns_tracing = True
+    
+    def begin_stage(self):
+        _reset_peak_rss()
+        if self.use_tracemalloc and tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+    
+    def end_stage(self, etapa: str):
+        python_peak = tracemalloc.get_traced_memory()[1] if self.use_tracemalloc and tracemalloc.is_tracing() else None
+        previous = self.stages.get(etapa, {})
+        self.stages[etapa] = {
+            "rss_mb": round(current_rss_bytes() / MB, 1),
+            "rss_pico_mb": round(max(_peak_rss_bytes() / MB, previous.get("rss_pico_mb") or 0), 1),
+            "python_pico_mb": round(max(python_peak / MB, previous.get("python_pico_mb") or 0), 1)
+            if python_peak is not None else None
+        }
+    
+    def over_budget(self) -> bool:
+        return bool(self.budget_bytes) and current_rss_bytes() > self.budget_bytes
+    
+    def peak_mb(self) -> float:
+        return max((stage["rss_pico_mb"] for stage in self.stages.values()), default=0.0)
+    
+    def stop(self):
+        if self._owns_tracing:
+            tracemalloc.stop()
+            self._owns_tracing = False
+
+
+def spill_images(images: List[Dict], directory: str) -> int:
+    """
+    Modo de pouca memória: grava os bytes das imagens em disco e os retira da lista
+    
+    Returns:
+        Bytes liberados da memória
+    """
+    os.makedirs(directory, exist_ok=True)
+    freed = 0
+    for img_data in images:
+        image_bytes = img_data.pop("image_bytes", None)
+        if image_bytes is None:
+            continue
+        # Página e índice identificam a imagem no PDF
+        path = os.path.join(directory, f"pagina_{img_data.get('page')}_{img_data.get('index')}.{img_data.get('ext', 'bin')}")
+        with open(path, "wb") as f:
+            f.write(image_bytes)
+        img_data["image_path"] = path
+        freed += len(image_bytes)
+    return freed
+
+
+def load_image_bytes(img_data: Dict) -> Optional[bytes]:
+    """Bytes da imagem, em memória ou gravados em disco pelo modo de pouca memória"""
+    image_bytes = img_data.get("image_bytes")
+    if image_bytes is not None:
+        return image_bytes
+    path = img_data.get("image_path")
+    if not path:
+        return None
+    with open(path, "rb") as f:
+        return f.read()
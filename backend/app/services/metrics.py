@@ -0,0 +1,167 @@
+"""
+Métricas no formato Prometheus (pipeline de processamento, IA, OCR e banco)
+
+Com vários processos (workers prefork do Celery, vários workers do uvicorn),
+defina PROMETHEUS_MULTIPROC_DIR antes de iniciar: cada processo grava suas
+métricas nesse diretório e a exportação soma todos eles.
+"""
+from prometheus_client import (
+    CollectorRegistry, Counter, Gauge, Histogram, REGISTRY,
+    CONTENT_TYPE_LATEST, generate_latest, multiprocess, start_http_server
+)
+from app.services.memory_monitor import MemoryMonitor
+from typing import Dict, Optional, Tuple
+import os
+import time
+
+MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+if MULTIPROC_DIR:
+    # O prometheus_client grava os arquivos .db já ao criar as métricas abaixo. A
+    # limpeza de execuções anteriores fica no comando do container, antes do Python
+    os.makedirs(MULTIPROC_DIR, exist_ok=True)
+
+# Etapas do process_pdf_task (rótulo "etapa" do histograma)
+PIPELINE_STAGES = [
+    "ocr",
+    "extracao_pdf",
+    "extracao_questoes",
+    "validacao",
+    "salvar_questoes",
+    "filtrar_imagens",
+    "mapear_imagens",
+    "salvar_imagens",
+    "finalizacao",
+]
+
+STAGE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+stage_duration = Histogram(
+    "pdf_stage_duration_seconds",
+    "Duração de cada etapa do processamento de uma prova",
+    ["etapa"],
+    buckets=STAGE_BUCKETS
+)
+task_duration = Histogram(
+    "pdf_task_duration_seconds",
+    "Duração total do processamento de uma prova",
+    ["status"],
+    buckets=STAGE_BUCKETS + (1200, 1800)
+)
+tasks_total = Counter("pdf_tasks_total", "Provas processadas", ["status"])
+tasks_in_progress = Gauge(
+    "pdf_tasks_in_progress",
+    "Provas em processamento",
+    multiprocess_mode="livesum"
+)
+pages_total = Counter("pdf_pages_total", "Páginas processadas")
+images_total = Counter(
+    "pdf_images_total",
+    "Imagens por etapa (extraidas, unicas, reutilizadas, salvas)",
+    ["tipo"]
+)
+ocr_calls_total = Counter("ocr_calls_total", "Chamadas ao OCR (Tesseract)", ["sucesso"])
+llm_calls_total = Counter("llm_calls_total", "Chamadas à IA", ["provedor", "etapa", "sucesso"])
+llm_latency = Histogram(
+    "llm_call_duration_seconds",
+    "Duração das chamadas à IA (incluindo novas tentativas)",
+    ["provedor"],
+    buckets=(0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 180)
+)
+llm_tokens_total = Counter("llm_tokens_total", "Tokens consumidos na IA", ["provedor", "tipo"])
+db_writes_total = Counter("db_writes_total", "Escritas no banco", ["tabela"])
+stage_peak_rss = Gauge(
+    "pdf_stage_peak_rss_bytes",
+    "Pico de memória residente (RSS) na última execução de cada etapa",
+    ["etapa"],
+    multiprocess_mode="max"
+)
+low_memory_total = Counter("pdf_low_memory_mode_total", "Tarefas que entraram no modo de pouca memória")
+export_cache_total = Counter(
+    "export_cache_total",
+    "Exportações de provas por resultado do cache (hit, miss, nao_modificado)",
+    ["resultado"]
+)
+
+# Séries de todas as etapas existem desde o início (zeradas), não só após a primeira prova
+for _etapa in PIPELINE_STAGES:
+    stage_duration.labels(etapa=_etapa)
+
+
+class PipelineTimer:
+    """
+    Cronômetro das etapas de uma tarefa
+    
+    stage() encerra a etapa anterior (registrando sua duração e, com um
+    MemoryMonitor, a memória) e inicia a próxima, sem reindentar o código da
+    tarefa em blocos with.
+    """
+    
+    def __init__(self, memory: Optional[MemoryMonitor] = None):
+        self.started = time.perf_counter()
+        self._current: Optional[Tuple[str, float, float]] = None
+        self.durations = {}
+        self.cpu_durations = {}
+        self.memory = memory
+        tasks_in_progress.inc()
+    
+    def stage(self, etapa: str):
+        self._close_stage()
+        if self.memory:
+            self.memory.begin_stage()
+        self._current = (etapa, time.perf_counter(), time.process_time())
+    
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Tempo de parede e de CPU (do processo) por etapa, em segundos, e memória (MB)"""
+        return {
+            etapa: {
+                "parede_s": parede,
+                "cpu_s": self.cpu_durations.get(etapa, 0.0),
+                **(self.memory.stages.get(etapa, {}) if self.memory else {})
+            }
+            for etapa, parede in self.durations.items()
+        }
+    
+    def finish(self, status: str):
+        """Encerra a tarefa (status: success/error)"""
+        self._close_stage()
+        tasks_in_progress.dec()
+        tasks_total.labels(status=status).inc()
+        task_duration.labels(status=status).observe(time.perf_counter() - self.started)
+    
+    def _close_stage(self):
+        if self._current is None:
+            return
+        etapa, started, cpu_started = self._current
+        elapsed = time.perf_counter() - started
+        stage_duration.labels(etapa=etapa).observe(elapsed)
+        self.durations[etapa] = round(self.durations.get(etapa, 0.0) + elapsed, 3)
+        self.cpu_durations[etapa] = round(self.cpu_durations.get(etapa, 0.0) + time.process_time() - cpu_started, 3)
+        if self.memory:
+            self.memory.end_stage(etapa)
+            stage_peak_rss.labels(etapa=etapa).set(self.memory.stages[etapa]["rss_pico_mb"] * 1024 * 1024)
+        self._current = None
+
+
+def metrics_registry() -> CollectorRegistry:
+    """Registro a exportar: soma de todos os processos no modo multiprocesso"""
+    if not MULTIPROC_DIR:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """Corpo e content-type da resposta de /metrics"""
+    return generate_latest(metrics_registry()), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid: int):
+    """Descarta os gauges "live" de um processo filho encerrado"""
+    if MULTIPROC_DIR:
+        multiprocess.mark_process_dead(pid)
+
+
+def start_exporter(port: int):
+    """Servidor HTTP de métricas (usado pelo worker, que não tem a API)"""
+    start_http_server(port, registry=metrics_registry())
@@ -1,4 +1,5 @@
 import pytesseract
+from app.services.metrics import ocr_calls_total
 from PIL import Image
 import io
 from typing import List, Dict
@@ -25,8 +26,10 @@ class OCRService:
                 lang='por+eng',  # Português e Inglês
                 config='--psm 6'  # Assume um único bloco de texto uniforme
             )
+            ocr_calls_total.labels(sucesso="true").inc()
             return text.strip()
         except Exception as e:
+            ocr_calls_total.labels(sucesso="false").inc()
             print(f"Erro no OCR: {e}")
             return ""
     
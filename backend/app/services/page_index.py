@@ -0,0 +1,84 @@
+from typing import List, Dict, Optional, Tuple
+import bisect
+
+# Separador entre páginas no texto completo do documento
+PAGE_SEPARATOR = "\n\n"
+
+
+def compose_page_text(page_info: Dict, ocr_text_by_page: Optional[Dict[str, str]] = None) -> str:
+    """Texto da página como aparece no texto completo (texto do PDF + OCR, se houver)"""
+    page_text = page_info.get("text", "")
+    page_num = str(page_info.get("page", 1))
+    if ocr_text_by_page and page_num in ocr_text_by_page:
+        ocr_text = ocr_text_by_page[page_num]
+        if ocr_text:
+            page_text = f"{page_text}\n\n[OCR]\n{ocr_text}"
+    return page_text
+
+
+class PageIndex:
+    """
+    Índice de offsets das páginas no texto completo do documento
+    
+    Construído uma vez por documento (somas prefixadas dos tamanhos das páginas);
+    as consultas posição -> página e página -> offset são O(log n) / O(1).
+    """
+    
+    def __init__(self, page_numbers: List[int], page_lengths: List[int],
+                 separator_length: int = len(PAGE_SEPARATOR)):
+        self.page_numbers = list(page_numbers)
+        self.starts: List[int] = []
+        self.ends: List[int] = []
+        position = 0
+        for length in page_lengths:
+            self.starts.append(position)
+            self.ends.append(position + length)
+            position += length + separator_length
+        self.total_length = self.ends[-1] if self.ends else 0
+        self._index_by_page = {page: i for i, page in enumerate(self.page_numbers)}
+    
+    @classmethod
+    def from_pages(cls, pages_text: List[Dict], ocr_text_by_page: Optional[Dict[str, str]] = None) -> "PageIndex":
+        """Cria o índice a partir das páginas extraídas (mesma composição do texto completo)"""
+        return cls(
+            [page.get("page", i + 1) for i, page in enumerate(pages_text)],
+            [len(compose_page_text(page, ocr_text_by_page)) for page in pages_text]
+        )
+    
+    def page_for_position(self, position: int) -> int:
+        """
+        Página que contém a posição do texto completo
+        
+        Posições no separador pertencem à página seguinte; além do fim do texto,
+        retorna o total de páginas.
+        """
+        index = bisect.bisect_right(self.ends, position)
+        if index >= len(self.page_numbers):
+            return len(self.page_numbers)
+        return self.page_numbers[index]
+    
+    def pages_for_span(self, start: int, end: int) -> List[int]:
+        """Páginas que contêm o trecho [start, end) do texto completo, em O(log n + páginas do trecho)"""
+        if not self.page_numbers:
+            return []
+        last = len(self.page_numbers) - 1
+        first_index = min(bisect.bisect_right(self.ends, start), last)
+        last_index = min(bisect.bisect_right(self.ends, max(start, end - 1)), last)
+        return self.page_numbers[first_index:last_index + 1]
+    
+    def offset_for_page(self, page: int) -> int:
+        """Posição onde a página começa no texto completo"""
+        index = self._index_by_page.get(page)
+        if index is None:
+            raise KeyError(f"Página {page} fora do índice")
+        return self.starts[index]
+    
+    def page_span(self, page: int) -> Tuple[int, int]:
+        """(início, fim) da página no texto completo"""
+        index = self._index_by_page.get(page)
+        if index is None:
+            raise KeyError(f"Página {page} fora do índice")
+        return self.starts[index], self.ends[index]
+    
+    def __len__(self) -> int:
+        return len(self.page_numbers)
@@ -1,9 +1,11 @@
 import pdfplumber
 import fitz  # PyMuPDF
 from PIL import Image
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Optional, Iterator
 import io
 import re
+from app.services.page_index import PageIndex, PAGE_SEPARATOR, compose_page_text
+from app.services.memory_monitor import spill_images
 
 
 class PDFExtractor:
@@ -16,6 +18,18 @@ class PDFExtractor:
             re.compile(r'^\s*(\d+)\s*[–\-]\s+', re.MULTILINE),  # 1 - ou 1 –
         ]
         
+        # Linhas onde ao menos um dos padrões acima casa. O lookahead não consome o
+        # texto da linha, então nenhum início de linha é pulado; começar pelo "\n"
+        # literal deixa a busca bem mais rápida que "^" com MULTILINE.
+        questao_inicio = (
+            r'\s*(?:\d+[\.\)]\s'
+            r'|(?i:Questão)\s+\d+[\.\):]'
+            r'|(?i:Q)\.?\s*\d+[\.\):]'
+            r'|\d+\s*[–\-]\s)'
+        )
+        self.questao_first_line_pattern = re.compile(r'(?=' + questao_inicio + r')')
+        self.questao_candidates_pattern = re.compile(r'\n(?=' + questao_inicio + r')')
+        
         # Padrão para alternativas
         self.alternativa_pattern = re.compile(r'^\s*([A-E])[\.\)]\s+', re.MULTILINE)
     
@@ -29,13 +43,53 @@ class PDFExtractor:
                 pages_text.append({
                     "page": page_num,
                     "text": text,
-                    "bbox": page.bbox
+                    "bbox": page.bbox,
+                    "anchors": self.extract_questao_anchors(page)
                 })
         
         return pages_text
     
-    def extract_images(self, pdf_path: str) -> List[Dict[str, any]]:
-        """Extrai todas as imagens do PDF com suas posições"""
+    def extract_questao_anchors(self, page) -> List[Dict[str, any]]:
+        """
+        Localiza na página as linhas que iniciam questões (marcadores como "1.", "Questão 2:")
+        
+        Returns:
+            Lista de {"numero", "x0", "top"} em coordenadas da página (origem no topo)
+        """
+        anchors = []
+        try:
+            lines = page.extract_text_lines(return_chars=False)
+        except Exception as e:
+            print(f"Erro ao extrair linhas da página {page.page_number}: {e}")
+            return anchors
+        
+        for line in lines:
+            numero = self.match_questao_marker(line.get("text", ""))
+            if numero is not None:
+                anchors.append({
+                    "numero": numero,
+                    "x0": line["x0"],
+                    "top": line["top"]
+                })
+        return anchors
+    
+    def match_questao_marker(self, line_text: str) -> Optional[int]:
+        """Retorna o número da questão se a linha começar com um marcador de questão"""
+        # Quebra de linha final para padrões que exigem espaço após o marcador
+        line_text = line_text + "\n"
+        for pattern in self.questao_patterns:
+            match = pattern.match(line_text)
+            if match:
+                return int(match.group(1))
+        return None
+    
+    def extract_images(self, pdf_path: str, spill_dir: Optional[str] = None) -> List[Dict[str, any]]:
+        """
+        Extrai todas as imagens do PDF com suas posições
+        
+        Com spill_dir (modo de pouca memória), os bytes de cada imagem são gravados
+        em disco e a imagem leva apenas o caminho ("image_path").
+        """
         images = []
         doc = None
         try:
@@ -63,13 +117,16 @@ class PDFExtractor:
                                 "y1": image_rects[0].y1
                             }
                         
-                        images.append({
+                        image_data = {
                             "page": page_num + 1,
                             "image_bytes": image_bytes,
                             "ext": image_ext,
                             "bbox": bbox,
                             "index": img_index
-                        })
+                        }
+                        if spill_dir:
+                            spill_images([image_data], spill_dir)
+                        images.append(image_data)
                     except Exception as e:
                         print(f"Erro ao extrair imagem {img_index} da página {page_num + 1}: {e}")
                         continue
@@ -78,24 +135,37 @@ class PDFExtractor:
                 doc.close()
         return images
     
+    def iter_questao_boundaries(self, text: str) -> Iterator[Tuple[int, int, re.Match]]:
+        """
+        Percorre o texto uma única vez e gera (posição, número, match) em ordem
+        
+        Equivale a rodar finditer de cada padrão e ordenar os resultados: para cada
+        linha candidata, os padrões são testados na ordem da lista, respeitando o
+        fim do último match de cada padrão (como o finditer faria).
+        """
+        next_pos = [0] * len(self.questao_patterns)
+        for line_start in self._candidate_line_starts(text):
+            for i, pattern in enumerate(self.questao_patterns):
+                if line_start < next_pos[i]:
+                    continue
+                match = pattern.match(text, line_start)
+                if match:
+                    next_pos[i] = match.end()
+                    yield line_start, int(match.group(1)), match
+    
+    def _candidate_line_starts(self, text: str) -> Iterator[int]:
+        """Inícios de linha (em ordem) onde algum padrão de questão pode casar"""
+        if self.questao_first_line_pattern.match(text):
+            yield 0
+        for candidate in self.questao_candidates_pattern.finditer(text):
+            yield candidate.end()
+    
     def identify_questoes_numbers(self, text: str) -> List[Tuple[int, int, str]]:
         """Identifica números de questões no texto usando múltiplos padrões"""
-        all_matches = []
-        
-        # Coletar matches de todos os padrões
-        for pattern in self.questao_patterns:
-            matches = pattern.finditer(text)
-            for match in matches:
-                numero = int(match.group(1))
-                all_matches.append((match.start(), numero, match))
-        
-        # Ordenar por posição
-        all_matches.sort(key=lambda x: x[0])
-        
-        # Remover duplicatas (mesma posição ou muito próximas)
+        # Remover duplicatas (mesma posição ou muito próximas) durante a varredura
         unique_matches = []
         last_pos = -1
-        for pos, numero, match in all_matches:
+        for pos, numero, match in self.iter_questao_boundaries(text):
             if pos - last_pos > 10:  # Pelo menos 10 caracteres de diferença
                 unique_matches.append((pos, numero, match))
                 last_pos = pos
@@ -117,30 +187,27 @@ class PDFExtractor:
         
         return questoes
     
-    def extract_full_content(self, pdf_path: str, ocr_text_by_page: Dict[str, str] = None) -> Dict[str, any]:
-        """Extrai todo o conteúdo do PDF: texto e imagens"""
+    def extract_full_content(self, pdf_path: str, ocr_text_by_page: Dict[str, str] = None,
+                             spill_dir: Optional[str] = None) -> Dict[str, any]:
+        """Extrai todo o conteúdo do PDF: texto e imagens (em disco, com spill_dir)"""
         pages_text = self.extract_text_by_page(pdf_path)
-        images = self.extract_images(pdf_path)
+        images = self.extract_images(pdf_path, spill_dir=spill_dir)
         
         # Combinar texto do PDF com texto do OCR
-        full_text_parts = []
-        for page in pages_text:
-            page_text = page["text"]
-            page_num = str(page["page"])
-            
-            # Adicionar texto do OCR se disponível
-            if ocr_text_by_page and page_num in ocr_text_by_page:
-                ocr_text = ocr_text_by_page[page_num]
-                if ocr_text:
-                    page_text = f"{page_text}\n\n[OCR]\n{ocr_text}"
-            
-            full_text_parts.append(page_text)
+        full_text_parts = [compose_page_text(page, ocr_text_by_page) for page in pages_text]
+        full_text = PAGE_SEPARATOR.join(full_text_parts)
         
-        full_text = "\n\n".join(full_text_parts)
+        # Offsets das páginas e índice para localizar trechos no texto completo
+        # (compartilhados pelas etapas seguintes)
+        page_index = PageIndex(
+            [page["page"] for page in pages_text],
+            [len(part) for part in full_text_parts]
+        )
         
         return {
             "full_text": full_text,
             "pages_text": pages_text,
+            "page_index": page_index,
             "images": images,
             "total_pages": len(pages_text)
         }
@@ -1,6 +1,9 @@
 from app.services.pdf_extractor import pdf_extractor
 from app.services.ai_analyzer import ai_analyzer
 from app.services.ocr_service import ocr_service
+from app.services.page_index import PageIndex, PAGE_SEPARATOR, compose_page_text
+from app.services.text_chunker import text_chunker
+from app.services.text_anchor import TextAnchorIndex
 from typing import List, Dict
 import re
 
@@ -11,96 +14,96 @@ class QuestionExtractor:
     def __init__(self):
         pass
     
-    def extract_questoes_by_page(self, pages_text: List[Dict], ocr_text_by_page: Dict[str, str] = None) -> List[Dict]:
+    def extract_questoes_by_page(self, pages_text: List[Dict], ocr_text_by_page: Dict[str, str] = None,
+                                 page_index: PageIndex = None) -> List[Dict]:
         """
         Extrai questões processando cada página individualmente
         Melhor para manter contexto e rastreamento de posição
         """
         all_questoes = []
+        if page_index is None:
+            page_index = PageIndex.from_pages(pages_text, ocr_text_by_page)
         
         for page_info in pages_text:
             page_num = page_info.get("page", 1)
-            page_text = page_info.get("text", "")
-            
-            # Adicionar texto do OCR se disponível
-            if ocr_text_by_page and str(page_num) in ocr_text_by_page:
-                ocr_text = ocr_text_by_page[str(page_num)]
-                if ocr_text:
-                    page_text = f"{page_text}\n\n[OCR]\n{ocr_text}"
+            page_text = compose_page_text(page_info, ocr_text_by_page)
             
             if not page_text.strip():
                 continue
             
             # Tentar extrair questões da página usando regex
             questoes_regex = pdf_extractor.identify_questoes_numbers(page_text)
+            if not questoes_regex:
+                continue
+            
+            # Posição global da página no documento
+            global_offset = page_index.offset_for_page(page_num)
             
             for numero, pos_in_page, texto in questoes_regex:
-                # Calcular posição global no documento
-                # Soma posições das páginas anteriores
-                global_offset = sum(
-                    len(p.get("text", "")) + 2  # +2 para quebras de linha
-                    for p in pages_text
-                    if p.get("page", 0) < page_num
-                )
-                
                 all_questoes.append({
                     "numero": numero,
                     "texto": texto,
                     "posicao_inicio": global_offset + pos_in_page,
                     "posicao_fim": global_offset + pos_in_page + len(texto),
-                    "pagina": page_num
+                    "pagina": page_num,
+                    "ancorada": True
                 })
         
         return all_questoes
     
-    def extract_with_ai_by_page(self, pages_text: List[Dict], ocr_text_by_page: Dict[str, str] = None) -> List[Dict]:
+    def extract_with_ai_by_page(self, pages_text: List[Dict], ocr_text_by_page: Dict[str, str] = None,
+                                full_text: str = None, page_index: PageIndex = None,
+                                pages: List[int] = None, anchor_index: TextAnchorIndex = None) -> List[Dict]:
         """
-        Extrai questões usando IA, processando páginas em grupos menores
-        para melhor contexto
+        Extrai questões usando IA, enviando grupos de páginas inteiras
+        dentro do orçamento de tokens (páginas grandes são divididas)
+        
+        Com "pages", apenas essas páginas são enviadas à IA.
         """
-        all_questoes = []
-        pages_per_chunk = 3  # Processar 3 páginas por vez
+        if full_text is None:
+            full_text = PAGE_SEPARATOR.join(compose_page_text(page, ocr_text_by_page) for page in pages_text)
+        if page_index is None:
+            page_index = PageIndex.from_pages(pages_text, ocr_text_by_page)
         
-        for i in range(0, len(pages_text), pages_per_chunk):
-            chunk_pages = pages_text[i:i + pages_per_chunk]
-            chunk_text_parts = []
-            
-            for page_info in chunk_pages:
-                page_num = page_info.get("page", 1)
-                page_text = page_info.get("text", "")
-                
-                # Adicionar OCR se disponível
-                if ocr_text_by_page and str(page_num) in ocr_text_by_page:
-                    ocr_text = ocr_text_by_page[str(page_num)]
-                    if ocr_text:
-                        page_text = f"{page_text}\n\n[OCR]\n{ocr_text}"
-                
-                chunk_text_parts.append(f"[Página {page_num}]\n{page_text}")
-            
-            chunk_text = "\n\n".join(chunk_text_parts)
-            
-            # Tentar extrair com ChatGPT
-            try:
-                questoes_chunk = ai_analyzer.extract_questoes_with_chatgpt(chunk_text)
-                all_questoes.extend(questoes_chunk)
-            except Exception as e:
-                print(f"Erro ao extrair questões do chunk {i//pages_per_chunk + 1}: {e}")
-                # Fallback para regex
-                questoes_regex = pdf_extractor.identify_questoes_numbers(chunk_text)
-                for numero, pos, texto in questoes_regex:
-                    all_questoes.append({
-                        "numero": numero,
-                        "texto": texto,
-                        "posicao_inicio": pos,
-                        "posicao_fim": pos + len(texto)
-                    })
+        chunks = text_chunker.chunk_by_pages(full_text, page_index, pages=pages)
+        total_pages = len(pages) if pages is not None else len(pages_text)
+        print(f"📦 {len(chunks)} partes para a IA ({total_pages} páginas)")
+        if not chunks:
+            return []
+        
+        # Tentar extrair com ChatGPT
+        try:
+            return ai_analyzer.extract_questoes_with_chatgpt(
+                full_text,
+                chunks=chunks,
+                anchor_index=anchor_index,
+                page_index=page_index
+            )
+        except Exception as e:
+            print(f"Erro ao extrair questões com IA: {e}")
+        
+        # Fallback para regex, parte a parte
+        all_questoes = []
+        for chunk in chunks:
+            questoes_regex = pdf_extractor.identify_questoes_numbers(chunk["texto"])
+            for numero, pos, texto in questoes_regex:
+                all_questoes.append({
+                    "numero": numero,
+                    "texto": texto,
+                    "posicao_inicio": chunk["inicio"] + pos,
+                    "posicao_fim": chunk["inicio"] + pos + len(texto),
+                    "pagina": page_index.page_for_position(chunk["inicio"] + pos),
+                    "ancorada": True
+                })
         
         return all_questoes
     
     def merge_and_deduplicate_questoes(self, questoes_list: List[List[Dict]]) -> List[Dict]:
         """
         Mescla múltiplas listas de questões e remove duplicatas
-        Mantém a questão com mais texto quando há duplicatas
+        
+        Entre duplicatas, prefere a questão localizada no documento ("ancorada")
+        que cobre o maior trecho do texto original; o tamanho do texto só desempata.
         """
         merged = {}
         
@@ -112,14 +115,17 @@ class QuestionExtractor:
                 
                 if numero not in merged:
                     merged[numero] = questao
-                else:
-                    # Se já existe, manter a que tem mais texto
-                    existing = merged[numero]
-                    if len(questao.get("texto", "")) > len(existing.get("texto", "")):
-                        merged[numero] = questao
+                elif self._source_span_key(questao) > self._source_span_key(merged[numero]):
+                    merged[numero] = questao
         
         # Ordenar por número
         return sorted(merged.values(), key=lambda x: x.get("numero", 0))
+    
+    def _source_span_key(self, questao: Dict) -> tuple:
+        """Chave de preferência: (posição confiável, tamanho do trecho no documento, tamanho do texto)"""
+        ancorada = bool(questao.get("ancorada"))
+        span = questao.get("posicao_fim", 0) - questao.get("posicao_inicio", 0) if ancorada else 0
+        return (ancorada, span, len(questao.get("texto", "")))
 
 
 question_extractor = QuestionExtractor()
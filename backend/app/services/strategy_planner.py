@@ -0,0 +1,174 @@
+from app.config import settings
+from app.services.page_index import PageIndex
+from app.services.text_chunker import text_chunker
+from collections import Counter
+from typing import List, Dict
+import math
+import re
+import statistics
+
+
+class StrategyPlanner:
+    """
+    Decide quais estratégias de IA são necessárias a partir do resultado do regex
+    
+    Cada questão encontrada pelo regex recebe uma avaliação de completude
+    (alternativas, tamanho, numeração repetida) e a sequência de números é
+    verificada em busca de lacunas. A IA só é chamada para as páginas com
+    problemas; em provas limpas as estratégias de IA e a validação são puladas.
+    """
+    
+    def __init__(self):
+        self.min_confidence = settings.planner_min_confidence
+        self.min_questao_chars = 40  # Abaixo disso a questão provavelmente foi cortada
+        self.max_questao_chars = 6000  # Acima disso (e muito maior que a mediana) provavelmente são questões unidas
+        self.max_gap = 10  # Maior sequência de números ausentes tratada como lacuna
+        self.validation_batch_size = 30  # Mesmo tamanho de lote de ai_analyzer.validate_with_chatgpt
+        # Alternativas no início da linha ou após espaço: "A)", "(B)", "c."
+        self.alternativa_pattern = re.compile(r'(?:^|(?<=\s))\(?([A-Ea-e])[\)\.]\s', re.MULTILINE)
+    
+    def evaluate_questoes(self, questoes: List[Dict]) -> Dict:
+        """
+        Avalia a completude das questões extraídas pelo regex
+        
+        Returns:
+            {"questoes": {numero: [problemas]}, "lacunas": [números ausentes],
+             "alternativas_esperadas": int, "confianca": float}
+        """
+        if not questoes:
+            return {"questoes": {}, "lacunas": [], "alternativas_esperadas": 0, "confianca": 0.0}
+        
+        alternativas = {}
+        for questao in questoes:
+            alternativas[id(questao)] = self._count_alternativas(questao.get("texto", ""))
+        
+        # Número de alternativas mais comum na prova (provas sem alternativas não são penalizadas)
+        counts = Counter(count for count in alternativas.values() if count >= 2)
+        alternativas_esperadas = counts.most_common(1)[0][0] if counts else 0
+        
+        tamanhos = [len(q.get("texto", "")) for q in questoes]
+        limite_tamanho = max(self.max_questao_chars, 5 * statistics.median(tamanhos))
+        repetidos = {numero for numero, total in Counter(q.get("numero") for q in questoes).items() if total > 1}
+        
+        problemas_por_questao = {}
+        for questao in questoes:
+            numero = questao.get("numero")
+            problemas = []
+            if alternativas[id(questao)] < alternativas_esperadas:
+                problemas.append("alternativas")
+            tamanho = len(questao.get("texto", ""))
+            if tamanho < self.min_questao_chars or tamanho > limite_tamanho:
+                problemas.append("tamanho")
+            if numero in repetidos:
+                problemas.append("numero_repetido")
+            if problemas:
+                problemas_por_questao.setdefault(numero, []).extend(problemas)
+        
+        numeros = sorted({q.get("numero") for q in questoes if q.get("numero") is not None})
+        lacunas = []
+        for anterior, seguinte in zip(numeros, numeros[1:]):
+            if seguinte - anterior - 1 > self.max_gap:
+                # Salto grande: mais provável um número solto no texto (ano, item) que questões perdidas
+                problemas_por_questao.setdefault(seguinte, []).append("numeracao")
+            else:
+                lacunas.extend(range(anterior + 1, seguinte))
+        
+        esperadas = len(numeros) + len(lacunas)
+        completas = len(numeros) - len(problemas_por_questao)
+        confianca = max(0.0, completas / esperadas) if esperadas else 0.0
+        
+        return {
+            "questoes": problemas_por_questao,
+            "lacunas": lacunas,
+            "alternativas_esperadas": alternativas_esperadas,
+            "confianca": round(confianca, 3)
+        }
+    
+    def plan(self, questoes_regex: List[Dict], pages_text: List[Dict], full_text: str,
+             page_index: PageIndex) -> Dict:
+        """
+        Planeja as estratégias seguintes a partir do resultado do regex
+        
+        Returns:
+            Dicionário com a avaliação, as páginas que vão para a IA, se o texto
+            completo e a validação devem ser executados, e as chamadas evitadas
+        """
+        all_pages = [page.get("page", i + 1) for i, page in enumerate(pages_text)]
+        # Contagens estimadas pelos tamanhos (só informativas): o corte real fica para as etapas
+        chunks_todas_paginas = text_chunker.estimate_page_chunks(page_index)
+        chunks_texto_completo = text_chunker.estimate_chunks(len(full_text))
+        lotes_validacao = math.ceil(len(questoes_regex) / self.validation_batch_size)
+        
+        avaliacao = self.evaluate_questoes(questoes_regex)
+        
+        if not settings.adaptive_strategies or not questoes_regex:
+            motivo = "planejamento desativado" if not settings.adaptive_strategies else "regex não encontrou questões"
+            return {
+                "avaliacao": avaliacao,
+                "motivo": motivo,
+                "paginas_ia": all_pages,
+                "texto_completo": True,
+                "validar": None,
+                "chamadas_previstas": chunks_todas_paginas + chunks_texto_completo + lotes_validacao,
+                "chamadas_evitadas": 0
+            }
+        
+        paginas_ia = self._pages_with_problems(questoes_regex, avaliacao, all_pages)
+        texto_completo = avaliacao["confianca"] < self.min_confidence
+        validar = sorted(avaliacao["questoes"])
+        
+        chunks_paginas = text_chunker.estimate_page_chunks(page_index, pages=paginas_ia) if paginas_ia else 0
+        # Questões que a IA pode trazer das páginas com problema também passam pela validação
+        lotes_previstos = math.ceil(len(validar) / self.validation_batch_size) if (validar or paginas_ia) else 0
+        chamadas_previstas = chunks_paginas + (chunks_texto_completo if texto_completo else 0) + lotes_previstos
+        chamadas_sem_plano = chunks_todas_paginas + chunks_texto_completo + lotes_validacao
+        
+        if texto_completo:
+            motivo = f"confiança {avaliacao['confianca']:.0%} abaixo de {self.min_confidence:.0%}"
+        elif paginas_ia:
+            motivo = f"{len(avaliacao['questoes'])} questões com problemas e {len(avaliacao['lacunas'])} números ausentes"
+        else:
+            motivo = "regex completo"
+        
+        return {
+            "avaliacao": avaliacao,
+            "motivo": motivo,
+            "paginas_ia": paginas_ia,
+            "texto_completo": texto_completo,
+            "validar": validar,
+            "chamadas_previstas": chamadas_previstas,
+            "chamadas_evitadas": max(0, chamadas_sem_plano - chamadas_previstas)
+        }
+    
+    def _count_alternativas(self, texto: str) -> int:
+        """Quantas alternativas consecutivas a partir de A aparecem no texto"""
+        letras = {match.group(1).upper() for match in self.alternativa_pattern.finditer(texto)}
+        count = 0
+        for letra in "ABCDE":
+            if letra not in letras:
+                break
+            count += 1
+        return count
+    
+    def _pages_with_problems(self, questoes: List[Dict], avaliacao: Dict, all_pages: List[int]) -> List[int]:
+        """Páginas que precisam da IA: questões com problemas (e a página seguinte) e lacunas na numeração"""
+        paginas = set()
+        questoes_ordenadas = sorted(
+            (q for q in questoes if q.get("numero") is not None and q.get("pagina") is not None),
+            key=lambda q: q["numero"]
+        )
+        
+        for questao in questoes_ordenadas:
+            if questao["numero"] in avaliacao["questoes"]:
+                # A questão pode continuar na página seguinte
+                paginas.update((questao["pagina"], questao["pagina"] + 1))
+        
+        lacunas = set(avaliacao["lacunas"])
+        for anterior, seguinte in zip(questoes_ordenadas, questoes_ordenadas[1:]):
+            if any(numero in lacunas for numero in range(anterior["numero"] + 1, seguinte["numero"])):
+                paginas.update(range(anterior["pagina"], seguinte["pagina"] + 1))
+        
+        return [page for page in all_pages if page in paginas]
+
+
+strategy_planner = StrategyPlanner()
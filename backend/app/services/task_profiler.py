@@ -0,0 +1,119 @@
+from app.config import settings
+from typing import List, Dict, Optional
+from datetime import datetime
+import cProfile
+import json
+import os
+import pstats
+import re
+
+# task_id do Celery (uuid) e nomes aceitos nos caminhos dos perfis
+SAFE_NAME = re.compile(r'^[\w-]+$')
+
+
+class TaskProfiler:
+    """
+    Perfil de CPU (cProfile) opcional do processamento de uma prova
+    
+    Ativado por upload (perfilar=true) ou para todas as tarefas (PROFILE_TASKS).
+    Cada execução gera, em profiles/prova_<id>/, o arquivo <task_id>.prof
+    (pstats, abre no snakeviz) e <task_id>.json com o tempo de parede e de CPU
+    por etapa e as funções mais custosas.
+    """
+    
+    def __init__(self):
+        self.profiles_dir = settings.profiles_dir
+        self.top_functions = settings.profile_top_functions
+    
+    def start(self, requested: bool = False) -> Optional[cProfile.Profile]:
+        """Inicia o perfil se pedido no upload ou ativado por configuração (None se desativado)"""
+        if not (requested or settings.profile_tasks):
+            return None
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+    
+    def save(self, profiler: cProfile.Profile, prova_id: int, task_id: str,
+             etapas: Dict[str, Dict[str, float]], status: str) -> Optional[Dict]:
+        """Encerra o perfil e grava os artefatos (falhas aqui nunca interrompem a tarefa)"""
+        profiler.disable()
+        try:
+            directory = os.path.join(self.profiles_dir, f"prova_{prova_id}")
+            os.makedirs(directory, exist_ok=True)
+            task_name = task_id if task_id and SAFE_NAME.match(task_id) else datetime.now().strftime("%Y%m%d%H%M%S")
+            profiler.dump_stats(os.path.join(directory, f"{task_name}.prof"))
+            
+            stats = pstats.Stats(profiler)
+            resumo = {
+                "prova_id": prova_id,
+                "task_id": task_name,
+                "status": status,
+                "criado_em": datetime.now().isoformat(),
+                "tempo_total_s": round(stats.total_tt, 3),
+                "etapas": etapas,
+                "funcoes": self._top_functions(stats)
+            }
+            with open(os.path.join(directory, f"{task_name}.json"), "w", encoding="utf-8") as f:
+                json.dump(resumo, f, ensure_ascii=False, indent=2)
+            print(f"🔬 Perfil de CPU salvo: {directory}/{task_name}.prof")
+            return resumo
+        except Exception as e:
+            print(f"⚠️ Erro ao salvar perfil de CPU: {e}")
+            return None
+    
+    def _top_functions(self, stats: pstats.Stats) -> List[Dict]:
+        """Funções com maior tempo acumulado"""
+        funcoes = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)
+        return [
+            {
+                "funcao": f"{filename}:{line}({name})",
+                "chamadas": calls,
+                "tempo_proprio_s": round(total_time, 4),
+                "tempo_acumulado_s": round(cumulative_time, 4)
+            }
+            for (filename, line, name), (_, calls, total_time, cumulative_time, _) in funcoes[:self.top_functions]
+        ]
+    
+    def list_profiles(self, prova_id: Optional[int] = None) -> List[Dict]:
+        """Perfis gravados (de uma prova ou de todas), do mais recente ao mais antigo"""
+        if prova_id is not None:
+            directories = [f"prova_{prova_id}"]
+        elif os.path.isdir(self.profiles_dir):
+            directories = [name for name in os.listdir(self.profiles_dir) if name.startswith("prova_")]
+        else:
+            directories = []
+        
+        perfis = []
+        for directory in directories:
+            path = os.path.join(self.profiles_dir, directory)
+            if not os.path.isdir(path):
+                continue
+            for name in os.listdir(path):
+                if not name.endswith(".json"):
+                    continue
+                resumo = self._read_summary(os.path.join(path, name))
+                if resumo:
+                    perfis.append({key: resumo.get(key) for key in ("prova_id", "task_id", "status", "criado_em", "tempo_total_s")})
+        perfis.sort(key=lambda perfil: perfil.get("criado_em") or "", reverse=True)
+        return perfis
+    
+    def get_summary(self, prova_id: int, task_id: str) -> Optional[Dict]:
+        if not SAFE_NAME.match(task_id):
+            return None
+        return self._read_summary(os.path.join(self.profiles_dir, f"prova_{prova_id}", f"{task_id}.json"))
+    
+    def get_profile_path(self, prova_id: int, task_id: str) -> Optional[str]:
+        if not SAFE_NAME.match(task_id):
+            return None
+        path = os.path.join(self.profiles_dir, f"prova_{prova_id}", f"{task_id}.prof")
+        return path if os.path.exists(path) else None
+    
+    def _read_summary(self, path: str) -> Optional[Dict]:
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+
+task_profiler = TaskProfiler()
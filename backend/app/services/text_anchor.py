@@ -0,0 +1,117 @@
+from typing import List, Dict, Optional, Tuple
+import bisect
+import re
+
+
+class TextAnchorIndex:
+    """
+    Índice de k-gramas de palavras do texto completo, para localizar nele os
+    trechos devolvidos pela IA
+    
+    As palavras são normalizadas (minúsculas, sem pontuação), o que tolera as
+    diferenças de espaçamento e pontuação entre o texto da IA e o original.
+    Cada busca é uma consulta em dicionário seguida de bisect na lista de
+    ocorrências, sem varrer o texto.
+    """
+    
+    WORD_PATTERN = re.compile(r'\w+')
+    
+    def __init__(self, text: str, k: int = 5, max_probes: int = 10):
+        self.k = k
+        self.max_probes = max_probes  # k-gramas testados no início/fim do trecho até achar um no texto
+        self.confirm_tolerance = 2  # Deslocamento (palavras) aceito ao confirmar o início com outro k-grama
+        self.word_starts: List[int] = []
+        self.word_ends: List[int] = []
+        words = []
+        for match in self.WORD_PATTERN.finditer(text):
+            words.append(match.group().lower())
+            self.word_starts.append(match.start())
+            self.word_ends.append(match.end())
+        
+        # k-grama -> índices (crescentes) da primeira palavra de cada ocorrência
+        self._grams: Dict[Tuple[str, ...], List[int]] = {}
+        for i in range(len(words) - k + 1):
+            self._grams.setdefault(tuple(words[i:i + k]), []).append(i)
+    
+    def locate(self, texto: str, lo: int = 0, hi: Optional[int] = None) -> Optional[Tuple[int, int]]:
+        """
+        Localiza o trecho no texto completo
+        
+        Args:
+            texto: Texto devolvido pela IA
+            lo, hi: Região (offsets) onde o trecho deve começar
+        
+        Returns:
+            (início, fim) no texto completo, ou None se o início não for encontrado
+            na região ou não for confirmado por um segundo k-grama
+        """
+        words = [word.lower() for word in self.WORD_PATTERN.findall(texto)]
+        if len(words) < self.k:
+            return None
+        
+        start_word = self._find_start(words, lo, hi)
+        if start_word is None:
+            return None
+        
+        end_word = self._find_end(words, start_word)
+        if end_word is None:
+            # Fim não encontrado: estimar pelo número de palavras
+            end_word = min(start_word + len(words) - 1, len(self.word_ends) - 1)
+        
+        return self.word_starts[start_word], self.word_ends[end_word]
+    
+    def _find_start(self, words: List[str], lo: int, hi: Optional[int]) -> Optional[int]:
+        lo_word = bisect.bisect_left(self.word_starts, lo)
+        hi_word = bisect.bisect_left(self.word_starts, hi) if hi is not None else len(self.word_starts)
+        
+        for offset in range(min(self.max_probes, len(words) - self.k + 1)):
+            occurrences = self._grams.get(tuple(words[offset:offset + self.k]))
+            if not occurrences:
+                continue
+            # Só ocorrências dentro da região; aberturas comuns ("assinale a alternativa
+            # correta") se repetem, então cada candidata precisa ser confirmada
+            index = bisect.bisect_left(occurrences, lo_word + offset)
+            while index < len(occurrences) and occurrences[index] - offset < hi_word:
+                candidate = occurrences[index] - offset
+                if self._confirm_start(words, candidate, offset):
+                    return candidate
+                index += 1
+        return None
+    
+    def _confirm_start(self, words: List[str], start_word: int, probe_offset: int) -> bool:
+        """Algum k-grama seguinte do trecho aparece na posição correspondente ao início candidato"""
+        last = len(words) - self.k
+        # De preferência k-gramas sem sobreposição com o que achou a candidata
+        first = max(probe_offset + 1, min(probe_offset + self.k, last))
+        for gram_start in range(first, min(last, first + self.max_probes - 1) + 1):
+            occurrences = self._grams.get(tuple(words[gram_start:gram_start + self.k]))
+            if not occurrences:
+                continue
+            # Tolerância para palavras omitidas ou acrescentadas pela IA
+            expected = start_word + gram_start
+            index = bisect.bisect_left(occurrences, expected - self.confirm_tolerance)
+            if index < len(occurrences) and occurrences[index] <= expected + self.confirm_tolerance:
+                return True
+        return False
+    
+    def _find_end(self, words: List[str], start_word: int) -> Optional[int]:
+        expected = start_word + len(words) - 1
+        # Trecho não pode terminar longe demais do tamanho esperado
+        max_end = start_word + 2 * len(words) + self.k
+        
+        for offset in range(min(self.max_probes, len(words) - self.k + 1)):
+            gram_start = len(words) - self.k - offset
+            occurrences = self._grams.get(tuple(words[gram_start:gram_start + self.k]))
+            if not occurrences:
+                continue
+            # Ocorrência (índice da última palavra do trecho) mais próxima do fim esperado
+            shift = self.k - 1 + offset
+            index = bisect.bisect_left(occurrences, expected - shift)
+            candidates = [
+                occurrence + shift for occurrence in occurrences[max(0, index - 1):index + 1]
+                if start_word + self.k - 1 <= occurrence + shift <= max_end
+            ]
+            if candidates:
+                end_word = min(candidates, key=lambda end_word: abs(end_word - expected))
+                return min(end_word, len(self.word_ends) - 1)
+        return None
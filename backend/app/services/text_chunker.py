@@ -0,0 +1,168 @@
+from app.config import settings
+from app.services.pdf_extractor import pdf_extractor
+from app.services.page_index import PageIndex
+from typing import List, Dict, Optional, Tuple
+import bisect
+import math
+
+
+class TextChunker:
+    """
+    Divide o texto completo do documento em partes para envio à IA
+    
+    Cada parte respeita um orçamento de tokens (estimado por caracteres) e é um
+    recorte exato do texto completo: "inicio"/"fim" são offsets em full_text,
+    então nenhum trecho é perdido e as posições retornadas pela IA podem ser
+    convertidas para o documento somando "inicio".
+    
+    Os cortes são feitos, em ordem de preferência, no início de uma questão (ou de
+    uma página), em um parágrafo, em uma quebra de linha ou em um espaço. Quando o
+    corte cai no meio de uma questão, a parte seguinte recomeça um pouco antes
+    (sobreposição controlada), de preferência no início da questão cortada.
+    """
+    
+    def __init__(self):
+        self.chars_per_token = settings.llm_chars_per_token
+        self.max_tokens = settings.llm_chunk_max_tokens
+        self.overlap_tokens = settings.llm_chunk_overlap_tokens
+    
+    def estimate_tokens(self, text: str) -> int:
+        """Estimativa de tokens a partir do número de caracteres"""
+        return math.ceil(len(text) / self.chars_per_token)
+    
+    def estimate_chunks(self, length: int, max_tokens: Optional[int] = None) -> int:
+        """Número aproximado de partes de um trecho, sem procurar os pontos de corte"""
+        return math.ceil(length / self._budget(max_tokens))
+    
+    def estimate_page_chunks(self, page_index: PageIndex, pages: Optional[List[int]] = None,
+                             max_tokens: Optional[int] = None) -> int:
+        """Número aproximado de partes de chunk_by_pages, a partir dos tamanhos das páginas"""
+        if pages is None:
+            return self.estimate_chunks(page_index.total_length, max_tokens)
+        return sum(self.estimate_chunks(end - start, max_tokens) for start, end in self._page_runs(page_index, pages))
+    
+    def chunk_by_questoes(self, full_text: str, page_index: Optional[PageIndex] = None,
+                          max_tokens: Optional[int] = None) -> List[Dict]:
+        """Partes cortadas preferencialmente no início das questões"""
+        questao_starts = self._questao_starts(full_text)
+        return self._split(full_text, 0, len(full_text), questao_starts, questao_starts,
+                           page_index, max_tokens)
+    
+    def chunk_by_pages(self, full_text: str, page_index: PageIndex,
+                       max_tokens: Optional[int] = None, pages: Optional[List[int]] = None) -> List[Dict]:
+        """
+        Partes com páginas inteiras sempre que possível (páginas grandes são divididas)
+        
+        Com "pages", apenas essas páginas são enviadas: cada sequência de páginas
+        consecutivas é dividida separadamente.
+        """
+        questao_starts = self._questao_starts(full_text)
+        page_starts = [start for start in page_index.starts if start > 0]
+        
+        if pages is None:
+            return self._split(full_text, 0, len(full_text), page_starts, questao_starts,
+                               page_index, max_tokens)
+        
+        chunks = []
+        for start, end in self._page_runs(page_index, pages):
+            chunks.extend(self._split(full_text, start, end, page_starts, questao_starts,
+                                      page_index, max_tokens))
+        return chunks
+    
+    def _page_runs(self, page_index: PageIndex, pages: List[int]) -> List[Tuple[int, int]]:
+        """Trechos (início, fim) de full_text cobertos por sequências de páginas consecutivas"""
+        selected = set(pages)
+        runs = []
+        for i, page in enumerate(page_index.page_numbers):
+            if page not in selected:
+                continue
+            start, end = page_index.starts[i], page_index.ends[i]
+            previous = page_index.page_numbers[i - 1] if i > 0 else None
+            if runs and previous in selected:
+                runs[-1] = (runs[-1][0], end)
+            else:
+                runs.append((start, end))
+        return runs
+    
+    def _questao_starts(self, full_text: str) -> List[int]:
+        """Inícios de linha onde começa uma questão, em ordem"""
+        starts = []
+        for position, _, _ in pdf_extractor.iter_questao_boundaries(full_text):
+            if not starts or starts[-1] != position:
+                starts.append(position)
+        return starts
+    
+    def _budget(self, max_tokens: Optional[int]) -> int:
+        """Tamanho máximo (caracteres) de uma parte"""
+        return max(1, int((max_tokens or self.max_tokens) * self.chars_per_token))
+    
+    def _split(self, text: str, start: int, end: int, cut_points: List[int],
+               questao_starts: List[int], page_index: Optional[PageIndex],
+               max_tokens: Optional[int]) -> List[Dict]:
+        budget = self._budget(max_tokens)
+        overlap = min(int(self.overlap_tokens * self.chars_per_token), budget // 4)
+        
+        chunks = []
+        position = start
+        while position < end:
+            limit = position + budget
+            if limit >= end:
+                cut = end
+            else:
+                cut = self._best_cut(text, position, limit, cut_points, questao_starts)
+            chunks.append(self._make_chunk(text, position, cut, page_index))
+            if cut >= end:
+                break
+            position = self._next_start(text, position, cut, questao_starts, overlap)
+        return chunks
+    
+    def _best_cut(self, text: str, position: int, limit: int, cut_points: List[int],
+                  questao_starts: List[int]) -> int:
+        """Melhor ponto de corte em (position, limit], evitando partes muito pequenas"""
+        min_cut = position + (limit - position) // 2
+        
+        for points in (cut_points, questao_starts):
+            index = bisect.bisect_right(points, limit) - 1
+            if index >= 0 and points[index] >= min_cut:
+                return points[index]
+        
+        for separator in ("\n\n", "\n", " "):
+            index = text.rfind(separator, min_cut, limit)
+            if index != -1:
+                return index + len(separator)
+        return limit
+    
+    def _next_start(self, text: str, position: int, cut: int, questao_starts: List[int],
+                    overlap: int) -> int:
+        """Início da próxima parte: no corte, ou um pouco antes se o corte dividiu uma questão"""
+        index = bisect.bisect_left(questao_starts, cut)
+        if index < len(questao_starts) and questao_starts[index] == cut:
+            return cut
+        if overlap <= 0:
+            return cut
+        
+        window_start = max(position + 1, cut - overlap)
+        # Recomeçar no início da questão cortada, se estiver dentro da sobreposição
+        if index > 0 and questao_starts[index - 1] >= window_start:
+            return questao_starts[index - 1]
+        
+        line_break = text.find("\n", window_start, cut)
+        if line_break != -1:
+            return line_break + 1
+        space = text.find(" ", window_start, cut)
+        if space != -1:
+            return space + 1
+        return cut
+    
+    def _make_chunk(self, text: str, start: int, end: int, page_index: Optional[PageIndex]) -> Dict:
+        chunk = {
+            "texto": text[start:end],
+            "inicio": start,
+            "fim": end
+        }
+        if page_index is not None and len(page_index):
+            chunk["paginas"] = page_index.pages_for_span(start, end)
+        return chunk
+
+
+text_chunker = TextChunker()
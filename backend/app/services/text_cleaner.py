@@ -125,6 +125,74 @@ class TextCleaner:
         'ne0o': 'não',
     }
     
+    # Caracteres de controle (exceto \n e \t); o \r é trocado por espaço antes
+    CONTROL_CHARS_PATTERN = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+    
+    # Correções específicas com as variações de maiúsculas, em uma única alternância
+    SPECIFIC_REPLACEMENTS = {}
+    for _wrong, _correct in SPECIFIC_CORRECTIONS.items():
+        for _variant, _replacement in ((_wrong, _correct),
+                                       (_wrong.capitalize(), _correct.capitalize()),
+                                       (_wrong.upper(), _correct.upper())):
+            SPECIFIC_REPLACEMENTS.setdefault(_variant, _replacement)
+    del _wrong, _correct, _variant, _replacement
+    # Toda correção específica tem "e"/"f" seguido de dígito: filtro rápido antes da alternância
+    SPECIFIC_PREFILTER = re.compile('[eEfF][0-9]')
+    SPECIFIC_PATTERN = re.compile('|'.join(
+        re.escape(variant) for variant in sorted(SPECIFIC_REPLACEMENTS, key=len, reverse=True)
+    ))
+    
+    # Padrões específicos de "e0" -> "ao"
+    E0_PATTERNS = [
+        (re.compile(r'\be0\b', re.IGNORECASE), 'ao'),  # "e0" isolado -> "ao"
+        (re.compile(r'(\w+)e0(\s)', re.IGNORECASE), r'\1ao\2'),  # "e0 " -> "ao "
+        (re.compile(r'(\w+)e0(\w)', re.IGNORECASE), r'\1ao\2'),  # "e0" no meio -> "ao"
+    ]
+    
+    # Padrão: letra + número + letra (ex: "tambe9m" -> "também")
+    DIGIT_IN_WORD_PATTERNS = [
+        (re.compile(r'(\w{2,})9(\w{2,})', re.IGNORECASE), r'\1m\2'),  # "tambe9m" -> "também"
+        (re.compile(r'(\w{2,})7(\w{2,})', re.IGNORECASE), r'\1ç\2'),  # "Justie7a" -> "Justiça"
+        (re.compile(r'(\w{2,})4(\w{2,})', re.IGNORECASE), r'\1ã\2'),  # "Antf4nio" -> "Antônio"
+        (re.compile(r'(\w{2,})3(\w{2,})', re.IGNORECASE), r'\1ã\2'),  # "ne3o" -> "não"
+        (re.compile(r'(\w{2,})1(\w{2,})', re.IGNORECASE), r'\1á\2'),  # "podere1" -> "poderá"
+    ]
+    
+    # Palavras (sequências de \w) com algum dos dígitos acima: os padrões só casam
+    # dentro de uma palavra e as trocas mantêm as palavras, então basta aplicá-los a elas
+    DIGIT_WORD_PATTERN = re.compile(r'\b\w*[97431]\w*')
+    DIGIT_WORD_MIN_LENGTH = 5  # 2 letras + dígito + 2 letras
+    
+    WHITESPACE_PATTERN = re.compile(r'\s+')
+    
+    @staticmethod
+    def _replace_specific(text: str) -> str:
+        """
+        Aplica SPECIFIC_CORRECTIONS em uma passada por vez até não haver mais ocorrências
+        
+        Cada troca remove um dígito, então o laço termina; repetir cobre as
+        correções que se sobrepõem (ex.: "tambe9mate9ria"), como as trocas
+        sequenciais por entrada faziam.
+        """
+        if not TextCleaner.SPECIFIC_PREFILTER.search(text):
+            return text
+        pattern = TextCleaner.SPECIFIC_PATTERN
+        replacements = TextCleaner.SPECIFIC_REPLACEMENTS
+        while True:
+            text, count = pattern.subn(lambda match: replacements[match.group(0)], text)
+            if not count:
+                return text
+    
+    @staticmethod
+    def _fix_digit_word(match) -> str:
+        """Aplica DIGIT_IN_WORD_PATTERNS, em ordem, a uma palavra"""
+        word = match.group(0)
+        if len(word) < TextCleaner.DIGIT_WORD_MIN_LENGTH:
+            return word
+        for pattern, replacement in TextCleaner.DIGIT_IN_WORD_PATTERNS:
+            word = pattern.sub(replacement, word)
+        return word
+    
     @staticmethod
     def clean_text(text: str) -> str:
         """
@@ -145,46 +213,29 @@ class TextCleaner:
         except:
             pass
         
-        # 2. Remover caracteres NUL e outros problemáticos
-        text = text.replace('\x00', '').replace('\r', ' ')
+        # 2. \r vira espaço
+        text = text.replace('\r', ' ')
         
-        # 3. Remover caracteres de controle (exceto \n e \t)
-        text = ''.join(char for char in text if ord(char) >= 32 or char in '\n\t')
+        # 3. Remover NUL e outros caracteres de controle (exceto \n e \t)
+        text = TextCleaner.CONTROL_CHARS_PATTERN.sub('', text)
         
         # 4. Aplicar correções específicas (mais precisas)
-        for wrong, correct in TextCleaner.SPECIFIC_CORRECTIONS.items():
-            text = text.replace(wrong, correct)
-            # Também tentar com variações de maiúsculas
-            text = text.replace(wrong.capitalize(), correct.capitalize())
-            text = text.replace(wrong.upper(), correct.upper())
+        text = TextCleaner._replace_specific(text)
         
-        # 5. Corrigir padrões específicos primeiro
-        text = re.sub(r'\be0\b', 'ao', text, flags=re.IGNORECASE)  # "e0" isolado -> "ao"
-        text = re.sub(r'(\w+)e0(\s)', r'\1ao\2', text, flags=re.IGNORECASE)  # "e0 " -> "ao "
-        text = re.sub(r'(\w+)e0(\w)', r'\1ao\2', text, flags=re.IGNORECASE)  # "e0" no meio -> "ao"
+        # 5. Corrigir padrões específicos primeiro (todos exigem "e0")
+        if 'e0' in text or 'E0' in text:
+            for pattern, replacement in TextCleaner.E0_PATTERNS:
+                text = pattern.sub(replacement, text)
         
         # 6. Corrigir padrões comuns de números no meio de palavras
-        # Padrão: letra + número + letra (ex: "tambe9m" -> "também")
-        patterns_to_fix = [
-            (r'(\w{2,})9(\w{2,})', r'\1m\2'),  # "tambe9m" -> "também"
-            (r'(\w{2,})7(\w{2,})', r'\1ç\2'),  # "Justie7a" -> "Justiça"
-            (r'(\w{2,})4(\w{2,})', r'\1ã\2'),  # "Antf4nio" -> "Antônio"
-            (r'(\w{2,})3(\w{2,})', r'\1ã\2'),  # "ne3o" -> "não"
-            (r'(\w{2,})1(\w{2,})', r'\1á\2'),  # "podere1" -> "poderá"
-        ]
-        
-        for pattern, replacement in patterns_to_fix:
-            text = re.sub(pattern, replacement, text, flags=re.IGNORECASE)
+        text = TextCleaner.DIGIT_WORD_PATTERN.sub(TextCleaner._fix_digit_word, text)
         
-        # 7. Normalizar espaços múltiplos
-        text = re.sub(r'\s+', ' ', text)
+        # 7. Normalizar espaços múltiplos (inclui quebras de linha)
+        text = TextCleaner.WHITESPACE_PATTERN.sub(' ', text)
         
         # 8. Limpar espaços no início e fim
         text = text.strip()
         
-        # 9. Corrigir quebras de linha duplas
-        text = re.sub(r'\n{3,}', '\n\n', text)
-        
         return text
     
     @staticmethod
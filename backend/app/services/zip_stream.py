@@ -0,0 +1,69 @@
+from app.config import settings
+from datetime import datetime
+from typing import List, Set
+import os
+import re
+import zipfile
+
+# Caracteres trocados por "_" nos nomes das entradas do ZIP
+UNSAFE_NAME_CHARS = re.compile(r'[^\w.\- ]+')
+
+
+class _ChunkSink:
+    """Destino sem seek para o ZipFile: acumula os bytes escritos até serem consumidos"""
+    
+    def __init__(self):
+        self._chunks: List[bytes] = []
+    
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+    
+    def flush(self):
+        pass
+    
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class ZipStream:
+    """
+    ZIP gerado de forma incremental para respostas em streaming
+    
+    Sem seek, o ZipFile grava cada entrada com data descriptor; add() devolve
+    os bytes da entrada já comprimida e close() o diretório central. Só um
+    documento fica em memória por vez, qualquer que seja o número de entradas.
+    """
+    
+    def __init__(self):
+        self._sink = _ChunkSink()
+        self._zip = zipfile.ZipFile(
+            self._sink, "w",
+            compression=zipfile.ZIP_DEFLATED,
+            compresslevel=settings.export_zip_compresslevel
+        )
+        self._names: Set[str] = set()
+    
+    def _unique_name(self, name: str) -> str:
+        name = UNSAFE_NAME_CHARS.sub("_", name).strip() or "arquivo"
+        base, ext = os.path.splitext(name)
+        candidate, suffix = name, 2
+        while candidate in self._names:
+            candidate = f"{base}_{suffix}{ext}"
+            suffix += 1
+        self._names.add(candidate)
+        return candidate
+    
+    def add(self, name: str, data: bytes) -> bytes:
+        """Comprime uma entrada e devolve os bytes do ZIP produzidos até aqui"""
+        info = zipfile.ZipInfo(self._unique_name(name), date_time=datetime.now().timetuple()[:6])
+        info.compress_type = zipfile.ZIP_DEFLATED
+        self._zip.writestr(info, data, compresslevel=settings.export_zip_compresslevel)
+        return self._sink.drain()
+    
+    def close(self) -> bytes:
+        """Fecha o ZIP e devolve o restante (diretório central)"""
+        self._zip.close()
+        return self._sink.drain()
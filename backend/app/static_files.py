@@ -0,0 +1,27 @@
+"""
+Arquivos estáticos (imagens) com cabeçalhos de cache HTTP
+"""
+from starlette.responses import Response
+from starlette.staticfiles import StaticFiles
+from starlette.types import Scope
+from app.config import settings
+from app.services.db_service import CONTENT_HASHED_IMAGE
+import os
+
+
+class CachedStaticFiles(StaticFiles):
+    """
+    StaticFiles com Cache-Control
+    
+    Arquivos com hash do conteúdo no nome nunca mudam e recebem cache longo e
+    imutável. Os demais são revalidados a cada uso (ETag/Last-Modified já são
+    tratados pelo StaticFiles, que responde 304 em GET condicional).
+    """
+    
+    def file_response(self, full_path, stat_result: os.stat_result, scope: Scope, status_code: int = 200) -> Response:
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        if CONTENT_HASHED_IMAGE.search(str(full_path)):
+            response.headers["Cache-Control"] = f"public, max-age={settings.image_cache_max_age}, immutable"
+        else:
+            response.headers["Cache-Control"] = "public, no-cache"
+        return response
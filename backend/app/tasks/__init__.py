@@ -1,5 +1,8 @@
 from celery import Celery
+from celery.signals import worker_init, worker_process_shutdown
 from app.config import settings
+from app.services import metrics
+import os
 import sys
 
 celery_app = Celery(
@@ -20,8 +23,31 @@ celery_app.conf.update(
     enable_utc=True,
     worker_pool=pool_type,
     worker_prefetch_multiplier=1,  # Importante para solo pool
+    # Reciclar processos filhos (prefork) para devolver memória de fitz/PIL ao sistema
+    worker_max_tasks_per_child=settings.worker_max_tasks_per_child,
+    worker_max_memory_per_child=settings.worker_max_memory_per_child_mb * 1024,  # Em KB
 )
 
+
+@worker_init.connect
+def start_metrics_exporter(**kwargs):
+    """Exportador de métricas no processo principal do worker (soma os processos filhos)"""
+    if not settings.metrics_worker_port:
+        return
+    if pool_type == 'prefork' and not metrics.MULTIPROC_DIR:
+        print("⚠️ PROMETHEUS_MULTIPROC_DIR não definido: métricas das tarefas (processos filhos) não serão exportadas")
+    try:
+        metrics.start_exporter(settings.metrics_worker_port)
+        print(f"📈 Métricas do worker em :{settings.metrics_worker_port}/metrics")
+    except OSError as e:
+        print(f"⚠️ Não foi possível iniciar o exportador de métricas: {e}")
+
+
+@worker_process_shutdown.connect
+def discard_process_metrics(**kwargs):
+    metrics.mark_process_dead(os.getpid())
+
+
 # Importar tarefas para que sejam registradas
 from app.tasks.process_pdf import process_pdf_task
 
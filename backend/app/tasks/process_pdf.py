@@ -4,16 +4,27 @@ from app.services.ai_analyzer import ai_analyzer
 from app.services.db_service import db_service
 from app.services.image_processor import image_processor
 from app.services.ocr_service import ocr_service
-from app.services.image_deduplicator import image_deduplicator
+from app.services.image_deduplicator import image_deduplicator, recent_images
 from app.services.question_extractor import question_extractor
+from app.services.image_mapper import image_mapper
+from app.services.strategy_planner import strategy_planner
+from app.services.text_anchor import TextAnchorIndex
+from app.services.llm_accounting import set_llm_context, clear_llm_context
+from app.services.metrics import PipelineTimer, pages_total, images_total, low_memory_total
+from app.services.memory_monitor import MemoryMonitor, spill_images, load_image_bytes, MB
+from app.services.task_profiler import task_profiler
+from app.config import settings
+import gc
 import os
+import shutil
+import tempfile
 import traceback
 from typing import Dict
 
 
 @celery_app.task(bind=True)
-def process_pdf_task(self, prova_id: int, pdf_path: str):
-    """Tarefa Celery para processar PDF completo"""
+def process_pdf_task(self, prova_id: int, pdf_path: str, perfilar: bool = False):
+    """Tarefa Celery para processar PDF completo (perfilar: gravar perfil de CPU da tarefa)"""
     from datetime import datetime
     
     task_id = self.request.id
@@ -37,16 +48,30 @@ def process_pdf_task(self, prova_id: int, pdf_path: str):
             progresso=progresso
         )
     
+    memoria = MemoryMonitor(settings.task_memory_budget_mb, settings.memory_tracemalloc)
+    timer = PipelineTimer(memory=memoria)
+    profiler = task_profiler.start(perfilar)
+    status_final = "error"
+    spill_dir = None  # Diretório das imagens no modo de pouca memória
+    
+    def ativar_pouca_memoria() -> str:
+        """Modo de pouca memória: imagens passam a ficar em disco durante a tarefa"""
+        os.makedirs(settings.upload_dir, exist_ok=True)
+        low_memory_total.inc()
+        return tempfile.mkdtemp(prefix=f"prova_{prova_id}_imagens_", dir=settings.upload_dir)
+    
     try:
         
         # Verificar se a tarefa foi cancelada (será verificado periodicamente)
         
         # Atualizar status inicial
+        set_llm_context(prova_id=prova_id)  # Chamadas à IA desta tarefa são contabilizadas na prova
         db_service.update_prova_status(prova_id, "extraindo", etapa="Iniciando processamento...", progresso=5)
         log_detalhado(f"🚀 Iniciando processamento da prova {prova_id} (Task ID: {task_id})", 5)
         
         # 1. Extrair texto do OCR das imagens (se necessário)
         log_detalhado("🔍 [ETAPA 1/9] Extraindo texto de imagens com OCR...", 10)
+        timer.stage("ocr")
         ocr_text_by_page = {}
         try:
             ocr_text_by_page = ocr_service.extract_text_from_pdf_images(pdf_path)
@@ -56,12 +81,28 @@ def process_pdf_task(self, prova_id: int, pdf_path: str):
         
         # 2. Extrair conteúdo do PDF (texto + imagens)
         log_detalhado("📄 [ETAPA 2/9] Extraindo conteúdo do PDF (texto + imagens)...", 20)
-        content = pdf_extractor.extract_full_content(pdf_path, ocr_text_by_page)
+        timer.stage("extracao_pdf")
+        if settings.low_memory_mode or memoria.over_budget():
+            spill_dir = ativar_pouca_memoria()
+            log_detalhado("🧠 Modo de pouca memória: imagens serão mantidas em disco", 20)
+        content = pdf_extractor.extract_full_content(pdf_path, ocr_text_by_page, spill_dir=spill_dir)
+        if spill_dir is None and memoria.over_budget():
+            spill_dir = ativar_pouca_memoria()
+            liberados = spill_images(content["images"], spill_dir)
+            gc.collect()
+            log_detalhado(
+                f"🧠 Orçamento de memória ({settings.task_memory_budget_mb} MB) excedido: "
+                f"{liberados / MB:.1f} MB de imagens movidos para o disco",
+                25
+            )
+        pages_total.inc(content["total_pages"])
+        images_total.labels(tipo="extraidas").inc(len(content["images"]))
         log_detalhado(f"✅ PDF extraído: {content['total_pages']} páginas, {len(content['images'])} imagens encontradas", 25)
         
         # 3. Extrair questões usando múltiplas estratégias
         db_service.update_prova_status(prova_id, "analisando", etapa="Extraindo questões...", progresso=30)
         log_detalhado("🔍 [ETAPA 3/9] Extraindo questões com múltiplas estratégias...", 30)
+        timer.stage("extracao_questoes")
         
         questoes_from_methods = []
         
@@ -69,55 +110,135 @@ def process_pdf_task(self, prova_id: int, pdf_path: str):
         log_detalhado("📝 [3.1] Estratégia 1: Regex por página...", 32)
         questoes_regex = question_extractor.extract_questoes_by_page(
             content["pages_text"],
-            ocr_text_by_page
+            ocr_text_by_page,
+            page_index=content["page_index"]
         )
         questoes_from_methods.append(questoes_regex)
         log_detalhado(f"   ✅ Regex: {len(questoes_regex)} questões encontradas", 35)
         
-        # Estratégia 2: IA por chunks de páginas
-        log_detalhado("🤖 [3.2] Estratégia 2: IA por chunks (Gemini/ChatGPT)...", 38)
-        try:
-            questoes_ai = question_extractor.extract_with_ai_by_page(
-                content["pages_text"],
-                ocr_text_by_page
-            )
-            questoes_from_methods.append(questoes_ai)
-            log_detalhado(f"   ✅ IA: {len(questoes_ai)} questões encontradas", 42)
-        except Exception as e:
-            log_detalhado(f"   ⚠️ Erro na extração por IA: {e}", 42)
+        # Planejar as estratégias de IA a partir da completude do regex
+        plano = strategy_planner.plan(
+            questoes_regex,
+            content["pages_text"],
+            content["full_text"],
+            content["page_index"]
+        )
+        avaliacao = plano["avaliacao"]
+        log_detalhado(
+            f"   🧭 Plano: {plano['motivo']} (confiança {avaliacao['confianca']:.0%}, "
+            f"{len(avaliacao['questoes'])} questões com problemas, {len(avaliacao['lacunas'])} números ausentes)",
+            36
+        )
+        decisoes = {"regex": "executado"}
         
-        # Estratégia 3: ChatGPT no texto completo (fallback)
-        log_detalhado("🤖 [3.3] Estratégia 3: ChatGPT texto completo...", 45)
-        try:
-            questoes_chatgpt = ai_analyzer.extract_questoes_with_chatgpt(content["full_text"])
-            questoes_from_methods.append(questoes_chatgpt)
-            log_detalhado(f"   ✅ ChatGPT: {len(questoes_chatgpt)} questões encontradas", 48)
-        except Exception as e:
-            log_detalhado(f"   ⚠️ Erro no ChatGPT: {e}", 48)
+        # Índice de âncoras do texto completo: caro em memória, só é criado se
+        # alguma estratégia com IA rodar (e compartilhado entre elas)
+        anchor_index = None
+        if plano["paginas_ia"] or plano["texto_completo"]:
+            anchor_index = TextAnchorIndex(content["full_text"])
+        
+        # Estratégia 2: IA por chunks de páginas (apenas páginas com problemas)
+        if plano["paginas_ia"]:
+            set_llm_context(etapa="extracao_paginas")
+            log_detalhado(f"🤖 [3.2] Estratégia 2: IA por chunks em {len(plano['paginas_ia'])} páginas...", 38)
+            try:
+                questoes_ai = question_extractor.extract_with_ai_by_page(
+                    content["pages_text"],
+                    ocr_text_by_page,
+                    full_text=content["full_text"],
+                    page_index=content["page_index"],
+                    pages=plano["paginas_ia"],
+                    anchor_index=anchor_index
+                )
+                questoes_from_methods.append(questoes_ai)
+                decisoes["ia_por_pagina"] = f"executado em {len(plano['paginas_ia'])} páginas"
+                log_detalhado(f"   ✅ IA: {len(questoes_ai)} questões encontradas", 42)
+            except Exception as e:
+                decisoes["ia_por_pagina"] = "erro"
+                log_detalhado(f"   ⚠️ Erro na extração por IA: {e}", 42)
+        else:
+            decisoes["ia_por_pagina"] = "pulado"
+            log_detalhado("⏭️ [3.2] Estratégia 2 pulada: nenhuma página com problemas", 42)
+        
+        # Estratégia 3: ChatGPT no texto completo (apenas com confiança baixa)
+        if plano["texto_completo"]:
+            set_llm_context(etapa="extracao_texto_completo")
+            log_detalhado("🤖 [3.3] Estratégia 3: ChatGPT texto completo...", 45)
+            try:
+                questoes_chatgpt = ai_analyzer.extract_questoes_with_chatgpt(
+                    content["full_text"],
+                    anchor_index=anchor_index,
+                    page_index=content["page_index"]
+                )
+                questoes_from_methods.append(questoes_chatgpt)
+                decisoes["texto_completo"] = "executado"
+                log_detalhado(f"   ✅ ChatGPT: {len(questoes_chatgpt)} questões encontradas", 48)
+            except Exception as e:
+                decisoes["texto_completo"] = "erro"
+                log_detalhado(f"   ⚠️ Erro no ChatGPT: {e}", 48)
+        else:
+            decisoes["texto_completo"] = "pulado"
+            log_detalhado("⏭️ [3.3] Estratégia 3 pulada: confiança do regex suficiente", 48)
         
         # Mesclar e deduplicar resultados de todas as estratégias
         log_detalhado("🔄 Mesclando e deduplicando resultados...", 50)
         questoes_raw = question_extractor.merge_and_deduplicate_questoes(questoes_from_methods)
         log_detalhado(f"✅ Total: {len(questoes_raw)} questões únicas após mesclagem", 52)
         
-        # 4. Validação e refinamento com ChatGPT
+        # 4. Validação e refinamento com ChatGPT (apenas questões suspeitas ou vindas da IA)
         log_detalhado("✨ [ETAPA 4/9] Validando e refinando questões com ChatGPT...", 55)
-        if questoes_raw:
+        timer.stage("validacao")
+        if plano["validar"] is None:
+            questoes_a_validar = questoes_raw
+        else:
+            numeros_regex = {q.get("numero") for q in questoes_regex}
+            numeros_validar = set(plano["validar"])
+            questoes_a_validar = [
+                q for q in questoes_raw
+                if q.get("numero") in numeros_validar or q.get("numero") not in numeros_regex
+            ]
+        
+        if questoes_a_validar:
+            set_llm_context(etapa="validacao")
             try:
-                questoes_validadas = ai_analyzer.validate_with_chatgpt(
-                    questoes_raw,
-                    content["full_text"]
+                validadas = ai_analyzer.validate_with_chatgpt(
+                    questoes_a_validar,
+                    content["full_text"],
+                    page_index=content["page_index"]
                 )
-                log_detalhado(f"✅ Validação concluída: {len(questoes_validadas)} questões validadas", 58)
+                # Substituir apenas as questões validadas, mantendo as demais do regex
+                validadas_por_numero = {q.get("numero"): q for q in validadas}
+                questoes_validadas = [validadas_por_numero.pop(q.get("numero"), q) for q in questoes_raw]
+                questoes_validadas.extend(validadas_por_numero.values())
+                questoes_validadas.sort(key=lambda q: q.get("numero") or 0)
+                decisoes["validacao"] = f"executado em {len(questoes_a_validar)} questões"
+                log_detalhado(f"✅ Validação concluída: {len(validadas)} questões validadas", 58)
             except Exception as e:
+                decisoes["validacao"] = "erro"
                 log_detalhado(f"⚠️ Erro na validação: {e}", 58)
                 questoes_validadas = questoes_raw
+        elif questoes_raw:
+            decisoes["validacao"] = "pulado"
+            log_detalhado("⏭️ Validação pulada: todas as questões do regex estão completas", 58)
+            questoes_validadas = questoes_raw
         else:
+            decisoes["validacao"] = "pulado"
             log_detalhado("⚠️ Nenhuma questão encontrada após todas as estratégias!", 58)
             questoes_validadas = []
         
+        planejamento = {
+            "motivo": plano["motivo"],
+            "confianca": avaliacao["confianca"],
+            "decisoes": decisoes,
+            "chamadas_previstas": plano["chamadas_previstas"],
+            "chamadas_evitadas": plano["chamadas_evitadas"]
+        }
+        if plano["chamadas_evitadas"]:
+            log_detalhado(f"💡 {plano['chamadas_evitadas']} chamadas de IA evitadas pelo planejamento", 59)
+        
         # 5. Criar questões no banco
         log_detalhado(f"💾 [ETAPA 5/9] Salvando {len(questoes_validadas)} questões no banco...", 60)
+        timer.stage("salvar_questoes")
         questoes_criadas = []
         total_questoes = len(questoes_validadas)
         for ordem, questao in enumerate(questoes_validadas, start=1):
@@ -148,52 +269,100 @@ def process_pdf_task(self, prova_id: int, pdf_path: str):
         # 6. Filtrar imagens duplicadas
         log_detalhado(f"🖼️ [ETAPA 6/9] Filtrando imagens duplicadas ({len(content['images'])} imagens totais)...", 70)
         db_service.update_prova_status(prova_id, "filtrando_imagens", etapa="Filtrando imagens duplicadas...", progresso=70)
-        images_filtered = image_deduplicator.filter_duplicate_images(
-            content["images"],
-            content["pages_text"]
-        )
+        timer.stage("filtrar_imagens")
+        # Sessão de deduplicação restrita a esta prova (liberada ao sair do bloco)
+        with image_deduplicator.session() as dedup_session:
+            images_filtered = image_deduplicator.filter_duplicate_images(
+                content["images"],
+                content["pages_text"],
+                session=dedup_session
+            )
+        images_total.labels(tipo="unicas").inc(len(images_filtered))
         log_detalhado(f"✅ {len(images_filtered)} imagens únicas após filtro (removidas {len(content['images']) - len(images_filtered)} duplicadas)", 75)
         
         # 7. Mapear imagens às questões
-        log_detalhado("🔗 [ETAPA 7/9] Mapeando imagens às questões com IA...", 78)
+        log_detalhado("🔗 [ETAPA 7/9] Mapeando imagens às questões pela posição na página...", 78)
         db_service.update_prova_status(prova_id, "mapeando_imagens", etapa="Mapeando imagens às questões...", progresso=78)
-        images_mapped = ai_analyzer.map_images_to_questoes(
+        timer.stage("mapear_imagens")
+        images_mapped, imagens_ambiguas = image_mapper.map_images_to_questoes(
             questoes_criadas,
             images_filtered,
             content["pages_text"]
         )
-        log_detalhado(f"✅ {len(images_mapped)} imagens mapeadas para questões", 80)
+        
+        # Apenas imagens sem região definida vão para a IA
+        if imagens_ambiguas:
+            set_llm_context(etapa="mapeamento_imagens")
+            log_detalhado(f"   🤖 {len(imagens_ambiguas)} imagens ambíguas, consultando IA...", 79)
+            paginas_questoes = image_mapper.questao_pages(questoes_criadas, content["pages_text"])
+            # Sem marcador no PDF: página definida na extração (regex ou parte enviada à IA);
+            # sem nenhuma das duas, a página fica desconhecida em vez de cair na página 1
+            paginas_extracao = {q.get("numero"): q.get("pagina") for q in questoes_validadas}
+            questoes_com_pagina = [
+                {**q, "pagina": paginas_questoes.get(q["numero"]) or paginas_extracao.get(q["numero"])}
+                for q in questoes_criadas
+            ]
+            ai_analyzer.map_images_to_questoes(
+                questoes_com_pagina,
+                [images_mapped[i] for i in imagens_ambiguas],
+                content["pages_text"],
+                page_index=content["page_index"]
+            )
+        log_detalhado(f"✅ {len(images_mapped)} imagens mapeadas para questões ({len(imagens_ambiguas)} via IA)", 80)
         
         # 8. Processar e salvar imagens
         log_detalhado(f"💾 [ETAPA 8/9] Salvando {len(images_mapped)} imagens...", 82)
         db_service.update_prova_status(prova_id, "salvando_imagens", etapa=f"Salvando {len(images_mapped)} imagens...", progresso=82)
+        timer.stage("salvar_imagens")
         total_imagens = len(images_mapped)
+        imagens_reutilizadas = 0
         for img_index, img_data in enumerate(images_mapped):
             # Verificar se foi cancelado (verificação periódica)
             
             progresso_imagem = 82 + int((img_index / total_imagens) * 15) if total_imagens > 0 else 82
             if img_index % 5 == 0 or img_index == total_imagens - 1:
                 log_detalhado(f"   💾 Imagem {img_index + 1}/{total_imagens} processada", progresso_imagem)
-            # Processar imagem
-            processed_image = image_processor.process_image(
-                img_data["image_bytes"],
-                img_data.get("ext", "PNG")
-            )
             
-            # Gerar nome do arquivo
-            filename = f"prova_{prova_id}/imagem_{img_data['page']}_{img_index}.png"
-            
-            # Salvar imagem localmente
-            image_url = db_service.save_image_file(
-                processed_image,
-                filename
-            )
-            
-            # Criar registro no banco
             questao_id = img_data.get("questao_id")
             hash_imagem = img_data.get("md5_hash")
             perceptual_hash = img_data.get("perceptual_hash")
             
+            # Reutilizar imagem idêntica/quase idêntica de uma prova anterior
+            imagem_existente = None
+            if settings.cross_prova_dedup:
+                imagem_existente = recent_images.get(hash_imagem, prova_id)
+                if imagem_existente is None:
+                    try:
+                        imagem_existente = db_service.find_imagem_equivalente(prova_id, hash_imagem, perceptual_hash)
+                    except Exception as e:
+                        log_detalhado(f"   ⚠️ Erro ao buscar imagem equivalente (salvando nova): {e}", progresso_imagem)
+            
+            if imagem_existente:
+                image_url = imagem_existente["caminho_arquivo"]
+                # Só o arquivo é reaproveitado: a questão vem do mapeamento desta prova
+                imagens_reutilizadas += 1
+            else:
+                # Processar imagem (bytes em memória ou no disco, no modo de pouca memória)
+                image_bytes = load_image_bytes(img_data)
+                processed_image = image_processor.process_image(
+                    image_bytes,
+                    img_data.get("ext", "PNG")
+                )
+                
+                # Gerar nome do arquivo (hash do conteúdo permite cache imutável)
+                content_hash = hash_imagem or image_processor.calculate_hash_md5(image_bytes)
+                filename = f"prova_{prova_id}/imagem_{img_data['page']}_{img_index}_{content_hash[:12]}.png"
+                
+                # Salvar imagem localmente
+                image_url = db_service.save_image_file(
+                    processed_image,
+                    filename
+                )
+                
+                # Gerar miniaturas para listagens
+                db_service.save_image_thumbnails(processed_image, filename)
+            
+            # Criar registro no banco
             db_service.create_imagem(
                 prova_id=prova_id,
                 questao_id=questao_id,
@@ -202,9 +371,21 @@ def process_pdf_task(self, prova_id: int, pdf_path: str):
                 hash_imagem=hash_imagem,
                 perceptual_hash=perceptual_hash
             )
+            
+            if settings.cross_prova_dedup and not imagem_existente:
+                recent_images.put(hash_imagem, {
+                    "prova_id": prova_id,
+                    "caminho_arquivo": image_url
+                })
+        
+        images_total.labels(tipo="salvas").inc(len(images_mapped) - imagens_reutilizadas)
+        images_total.labels(tipo="reutilizadas").inc(imagens_reutilizadas)
+        if imagens_reutilizadas:
+            log_detalhado(f"♻️ {imagens_reutilizadas} imagens reutilizadas de provas anteriores", 97)
         
         # 9. Finalizar
         log_detalhado("🎉 [ETAPA 9/9] Processamento concluído com sucesso!", 100)
+        timer.stage("finalizacao")
         db_service.update_prova_status(
             prova_id, 
             "concluido", 
@@ -212,6 +393,20 @@ def process_pdf_task(self, prova_id: int, pdf_path: str):
             progresso=100
         )
         
+        # Resumo do uso de IA (tokens, latência e custo estimado)
+        uso_ia = None
+        try:
+            uso_ia = db_service.get_llm_resumo(prova_id)["total"]
+            if uso_ia["chamadas"]:
+                log_detalhado(
+                    f"💰 IA: {uso_ia['chamadas']} chamadas, {uso_ia['tokens_prompt']} tokens de entrada "
+                    f"({uso_ia['tokens_cache']} em cache), {uso_ia['tokens_resposta']} de saída, "
+                    f"{uso_ia['latencia_ms'] / 1000:.1f}s, ~US$ {uso_ia['custo_usd']:.4f}",
+                    100
+                )
+        except Exception as e:
+            log_detalhado(f"⚠️ Erro ao obter resumo de uso da IA: {e}", 100)
+        
         # Limpar arquivo temporário
         if os.path.exists(pdf_path):
             try:
@@ -220,14 +415,21 @@ def process_pdf_task(self, prova_id: int, pdf_path: str):
             except Exception as e:
                 log_detalhado(f"⚠️ Erro ao remover arquivo temporário: {e}", 100)
         
+        timer.finish("success")
+        status_final = "success"
         return {
             "status": "success",
             "prova_id": prova_id,
             "questoes_count": len(questoes_criadas),
-            "imagens_count": len(images_mapped)
+            "imagens_count": len(images_mapped),
+            "planejamento": planejamento,
+            "uso_ia": uso_ia,
+            "duracao_etapas": timer.durations,
+            "memoria_pico_mb": memoria.peak_mb()
         }
     
     except Exception as e:
+        timer.finish("error")
         # Log detalhado do erro
         error_trace = traceback.format_exc()
         error_msg = f"❌ ERRO CRÍTICO no processamento da prova {prova_id}:\n"
@@ -259,4 +461,24 @@ def process_pdf_task(self, prova_id: int, pdf_path: str):
         
         # Re-raise para que o Celery registre o erro
         raise e
+    
+    finally:
+        # O processo do worker é reutilizado por outras tarefas
+        clear_llm_context()
+        if profiler:
+            task_profiler.save(profiler, prova_id, task_id, timer.summary(), status_final)
+        
+        # Memória por etapa registrada na prova
+        try:
+            db_service.update_prova_memoria(prova_id, {
+                "etapas": memoria.stages,
+                "pico_rss_mb": memoria.peak_mb(),
+                "orcamento_mb": settings.task_memory_budget_mb,
+                "modo_pouca_memoria": spill_dir is not None
+            })
+        except Exception as e:
+            print(f"⚠️ Erro ao registrar memória da prova: {e}")
+        memoria.stop()
+        if spill_dir:
+            shutil.rmtree(spill_dir, ignore_errors=True)
 
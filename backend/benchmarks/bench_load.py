@@ -0,0 +1,336 @@
+"""
+Teste de carga da API (httpx assíncrono) com uma mistura realista de tráfego
+
+Cada nível de concorrência roda N clientes em laço fechado por um tempo fixo,
+sorteando a operação pelos pesos da mistura:
+
+    listar      GET /provas/ (polling da tela inicial)
+    prova       GET /provas/{id}
+    exportar    GET /provas/{id}/exportar/pdf ou /word
+    upload      POST /provas/upload (prova sintética de benchmarks.synthetic_pdf)
+
+Para cada endpoint são medidos vazão e latência p50/p95/p99. Em paralelo, uma
+sonda chama GET /health em intervalo fixo: como /health não faz nada, o
+aumento da sua latência com a concorrência mostra o event loop bloqueado
+(chamadas síncronas ao banco e exportações em provas.py).
+
+Ambiente (a partir da raiz do projeto):
+    docker compose up -d postgres redis
+    python -m benchmarks.fake_llm_server --host 0.0.0.0          # em backend/
+    OPENAI_BASE_URL=http://localhost:8765/v1 GEMINI_API_ENDPOINT=http://localhost:8765 \\
+        uvicorn app.main:app --port 8000 e celery -A app.tasks worker  # em backend/
+
+Uso (a partir de backend/):
+    python -m benchmarks.bench_load [--url http://localhost:8000] [--concorrencia 1 4 16 32]
+        [--duracao 20] [--mix listar=50,prova=30,exportar=15,upload=5] [--semear 3]
+        [--saida resultado.json] [--comparar anterior.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import httpx
+
+from benchmarks.synthetic_pdf import add_corpus_arguments, corpus_kwargs, generate_exam_pdf
+
+OPERACOES = ["listar", "prova", "exportar", "upload"]
+MIX_PADRAO = "listar=50,prova=30,exportar=15,upload=5"
+STATUS_FINAIS = {"concluido", "erro", "cancelado"}
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    """'listar=50,prova=30' -> pesos por operação"""
+    pesos = {}
+    for item in mix.split(","):
+        nome, _, peso = item.partition("=")
+        nome = nome.strip()
+        if nome not in OPERACOES:
+            raise argparse.ArgumentTypeError(f"Operação desconhecida na mistura: {nome}")
+        pesos[nome] = float(peso or 1)
+    if not any(pesos.values()):
+        raise argparse.ArgumentTypeError("A mistura precisa de ao menos um peso positivo")
+    return pesos
+
+
+def percentile(valores: List[float], p: float) -> Optional[float]:
+    """Percentil com interpolação linear (valores já ordenados)"""
+    if not valores:
+        return None
+    posicao = (len(valores) - 1) * p / 100
+    inferior = int(posicao)
+    superior = min(inferior + 1, len(valores) - 1)
+    return valores[inferior] + (valores[superior] - valores[inferior]) * (posicao - inferior)
+
+
+def summarize(latencias: List[float], erros: int, duracao: float) -> Dict:
+    latencias = sorted(latencias)
+    ms = lambda valor: round(valor * 1000, 1) if valor is not None else None
+    return {
+        "requisicoes": len(latencias),
+        "erros": erros,
+        "vazao_rps": round(len(latencias) / duracao, 2) if duracao else None,
+        "p50_ms": ms(percentile(latencias, 50)),
+        "p95_ms": ms(percentile(latencias, 95)),
+        "p99_ms": ms(percentile(latencias, 99)),
+        "max_ms": ms(latencias[-1] if latencias else None)
+    }
+
+
+class LoadTest:
+    """Gera a carga de um nível de concorrência e acumula as latências por endpoint"""
+    
+    def __init__(self, client: httpx.AsyncClient, pesos: Dict[str, float], prova_ids: List[int],
+                 pdf_bytes: bytes, seed: int):
+        self.client = client
+        self.operacoes = [nome for nome, peso in pesos.items() if peso > 0]
+        self.pesos = [pesos[nome] for nome in self.operacoes]
+        self.prova_ids = prova_ids
+        self.pdf_bytes = pdf_bytes
+        self.rng = random.Random(seed)
+        self.medindo = False
+        self.latencias: Dict[str, List[float]] = {}
+        self.erros: Dict[str, int] = {}
+        self.provas_enviadas: List[int] = []
+    
+    def _record(self, endpoint: str, inicio: float, sucesso: bool):
+        if not self.medindo:
+            return
+        if sucesso:
+            self.latencias.setdefault(endpoint, []).append(time.perf_counter() - inicio)
+        else:
+            self.erros[endpoint] = self.erros.get(endpoint, 0) + 1
+            self.latencias.setdefault(endpoint, [])
+    
+    async def request(self, operacao: str):
+        prova_id = self.rng.choice(self.prova_ids)
+        if operacao == "listar":
+            endpoint, call = "GET /provas/", lambda: self.client.get("/provas/")
+        elif operacao == "prova":
+            endpoint, call = "GET /provas/{id}", lambda: self.client.get(f"/provas/{prova_id}")
+        elif operacao == "exportar":
+            formato = self.rng.choice(["pdf", "word"])
+            endpoint = f"GET /provas/{{id}}/exportar/{formato}"
+            call = lambda: self.client.get(f"/provas/{prova_id}/exportar/{formato}")
+        else:
+            endpoint = "POST /provas/upload"
+            call = lambda: self.client.post(
+                "/provas/upload", files={"file": ("prova_carga.pdf", self.pdf_bytes, "application/pdf")}
+            )
+        
+        inicio = time.perf_counter()
+        try:
+            response = await call()
+            sucesso = response.status_code < 400
+            if sucesso and operacao == "upload":
+                self.provas_enviadas.append(response.json().get("prova_id"))
+        except httpx.HTTPError:
+            sucesso = False
+        self._record(endpoint, inicio, sucesso)
+    
+    async def worker(self, fim: float):
+        while time.perf_counter() < fim:
+            await self.request(self.rng.choices(self.operacoes, weights=self.pesos)[0])
+    
+    async def probe(self, fim: float, intervalo: float):
+        """Sonda do event loop: latência de GET /health sob carga"""
+        while time.perf_counter() < fim:
+            inicio = time.perf_counter()
+            try:
+                response = await self.client.get("/health")
+                self._record("sonda GET /health", inicio, response.status_code < 400)
+            except httpx.HTTPError:
+                self._record("sonda GET /health", inicio, False)
+            await asyncio.sleep(intervalo)
+    
+    async def run(self, concorrencia: int, duracao: float, aquecimento: float, intervalo_sonda: float) -> Dict:
+        inicio = time.perf_counter()
+        fim = inicio + aquecimento + duracao
+        
+        async def start_measuring():
+            await asyncio.sleep(aquecimento)
+            self.medindo = True
+        
+        await asyncio.gather(
+            start_measuring(),
+            self.probe(fim, intervalo_sonda),
+            *(self.worker(fim) for _ in range(concorrencia))
+        )
+        self.medindo = False
+        # Requisições em andamento no fim do nível entram na medição; o tempo real é usado na vazão
+        duracao_real = time.perf_counter() - inicio - aquecimento
+        
+        endpoints = {
+            endpoint: summarize(latencias, self.erros.get(endpoint, 0), duracao_real)
+            for endpoint, latencias in sorted(self.latencias.items())
+        }
+        total = sum(resultado["requisicoes"] for endpoint, resultado in endpoints.items() if not endpoint.startswith("sonda"))
+        return {
+            "concorrencia": concorrencia,
+            "duracao_s": round(duracao_real, 2),
+            "vazao_total_rps": round(total / duracao_real, 2),
+            "endpoints": endpoints
+        }
+
+
+async def wait_provas(client: httpx.AsyncClient, prova_ids: List[int], timeout: float):
+    """Aguarda o processamento das provas enviadas (status final ou timeout)"""
+    limite = time.perf_counter() + timeout
+    pendentes = set(prova_ids)
+    while pendentes and time.perf_counter() < limite:
+        for prova_id in list(pendentes):
+            response = await client.get(f"/provas/{prova_id}")
+            if response.status_code == 200 and response.json().get("prova", {}).get("status") in STATUS_FINAIS:
+                pendentes.discard(prova_id)
+        if pendentes:
+            await asyncio.sleep(2)
+    if pendentes:
+        print(f"⚠️ Provas ainda em processamento após {timeout:.0f}s: {sorted(pendentes)}", file=sys.stderr)
+
+
+async def discover_provas(client: httpx.AsyncClient, pdf_bytes: bytes, semear: int, timeout: float) -> List[int]:
+    """Provas concluídas para as leituras e exportações (envia `semear` provas se faltar)"""
+    response = await client.get("/provas/")
+    response.raise_for_status()
+    concluidas = [prova["id"] for prova in response.json() if prova.get("status") == "concluido"]
+    if len(concluidas) >= semear:
+        return concluidas
+    
+    print(f"🌱 Enviando {semear - len(concluidas)} prova(s) sintética(s) para a carga...", file=sys.stderr)
+    enviadas = []
+    for _ in range(semear - len(concluidas)):
+        response = await client.post(
+            "/provas/upload", files={"file": ("prova_semente.pdf", pdf_bytes, "application/pdf")}
+        )
+        response.raise_for_status()
+        enviadas.append(response.json()["prova_id"])
+    await wait_provas(client, enviadas, timeout)
+    
+    response = await client.get("/provas/")
+    response.raise_for_status()
+    return [prova["id"] for prova in response.json() if prova.get("status") == "concluido"]
+
+
+async def cleanup(client: httpx.AsyncClient, prova_ids: List[int]):
+    """Cancela as provas enviadas pela carga que ainda estão na fila"""
+    for prova_id in prova_ids:
+        try:
+            await client.post(f"/provas/{prova_id}/cancelar")
+        except httpx.HTTPError:
+            pass
+
+
+async def run(args: argparse.Namespace, pdf_bytes: bytes) -> Dict:
+    limits = httpx.Limits(max_connections=max(args.concorrencia) + 1, max_keepalive_connections=max(args.concorrencia) + 1)
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+        prova_ids = await discover_provas(client, pdf_bytes, args.semear, args.timeout_semear)
+        if not prova_ids:
+            raise SystemExit("❌ Nenhuma prova concluída para as leituras e exportações (use --semear)")
+        
+        niveis = []
+        enviadas = []
+        for indice, concorrencia in enumerate(args.concorrencia):
+            teste = LoadTest(client, args.mix, prova_ids, pdf_bytes, seed=args.seed + indice)
+            nivel = await teste.run(concorrencia, args.duracao, args.aquecimento, args.intervalo_sonda)
+            enviadas.extend(teste.provas_enviadas)
+            niveis.append(nivel)
+            print_level(nivel)
+        
+        if enviadas and not args.manter_uploads:
+            await cleanup(client, enviadas)
+    
+    return {"provas_usadas": len(prova_ids), "uploads": len(enviadas), "niveis": niveis}
+
+
+def print_level(nivel: Dict):
+    print(f"\n📈 Concorrência {nivel['concorrencia']}: {nivel['vazao_total_rps']} req/s", file=sys.stderr)
+    for endpoint, resultado in nivel["endpoints"].items():
+        print(f"   {endpoint:<34} {resultado['requisicoes']:>6} req  {resultado['erros']:>4} erros  "
+              f"p50 {resultado['p50_ms']} ms  p95 {resultado['p95_ms']} ms  p99 {resultado['p99_ms']} ms",
+              file=sys.stderr)
+
+
+def compare(atual: Dict, anterior: Dict) -> Dict:
+    """Razão de p95 e de vazão (atual / anterior) por nível e endpoint"""
+    base_por_nivel = {nivel["concorrencia"]: nivel for nivel in anterior.get("niveis", [])}
+    comparacao = {}
+    for nivel in atual["niveis"]:
+        base = base_por_nivel.get(nivel["concorrencia"])
+        if not base:
+            continue
+        razoes = {}
+        for endpoint, resultado in nivel["endpoints"].items():
+            base_endpoint = base["endpoints"].get(endpoint, {})
+            if resultado.get("p95_ms") and base_endpoint.get("p95_ms"):
+                razoes[endpoint] = {
+                    "p95": round(resultado["p95_ms"] / base_endpoint["p95_ms"], 3),
+                    "vazao": round(resultado["vazao_rps"] / base_endpoint["vazao_rps"], 3)
+                    if base_endpoint.get("vazao_rps") else None
+                }
+        comparacao[str(nivel["concorrencia"])] = razoes
+    return {"commit_anterior": anterior.get("commit"), "razoes": comparacao}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--concorrencia", type=int, nargs="+", default=[1, 4, 16, 32])
+    parser.add_argument("--duracao", type=float, default=20.0, help="Segundos medidos por nível")
+    parser.add_argument("--aquecimento", type=float, default=2.0, help="Segundos descartados no início de cada nível")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(MIX_PADRAO))
+    parser.add_argument("--intervalo-sonda", type=float, default=0.1, help="Intervalo (s) da sonda GET /health")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--semear", type=int, default=1, help="Mínimo de provas concluídas antes da carga")
+    parser.add_argument("--timeout-semear", type=float, default=300.0)
+    parser.add_argument("--manter-uploads", action="store_true", help="Não cancela as provas enviadas pela carga")
+    parser.add_argument("--saida", help="Arquivo JSON para gravar o resultado")
+    parser.add_argument("--comparar", help="JSON de uma execução anterior para comparação")
+    add_corpus_arguments(parser)
+    parser.set_defaults(paginas=4)
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = os.path.join(tmp, "prova_carga.pdf")
+        corpus = generate_exam_pdf(pdf_path, **corpus_kwargs(args))
+        with open(pdf_path, "rb") as f:
+            pdf_bytes = f.read()
+    
+    resultado = {
+        "benchmark": "carga_api",
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "url": args.url,
+        "mix": args.mix,
+        "corpus_upload": corpus,
+        **asyncio.run(run(args, pdf_bytes))
+    }
+    
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            resultado["comparacao"] = compare(resultado, json.load(f))
+    
+    saida = json.dumps(resultado, indent=2, ensure_ascii=False)
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            f.write(saida)
+    print(saida)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Micro-benchmark do identificador de questões (PDFExtractor.identify_questoes_numbers)
+
+Compara a implementação atual (varredura única) com a anterior (um finditer por
+padrão + ordenação) em um texto sintético grande e confere que as saídas são
+idênticas, inclusive em textos aleatórios com casos de borda.
+
+Uso (a partir de backend/):
+    python -m benchmarks.bench_questao_boundaries [--questoes 20000] [--repeticoes 5]
+"""
+import argparse
+import json
+import random
+import time
+from typing import List, Tuple
+
+from app.services.pdf_extractor import pdf_extractor
+
+
+def identify_questoes_numbers_legacy(text: str) -> List[Tuple[int, int, str]]:
+    """Implementação anterior: um finditer por padrão, ordenação e deduplicação"""
+    all_matches = []
+    for pattern in pdf_extractor.questao_patterns:
+        for match in pattern.finditer(text):
+            all_matches.append((match.start(), int(match.group(1)), match))
+    all_matches.sort(key=lambda x: x[0])
+    
+    unique_matches = []
+    last_pos = -1
+    for pos, numero, match in all_matches:
+        if pos - last_pos > 10:
+            unique_matches.append((pos, numero, match))
+            last_pos = pos
+    
+    questoes = []
+    for i, (start_pos, numero, match) in enumerate(unique_matches):
+        end_pos = unique_matches[i + 1][0] if i + 1 < len(unique_matches) else len(text)
+        questao_texto = text[start_pos:end_pos].strip()
+        if len(questao_texto) > 20:
+            questoes.append((numero, start_pos, questao_texto))
+    return questoes
+
+
+def synthetic_exam_text(num_questoes: int, seed: int = 42) -> str:
+    """Texto de prova com formatos de numeração variados, alternativas e ruído"""
+    rng = random.Random(seed)
+    formatos = ["{n}. ", "{n}) ", "Questão {n}: ", "QUESTÃO {n}. ", "Q.{n}) ", "Q{n}: ", "{n} - ", "{n} – "]
+    palavras = ("considere o texto a seguir sobre direito constitucional e assinale a "
+                "alternativa correta de acordo com a jurisprudência do tribunal").split()
+    partes = []
+    for n in range(1, num_questoes + 1):
+        partes.append(rng.choice(formatos).format(n=n) + " ".join(rng.choices(palavras, k=rng.randint(20, 60))))
+        if rng.random() < 0.2:
+            # Itens numerados dentro do enunciado e linhas em branco
+            partes.append(f"{rng.randint(1, 5)}. " + " ".join(rng.choices(palavras, k=8)))
+            partes.append("\n" * rng.randint(1, 14))
+        for letra in "ABCDE":
+            partes.append(f"{letra}) " + " ".join(rng.choices(palavras, k=rng.randint(3, 12))))
+    return "\n".join(partes)
+
+
+def random_edge_case_text(rng: random.Random) -> str:
+    """Linhas curtas aleatórias que exercitam sobreposição entre padrões"""
+    linhas = ["", " ", "\t", "1.", "2)", "3 - x", "4 –", "Questão 5:", "questão 6.", "Q.7)", "q8:",
+              "Q 9.", "10. texto", "A) alternativa", "texto solto", "11 -", "12.  ", "  13) y"]
+    return "\n".join(rng.choice(linhas) for _ in range(rng.randint(1, 40)))
+
+
+def best_of(func, text: str, repeticoes: int) -> float:
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        func(text)
+        tempos.append(time.perf_counter() - inicio)
+    return min(tempos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questoes", type=int, default=20000)
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument("--casos-aleatorios", type=int, default=5000)
+    args = parser.parse_args()
+    
+    rng = random.Random(0)
+    for _ in range(args.casos_aleatorios):
+        texto = random_edge_case_text(rng)
+        assert pdf_extractor.identify_questoes_numbers(texto) == identify_questoes_numbers_legacy(texto), repr(texto)
+    
+    texto = synthetic_exam_text(args.questoes)
+    atual = pdf_extractor.identify_questoes_numbers(texto)
+    anterior = identify_questoes_numbers_legacy(texto)
+    assert atual == anterior, "Saída diferente da implementação anterior"
+    
+    tempo_anterior = best_of(identify_questoes_numbers_legacy, texto, args.repeticoes)
+    tempo_atual = best_of(pdf_extractor.identify_questoes_numbers, texto, args.repeticoes)
+    print(json.dumps({
+        "benchmark": "identify_questoes_numbers",
+        "caracteres": len(texto),
+        "questoes_encontradas": len(atual),
+        "casos_aleatorios_identicos": args.casos_aleatorios,
+        "anterior_s": round(tempo_anterior, 4),
+        "atual_s": round(tempo_atual, 4),
+        "speedup": round(tempo_anterior / tempo_atual, 2) if tempo_atual else None
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Benchmark do TextCleaner.clean_text
+
+Compara a implementação atual (padrões pré-compilados, alternância única para as
+correções específicas e uma única regex para os caracteres de controle) com a
+anterior e confere que a saída é idêntica byte a byte em um corpus sintético e
+em textos aleatórios com correções sobrepostas.
+
+Uso (a partir de backend/):
+    python -m benchmarks.bench_text_cleaner [--textos 2000] [--repeticoes 3]
+"""
+import argparse
+import json
+import random
+import re
+import time
+import unicodedata
+
+from app.services.text_cleaner import TextCleaner
+
+
+def clean_text_legacy(text: str) -> str:
+    """Implementação anterior de TextCleaner.clean_text"""
+    if not text:
+        return ""
+    try:
+        text = unicodedata.normalize('NFC', text)
+    except:
+        pass
+    text = text.replace('\x00', '').replace('\r', ' ')
+    text = ''.join(char for char in text if ord(char) >= 32 or char in '\n\t')
+    for wrong, correct in TextCleaner.SPECIFIC_CORRECTIONS.items():
+        text = text.replace(wrong, correct)
+        text = text.replace(wrong.capitalize(), correct.capitalize())
+        text = text.replace(wrong.upper(), correct.upper())
+    text = re.sub(r'\be0\b', 'ao', text, flags=re.IGNORECASE)
+    text = re.sub(r'(\w+)e0(\s)', r'\1ao\2', text, flags=re.IGNORECASE)
+    text = re.sub(r'(\w+)e0(\w)', r'\1ao\2', text, flags=re.IGNORECASE)
+    patterns_to_fix = [
+        (r'(\w{2,})9(\w{2,})', r'\1m\2'),
+        (r'(\w{2,})7(\w{2,})', r'\1ç\2'),
+        (r'(\w{2,})4(\w{2,})', r'\1ã\2'),
+        (r'(\w{2,})3(\w{2,})', r'\1ã\2'),
+        (r'(\w{2,})1(\w{2,})', r'\1á\2'),
+    ]
+    for pattern, replacement in patterns_to_fix:
+        text = re.sub(pattern, replacement, text, flags=re.IGNORECASE)
+    text = re.sub(r'\s+', ' ', text)
+    text = text.strip()
+    text = re.sub(r'\n{3,}', '\n\n', text)
+    return text
+
+
+def _variants():
+    variants = []
+    for wrong in TextCleaner.SPECIFIC_CORRECTIONS:
+        variants.extend([wrong, wrong.capitalize(), wrong.upper()])
+    return variants
+
+
+def synthetic_question(rng: random.Random) -> str:
+    """Questão com texto comum, erros de OCR, controles e quebras de linha"""
+    palavras = ("a jurisprudência do tribunal entende que a competência para julgar "
+                "a ação é da justiça estadual conforme o artigo 109 da constituição").split()
+    variants = _variants()
+    partes = [f"{rng.randint(1, 150)}. "]
+    for _ in range(rng.randint(40, 160)):
+        sorteio = rng.random()
+        if sorteio < 0.03:
+            partes.append(rng.choice(variants))
+        elif sorteio < 0.05:
+            partes.append(rng.choice(["e0", "casae0", "\r\n", "\x00", "\x0c", "\n\n\n", "\t"]))
+        else:
+            partes.append(rng.choice(palavras))
+    for letra in "ABCDE":
+        partes.append(f"\n{letra}) " + " ".join(rng.choices(palavras, k=rng.randint(3, 10))))
+    return " ".join(partes)
+
+
+def overlapping_corrections(rng: random.Random) -> str:
+    """Correções coladas umas nas outras (ex.: "tambe9mate5ria", "JUSTIE7ANTF4NIO")"""
+    variants = _variants()
+    pedacos = ["", " ", "a", "M", "m", "A", "ate5ria", "ATE5RIA", "ntf4nio", "NTF4NIO", "9", "e0"]
+    return "".join(rng.choice(variants if rng.random() < 0.6 else pedacos) for _ in range(rng.randint(1, 12)))
+
+
+def best_of(func, textos, repeticoes: int) -> float:
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        for texto in textos:
+            func(texto)
+        tempos.append(time.perf_counter() - inicio)
+    return min(tempos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--textos", type=int, default=2000)
+    parser.add_argument("--repeticoes", type=int, default=3)
+    parser.add_argument("--casos-sobrepostos", type=int, default=20000)
+    args = parser.parse_args()
+    
+    rng = random.Random(0)
+    for _ in range(args.casos_sobrepostos):
+        texto = overlapping_corrections(rng)
+        assert TextCleaner.clean_text(texto).encode("utf-8") == clean_text_legacy(texto).encode("utf-8"), repr(texto)
+    
+    textos = [synthetic_question(rng) for _ in range(args.textos)]
+    for texto in textos:
+        assert TextCleaner.clean_text(texto).encode("utf-8") == clean_text_legacy(texto).encode("utf-8"), repr(texto)
+    
+    tempo_anterior = best_of(clean_text_legacy, textos, args.repeticoes)
+    tempo_atual = best_of(TextCleaner.clean_text, textos, args.repeticoes)
+    print(json.dumps({
+        "benchmark": "text_cleaner.clean_text",
+        "textos": len(textos),
+        "caracteres": sum(len(t) for t in textos),
+        "casos_sobrepostos_identicos": args.casos_sobrepostos,
+        "anterior_s": round(tempo_anterior, 4),
+        "atual_s": round(tempo_atual, 4),
+        "speedup": round(tempo_anterior / tempo_atual, 2) if tempo_atual else None
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
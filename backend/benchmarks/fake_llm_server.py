@@ -0,0 +1,360 @@
+"""
+Servidor falso de IA (OpenAI chat completions e Gemini generateContent) para testes de carga
+
+Permite rodar o pipeline completo (process_pdf_task) sem custo e sem depender
+dos provedores. Modos:
+
+    sintetico  respostas geradas a partir do próprio prompt, no formato que o
+               AIAnalyzer espera (questões, validação e mapeamento de imagens)
+    gravar     repassa ao provedor real e grava cada resposta no arquivo de cassete
+    reproduzir responde a partir do cassete (mesma requisição -> mesma resposta);
+               requisições não gravadas recebem 404, ou a resposta sintética
+               com --sintetico-se-ausente
+
+Latência e falhas (500 e 429 com Retry-After) são injetadas nos modos
+sintetico e reproduzir, com sorteio reprodutível (--seed).
+
+Uso (a partir de backend/):
+    python -m benchmarks.fake_llm_server [--porta 8765] [--modo sintetico]
+        [--latencia lognormal:800:0.5] [--taxa-erro 0.02] [--taxa-429 0.05]
+        [--cassete benchmarks/cassetes/llm.jsonl]
+
+E, no backend/worker:
+    OPENAI_BASE_URL=http://localhost:8765/v1
+    GEMINI_API_ENDPOINT=http://localhost:8765
+"""
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+
+import httpx
+
+OPENAI_UPSTREAM = "https://api.openai.com"
+GEMINI_UPSTREAM = "https://generativelanguage.googleapis.com"
+
+QUESTAO_PATTERN = re.compile(r'(?m)^[ \t]*(?:quest[ãa]o[ \t]*)?(\d{1,3})[ \t]*[.):\-–][ \t]+', re.IGNORECASE)
+IMAGEM_PATTERN = re.compile(r'Imagem (\d+): página (\d+)')
+QUESTAO_PAGINA_PATTERN = re.compile(r'Questão (\d+): página (\d+)')
+# Trecho da prova nos prompts de extração (as instruções também são numeradas)
+TEXTO_PROVA_PATTERN = re.compile(r'TEXTO DA PROVA[^\n]*:\n(.*?)\n\s*INSTRUÇÕES', re.DOTALL)
+
+
+class LatencyModel:
+    """Distribuição da latência injetada: fixa:MS, uniforme:MIN:MAX ou lognormal:MEDIANA:SIGMA"""
+    
+    def __init__(self, spec: str, rng: random.Random):
+        self.rng = rng
+        partes = spec.split(":")
+        self.kind = partes[0]
+        self.params = [float(p) for p in partes[1:]]
+        if self.kind not in ("fixa", "uniforme", "lognormal"):
+            raise ValueError(f"Distribuição de latência desconhecida: {spec}")
+    
+    def sample(self) -> float:
+        """Latência em segundos"""
+        if self.kind == "fixa":
+            ms = self.params[0] if self.params else 0.0
+        elif self.kind == "uniforme":
+            ms = self.rng.uniform(self.params[0], self.params[1])
+        else:
+            ms = self.rng.lognormvariate(math.log(self.params[0]), self.params[1] if len(self.params) > 1 else 0.5)
+        return ms / 1000
+
+
+class Cassette:
+    """Respostas gravadas (JSON Lines), indexadas pelo hash da requisição"""
+    
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self.entries: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        if path:
+            try:
+                with open(path, encoding="utf-8") as f:
+                    for line in f:
+                        if line.strip():
+                            entry = json.loads(line)
+                            self.entries.setdefault(entry["chave"], entry)
+            except FileNotFoundError:
+                pass
+    
+    @staticmethod
+    def key(route: str, body: Dict) -> str:
+        return hashlib.sha256(f"{route}\n{json.dumps(body, sort_keys=True, ensure_ascii=False)}".encode("utf-8")).hexdigest()
+    
+    def get(self, key: str) -> Optional[Dict]:
+        return self.entries.get(key)
+    
+    def put(self, key: str, route: str, status: int, body: Dict):
+        with self._lock:
+            if key in self.entries:
+                return
+            entry = {"chave": key, "rota": route, "status": status, "corpo": body}
+            self.entries[key] = entry
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def synthetic_content(prompt: str, json_expected: bool) -> str:
+    """Resposta plausível para cada tipo de prompt do AIAnalyzer"""
+    if "IMAGENS ENCONTRADAS:" in prompt:
+        paginas_questoes: Dict[int, int] = {}
+        for numero, pagina in QUESTAO_PAGINA_PATTERN.findall(prompt):
+            paginas_questoes.setdefault(int(pagina), int(numero))
+        associacoes = [
+            {"imagem_index": int(indice) - 1, "questao_numero": paginas_questoes.get(int(pagina))}
+            for indice, pagina in IMAGEM_PATTERN.findall(prompt)
+        ]
+        return json.dumps({"associacoes": associacoes}, ensure_ascii=False)
+    
+    if "QUESTÕES EXTRAÍDAS (" in prompt:
+        # Validação: devolver as questões recebidas (uma por linha, em JSON)
+        questoes = []
+        for line in prompt.split("QUESTÕES EXTRAÍDAS (", 1)[1].splitlines()[1:]:
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            questoes.append({"numero": item.get("numero"), "texto": item.get("texto"),
+                             "posicao_inicio": None, "posicao_fim": None})
+        return json.dumps({"questoes": questoes}, ensure_ascii=False)
+    
+    if json_expected or '"questoes"' in prompt:
+        trecho = TEXTO_PROVA_PATTERN.search(prompt)
+        texto_prova = trecho.group(1) if trecho else prompt
+        matches = list(QUESTAO_PATTERN.finditer(texto_prova))
+        questoes = []
+        for i, match in enumerate(matches):
+            fim = matches[i + 1].start() if i + 1 < len(matches) else len(texto_prova)
+            texto = texto_prova[match.start():fim].strip()
+            if len(texto) > 20:
+                questoes.append({"numero": int(match.group(1)), "texto": texto,
+                                 "posicao_inicio": None, "posicao_fim": None})
+        return json.dumps({"questoes": questoes}, ensure_ascii=False)
+    
+    return "ok"
+
+
+def openai_completion(model: str, content: str, prompt_tokens: int) -> Dict:
+    completion_tokens = estimate_tokens(content)
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex[:24]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content, "refusal": None},
+            "finish_reason": "stop"
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": 0}
+        }
+    }
+
+
+def gemini_response(content: str, prompt_tokens: int) -> Dict:
+    completion_tokens = estimate_tokens(content)
+    return {
+        "candidates": [{
+            "content": {"parts": [{"text": content}], "role": "model"},
+            "finishReason": "STOP",
+            "index": 0
+        }],
+        "usageMetadata": {
+            "promptTokenCount": prompt_tokens,
+            "candidatesTokenCount": completion_tokens,
+            "totalTokenCount": prompt_tokens + completion_tokens
+        }
+    }
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    server_version = "FakeLLM/1.0"
+    
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+    
+    def do_GET(self):
+        # Listagem de modelos (OpenAI /v1/models e Gemini /v1beta/models)
+        route = self.path.split("?", 1)[0]
+        if route.endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [], "models": []})
+        else:
+            self._send_json(404, {"error": {"message": f"Rota desconhecida: {route}"}})
+    
+    def do_POST(self):
+        route = self.path.split("?", 1)[0]
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            self._send_json(400, {"error": {"message": "JSON inválido"}})
+            return
+        
+        if route.endswith("/chat/completions"):
+            provider = "openai"
+        elif route.endswith(":generateContent"):
+            provider = "gemini"
+        else:
+            self._send_json(404, {"error": {"message": f"Rota desconhecida: {route}"}})
+            return
+        
+        key = Cassette.key(route, body)
+        if self.server.mode == "gravar":
+            status, response = self._forward(provider, body)
+            if status == 200:
+                self.server.cassette.put(key, route, status, response)
+            self._send_json(status, response)
+            return
+        
+        failure = self._inject_faults(provider)
+        if failure:
+            status, response, headers = failure
+            self._send_json(status, response, headers)
+            return
+        
+        if self.server.mode == "reproduzir":
+            entry = self.server.cassette.get(key)
+            if entry:
+                self._send_json(entry["status"], entry["corpo"])
+                return
+            if not self.server.synthetic_fallback:
+                self._send_json(404, {"error": {"message": "Requisição não gravada no cassete", "code": 404}})
+                return
+        
+        self._send_json(200, self._synthetic(provider, route, body))
+    
+    def _inject_faults(self, provider: str) -> Optional[Tuple[int, Dict, Dict]]:
+        with self.server.rng_lock:
+            delay = self.server.latency.sample()
+            sorteio = self.server.rng.random()
+        time.sleep(delay)
+        if sorteio < self.server.rate_429:
+            message = "Rate limit reached (falha injetada)"
+            if provider == "gemini":
+                body = {"error": {"code": 429, "message": message, "status": "RESOURCE_EXHAUSTED"}}
+            else:
+                body = {"error": {"message": message, "type": "requests", "code": "rate_limit_exceeded"}}
+            return 429, body, {"Retry-After": str(self.server.retry_after)}
+        if sorteio < self.server.rate_429 + self.server.error_rate:
+            message = "Internal error (falha injetada)"
+            if provider == "gemini":
+                body = {"error": {"code": 500, "message": message, "status": "INTERNAL"}}
+            else:
+                body = {"error": {"message": message, "type": "server_error", "code": None}}
+            return 500, body, {}
+        return None
+    
+    def _synthetic(self, provider: str, route: str, body: Dict) -> Dict:
+        if provider == "openai":
+            prompt = "\n\n".join(str(m.get("content", "")) for m in body.get("messages", []))
+            content = synthetic_content(prompt, bool(body.get("response_format")))
+            return openai_completion(body.get("model", "gpt-4o"), content, estimate_tokens(prompt))
+        
+        prompt = "\n\n".join(
+            part.get("text", "")
+            for content in body.get("contents", [])
+            for part in content.get("parts", [])
+        )
+        return gemini_response(synthetic_content(prompt, False), estimate_tokens(prompt))
+    
+    def _forward(self, provider: str, body: Dict) -> Tuple[int, Dict]:
+        """Repassa a requisição ao provedor real (modo gravar), com as credenciais recebidas"""
+        headers = {"Content-Type": "application/json"}
+        for header in ("Authorization", "x-goog-api-key", "OpenAI-Organization"):
+            if self.headers.get(header):
+                headers[header] = self.headers[header]
+        upstream = self.server.openai_upstream if provider == "openai" else self.server.gemini_upstream
+        try:
+            response = self.server.http.post(upstream + self.path, json=body, headers=headers)
+            return response.status_code, response.json()
+        except (httpx.HTTPError, ValueError) as e:
+            return 502, {"error": {"message": f"Falha ao repassar ao provedor: {e}"}}
+    
+    def _send_json(self, status: int, body: Dict, headers: Optional[Dict] = None):
+        payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def create_server(porta: int = 8765, host: str = "127.0.0.1", modo: str = "sintetico", latencia: str = "fixa:0",
+                  taxa_erro: float = 0.0, taxa_429: float = 0.0, retry_after: float = 1.0,
+                  cassete: Optional[str] = None, sintetico_se_ausente: bool = False,
+                  seed: int = 42, verbose: bool = False,
+                  openai_upstream: str = OPENAI_UPSTREAM,
+                  gemini_upstream: str = GEMINI_UPSTREAM) -> ThreadingHTTPServer:
+    """Cria o servidor (use serve_forever; em benchmarks, numa thread)"""
+    if modo in ("gravar", "reproduzir") and not cassete:
+        raise ValueError(f"O modo {modo} exige --cassete")
+    server = ThreadingHTTPServer((host, porta), FakeLLMHandler)
+    server.daemon_threads = True
+    server.mode = modo
+    server.rng = random.Random(seed)
+    server.rng_lock = threading.Lock()
+    server.latency = LatencyModel(latencia, server.rng)
+    server.error_rate = taxa_erro
+    server.rate_429 = taxa_429
+    server.retry_after = retry_after
+    server.cassette = Cassette(cassete)
+    server.synthetic_fallback = sintetico_se_ausente
+    server.verbose = verbose
+    server.openai_upstream = openai_upstream
+    server.gemini_upstream = gemini_upstream
+    server.http = httpx.Client(timeout=120.0) if modo == "gravar" else None
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--porta", type=int, default=8765)
+    parser.add_argument("--host", default="127.0.0.1", help="Use 0.0.0.0 para aceitar conexões de containers")
+    parser.add_argument("--modo", choices=["sintetico", "gravar", "reproduzir"], default="sintetico")
+    parser.add_argument("--latencia", default="fixa:0", help="fixa:MS, uniforme:MIN:MAX ou lognormal:MEDIANA:SIGMA")
+    parser.add_argument("--taxa-erro", type=float, default=0.0, help="Fração de respostas 500")
+    parser.add_argument("--taxa-429", type=float, default=0.0, help="Fração de respostas 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After (s) das respostas 429")
+    parser.add_argument("--cassete", help="Arquivo JSON Lines de respostas gravadas")
+    parser.add_argument("--sintetico-se-ausente", action="store_true")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+    
+    server = create_server(
+        porta=args.porta, host=args.host, modo=args.modo, latencia=args.latencia, taxa_erro=args.taxa_erro,
+        taxa_429=args.taxa_429, retry_after=args.retry_after, cassete=args.cassete,
+        sintetico_se_ausente=args.sintetico_se_ausente, seed=args.seed, verbose=args.verbose
+    )
+    print(f"🤖 IA falsa ({args.modo}) em http://{args.host}:{args.porta} "
+          f"(OpenAI: /v1/chat/completions, Gemini: /v1beta/models/<modelo>:generateContent)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
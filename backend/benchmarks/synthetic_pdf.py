@@ -0,0 +1,200 @@
+"""
+Gerador de provas sintéticas em PDF (reportlab) para os benchmarks
+
+As provas têm questões numeradas com alternativas, imagens embutidas (parte
+delas repetida, para exercitar a deduplicação), layout em uma ou duas colunas
+e, opcionalmente, páginas "escaneadas" (rasterizadas, sem camada de texto),
+que só têm conteúdo via OCR.
+
+Uso (a partir de backend/):
+    python -m benchmarks.synthetic_pdf saida.pdf [--paginas 20] [--duas-colunas] ...
+"""
+import argparse
+import io
+import json
+import random
+from typing import Dict, List
+
+import fitz
+from PIL import Image, ImageDraw
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.utils import ImageReader, simpleSplit
+from reportlab.pdfgen import canvas
+
+PALAVRAS = ("considere o texto a seguir sobre direito constitucional e assinale a alternativa "
+            "correta de acordo com a jurisprudência do tribunal superior quanto à competência "
+            "para julgar a ação proposta contra a união nos termos da constituição federal").split()
+
+MARGEM = 50
+FONTE = "Helvetica"
+TAMANHO_FONTE = 10
+ENTRELINHA = 12
+ESPACO_COLUNAS = 20
+
+
+def synthetic_image(rng: random.Random, px: int) -> bytes:
+    """Figura PNG com formas aleatórias (px x px)"""
+    image = Image.new("RGB", (px, px), "white")
+    draw = ImageDraw.Draw(image)
+    for _ in range(rng.randint(6, 16)):
+        x0, y0 = rng.randrange(px), rng.randrange(px)
+        x1, y1 = min(px - 1, x0 + rng.randint(10, px // 2)), min(px - 1, y0 + rng.randint(10, px // 2))
+        cor = tuple(rng.randrange(256) for _ in range(3))
+        if rng.random() < 0.5:
+            draw.rectangle((x0, y0, x1, y1), outline=cor, width=3)
+        else:
+            draw.ellipse((x0, y0, x1, y1), fill=cor)
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def synthetic_questao(rng: random.Random, numero: int) -> List[str]:
+    """Parágrafos de uma questão: enunciado e alternativas A-E"""
+    enunciado = f"{numero}. " + " ".join(rng.choices(PALAVRAS, k=rng.randint(25, 60))).capitalize() + "."
+    alternativas = [f"{letra}) " + " ".join(rng.choices(PALAVRAS, k=rng.randint(4, 10)))
+                    for letra in "ABCDE"]
+    return [enunciado] + alternativas
+
+
+def generate_exam_pdf(path: str, paginas: int = 10, questoes_por_pagina: int = 4, imagens: int = 8,
+                      imagem_px: int = 400, imagens_duplicadas: float = 0.25,
+                      paginas_escaneadas: float = 0.0, duas_colunas: bool = False,
+                      dpi_escaneadas: int = 150, seed: int = 42) -> Dict:
+    """
+    Gera a prova sintética em path
+    
+    Args:
+        paginas: Número de páginas
+        questoes_por_pagina: Questões em cada página
+        imagens: Total de imagens embutidas (distribuídas entre as questões)
+        imagem_px: Resolução (lado, em pixels) de cada imagem
+        imagens_duplicadas: Fração das imagens que repete uma imagem anterior
+        paginas_escaneadas: Fração das páginas rasterizadas (sem camada de texto)
+        duas_colunas: Layout em duas colunas
+    
+    Returns:
+        Metadados do corpus (parâmetros, questões, imagens e páginas escaneadas)
+    """
+    rng = random.Random(seed)
+    largura, altura = A4
+    colunas = 2 if duas_colunas else 1
+    largura_coluna = (largura - 2 * MARGEM - (colunas - 1) * ESPACO_COLUNAS) / colunas
+    total_questoes = paginas * questoes_por_pagina
+    
+    # Imagem de cada questão (índice da questão -> bytes)
+    figuras = []
+    for _ in range(imagens):
+        if figuras and rng.random() < imagens_duplicadas:
+            figuras.append(rng.choice(figuras))
+        else:
+            figuras.append(synthetic_image(rng, imagem_px))
+    imagens_por_questao = {}
+    for i, figura in enumerate(figuras):
+        imagens_por_questao.setdefault(i * total_questoes // max(1, imagens), []).append(figura)
+    
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    numero = 0
+    por_coluna = -(-questoes_por_pagina // colunas)
+    altura_slot = (altura - 2 * MARGEM) / por_coluna
+    for _ in range(paginas):
+        for posicao in range(questoes_por_pagina):
+            coluna, linha = divmod(posicao, por_coluna)
+            x = MARGEM + coluna * (largura_coluna + ESPACO_COLUNAS)
+            topo = altura - MARGEM - linha * altura_slot
+            y = topo - ENTRELINHA
+            limite = topo - altura_slot
+            figuras_questao = imagens_por_questao.get(numero, [])
+            if figuras_questao:
+                # Reservar o fim do slot para as imagens, lado a lado
+                lado = min(altura_slot * 0.4, largura_coluna / len(figuras_questao))
+                limite += lado
+            
+            numero += 1
+            pdf.setFont(FONTE, TAMANHO_FONTE)
+            for paragrafo in synthetic_questao(rng, numero):
+                for texto in simpleSplit(paragrafo, FONTE, TAMANHO_FONTE, largura_coluna):
+                    if y < limite:
+                        break
+                    pdf.drawString(x, y, texto)
+                    y -= ENTRELINHA
+            
+            for i, figura in enumerate(figuras_questao):
+                pdf.drawImage(ImageReader(io.BytesIO(figura)), x + i * lado,
+                              topo - altura_slot + 2, width=lado - 4, height=lado - 4)
+        pdf.showPage()
+    pdf.save()
+    
+    escaneadas = sorted(rng.sample(range(paginas), round(paginas * paginas_escaneadas)))
+    conteudo = _rasterize_pages(buffer.getvalue(), escaneadas, dpi_escaneadas) if escaneadas else buffer.getvalue()
+    with open(path, "wb") as f:
+        f.write(conteudo)
+    
+    return {
+        "paginas": paginas,
+        "questoes_por_pagina": questoes_por_pagina,
+        "questoes": total_questoes,
+        "imagens": imagens,
+        "imagens_distintas": len(set(figuras)),
+        "imagem_px": imagem_px,
+        "paginas_escaneadas": [p + 1 for p in escaneadas],
+        "duas_colunas": duas_colunas,
+        "seed": seed,
+        "tamanho_bytes": len(conteudo)
+    }
+
+
+def _rasterize_pages(pdf_bytes: bytes, pages: List[int], dpi: int) -> bytes:
+    """Substitui as páginas indicadas por uma imagem da própria página (simula digitalização)"""
+    source = fitz.open(stream=pdf_bytes, filetype="pdf")
+    output = fitz.open()
+    try:
+        for page_num in range(len(source)):
+            if page_num in pages:
+                pixmap = source[page_num].get_pixmap(dpi=dpi)
+                page = output.new_page(width=source[page_num].rect.width, height=source[page_num].rect.height)
+                page.insert_image(page.rect, stream=pixmap.pil_tobytes(format="JPEG", quality=80))
+            else:
+                output.insert_pdf(source, from_page=page_num, to_page=page_num)
+        return output.tobytes()
+    finally:
+        output.close()
+        source.close()
+
+
+def add_corpus_arguments(parser: argparse.ArgumentParser):
+    """Parâmetros do corpus sintético (compartilhados pelos benchmarks)"""
+    parser.add_argument("--paginas", type=int, default=10)
+    parser.add_argument("--questoes-por-pagina", type=int, default=4)
+    parser.add_argument("--imagens", type=int, default=8)
+    parser.add_argument("--imagem-px", type=int, default=400)
+    parser.add_argument("--imagens-duplicadas", type=float, default=0.25)
+    parser.add_argument("--paginas-escaneadas", type=float, default=0.0)
+    parser.add_argument("--duas-colunas", action="store_true")
+    parser.add_argument("--seed", type=int, default=42)
+
+
+def corpus_kwargs(args: argparse.Namespace) -> Dict:
+    return {
+        "paginas": args.paginas,
+        "questoes_por_pagina": args.questoes_por_pagina,
+        "imagens": args.imagens,
+        "imagem_px": args.imagem_px,
+        "imagens_duplicadas": args.imagens_duplicadas,
+        "paginas_escaneadas": args.paginas_escaneadas,
+        "duas_colunas": args.duas_colunas,
+        "seed": args.seed
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("saida")
+    add_corpus_arguments(parser)
+    args = parser.parse_args()
+    print(json.dumps(generate_exam_pdf(args.saida, **corpus_kwargs(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
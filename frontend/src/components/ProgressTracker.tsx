@@ -198,10 +198,24 @@ const ProgressTracker = ({ provas }: ProgressTrackerProps) => {
                       {provaDetalhes[prova.id].imagens.map((imagem: any) => (
                         <div key={imagem.id} className="imagem-item">
                           <img
-                            src={imagem.caminho_arquivo}
+                            src={imagem.miniaturas?.['240'] || imagem.caminho_arquivo}
+                            srcSet={
+                              imagem.miniaturas?.['240'] && imagem.miniaturas?.['480']
+                                ? `${imagem.miniaturas['240']} 1x, ${imagem.miniaturas['480']} 2x`
+                                : undefined
+                            }
+                            loading="lazy"
                             alt={`Imagem página ${imagem.posicao_pagina}`}
                             onError={(e) => {
-                              ;(e.target as HTMLImageElement).style.display = 'none'
+                              const img = e.target as HTMLImageElement
+                              // Miniatura indisponível: tentar a imagem original antes de esconder
+                              if (img.dataset.original !== 'true') {
+                                img.dataset.original = 'true'
+                                img.removeAttribute('srcset')
+                                img.src = imagem.caminho_arquivo
+                                return
+                              }
+                              img.style.display = 'none'
                             }}
                           />
                           <p>Página {imagem.posicao_pagina}</p>
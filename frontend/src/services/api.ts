@@ -33,6 +33,7 @@ export interface Imagem {
   questao_id: number | null
   caminho_arquivo: string
   posicao_pagina: number
+  miniaturas?: Record<string, string>
 }
 
 export interface ProvaCompleta {
@@ -6,6 +6,7 @@ CREATE TABLE IF NOT EXISTS provas (
     nome VARCHAR(255) NOT NULL,
     arquivo_original VARCHAR(255) NOT NULL,
     status VARCHAR(50) NOT NULL DEFAULT 'processando',
+    memoria JSONB,
     criado_em TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
     atualizado_em TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
@@ -30,6 +31,30 @@ CREATE TABLE IF NOT EXISTS imagens (
     posicao_pagina INTEGER NOT NULL,
     hash_imagem VARCHAR(64),
     perceptual_hash VARCHAR(64),
+    perceptual_hash_bits BIGINT,
+    phash_banda_0 INTEGER,
+    phash_banda_1 INTEGER,
+    phash_banda_2 INTEGER,
+    phash_banda_3 INTEGER,
+    criado_em TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- Tabela de chamadas à IA (tokens, latência e custo estimado por prova e etapa)
+CREATE TABLE IF NOT EXISTS llm_chamadas (
+    id BIGSERIAL PRIMARY KEY,
+    prova_id BIGINT REFERENCES provas(id) ON DELETE CASCADE,
+    etapa VARCHAR(50),
+    provedor VARCHAR(20),
+    modelo VARCHAR(100),
+    tokens_prompt INTEGER,
+    tokens_resposta INTEGER,
+    tokens_cache INTEGER,
+    latencia_ms INTEGER NOT NULL DEFAULT 0,
+    tentativas INTEGER NOT NULL DEFAULT 1,
+    failover BOOLEAN NOT NULL DEFAULT FALSE,
+    sucesso BOOLEAN NOT NULL DEFAULT TRUE,
+    erro TEXT,
+    custo_usd DOUBLE PRECISION,
     criado_em TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
@@ -39,7 +64,12 @@ CREATE INDEX IF NOT EXISTS idx_questoes_numero ON questoes(prova_id, numero);
 CREATE INDEX IF NOT EXISTS idx_imagens_prova_id ON imagens(prova_id);
 CREATE INDEX IF NOT EXISTS idx_imagens_questao_id ON imagens(questao_id);
 CREATE INDEX IF NOT EXISTS idx_imagens_hash ON imagens(hash_imagem);
+CREATE INDEX IF NOT EXISTS ix_imagens_phash_banda_0 ON imagens(phash_banda_0);
+CREATE INDEX IF NOT EXISTS ix_imagens_phash_banda_1 ON imagens(phash_banda_1);
+CREATE INDEX IF NOT EXISTS ix_imagens_phash_banda_2 ON imagens(phash_banda_2);
+CREATE INDEX IF NOT EXISTS ix_imagens_phash_banda_3 ON imagens(phash_banda_3);
 CREATE INDEX IF NOT EXISTS idx_provas_status ON provas(status);
+CREATE INDEX IF NOT EXISTS idx_llm_chamadas_prova_id ON llm_chamadas(prova_id);
 
 -- Trigger para atualizar updated_at
 CREATE OR REPLACE FUNCTION update_updated_at_column()